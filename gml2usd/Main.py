@@ -1,11 +1,17 @@
 import xml.etree.ElementTree as ET
-import pandas as pd
 import pyproj
+import numpy as np
 import os
 import copy
 import itertools
+import shutil
+import threading
 from pathlib import Path
-from gml_transport_v2 import extract_buildings_from_gml  # 引入函數
+from gml_transport_v2 import CityGMLWriter, get_namespaces, report_missing_buildings, write_building_members, write_buildings_from_gml  # 引入函數
+from gml_tile_index import find_tile_paths
+from gml_building_index import get_building_index
+from gml_mesh_store import get_mesh_store
+from gml_coords import element_coords
 
 def read_excluded_ids_from_file(filepath="excluded_buildings.txt"):
     """從配置文件中讀取要排除的建物ID"""
@@ -26,15 +32,21 @@ def read_excluded_ids_from_file(filepath="excluded_buildings.txt"):
     
     return excluded_ids
 
+# pyproj 的 Transformer 建立成本高且不是 thread-safe，因此每個執行緒快取一個
+_transformers = threading.local()
+
 def wgs84_to_epsg3826(lat, lon):
     """將 WGS84 經緯度轉為 EPSG:3826 坐標"""
-    src_crs = pyproj.CRS("EPSG:4326")
-    tgt_crs = pyproj.CRS("EPSG:3826")
-    transformer = pyproj.Transformer.from_crs(src_crs, tgt_crs, always_xy=True)
+    transformer = getattr(_transformers, 'wgs84_to_epsg3826', None)
+    if transformer is None:
+        src_crs = pyproj.CRS("EPSG:4326")
+        tgt_crs = pyproj.CRS("EPSG:3826")
+        transformer = pyproj.Transformer.from_crs(src_crs, tgt_crs, always_xy=True)
+        _transformers.wgs84_to_epsg3826 = transformer
     return transformer.transform(lon, lat)
 
 def find_matching_gmls(csv_path, lat, lon, margin_m):
-    """找到符合範圍的 GML 文件"""
+    """找到符合範圍的 GML 文件（使用預先建立的 R-tree 索引，見 gml_tile_index.py）"""
     x_center, y_center = wgs84_to_epsg3826(lat, lon)
     
     # 定義查詢範圍
@@ -43,100 +55,53 @@ def find_matching_gmls(csv_path, lat, lon, margin_m):
     y_min = y_center - margin_m
     y_max = y_center + margin_m
     
-    # 載入 CSV
-    df = pd.read_csv(csv_path)
-    
-    # 解析座標
-    df[['lower_x', 'lower_y']] = df['LowerCorner'].str.extract('(\d+\.\d+)\s+(\d+\.\d+)').astype(float)
-    df[['upper_x', 'upper_y']] = df['UpperCorner'].str.extract('(\d+\.\d+)\s+(\d+\.\d+)').astype(float)
-    
-    # 篩選符合範圍的文件
-    matched = df[
-        (df['upper_x'] >= x_min) &
-        (df['lower_x'] <= x_max) &
-        (df['upper_y'] >= y_min) &
-        (df['lower_y'] <= y_max)
-    ]
-    
-    # 構建可能的文件目錄
-    # 有些資料集是把 .gml 直接放在資料夾底下（沒有 /gml 子資料夾），因此同時支援兩種結構：
-    # - ./gml_original_file/<AREA>/gml/<file>.gml
-    # - ./gml_original_file/<AREA>/<file>.gml
-    base_dirs = [
-        r"./gml_original_file/111_E_BUILD",
-        r"./gml_original_file/111_F_BUILD",
-        r"./gml_original_file/112_O_OK",
-    ]
-    gml_dirs = []
-    for base in base_dirs:
-        gml_dirs.append(os.path.join(base, "gml"))
-        gml_dirs.append(base)
-    
-    matched_files = []
-    for filename in matched['Filename']:
-        # 在所有目錄中查找文件
-        for gml_dir in gml_dirs:
-            file_path = os.path.join(gml_dir, filename)
-            if os.path.exists(file_path):
-                matched_files.append(file_path)
-                break
-        else:
-            # 若上述固定路徑都找不到，嘗試在 base_dirs 做一次遞迴搜尋（避免資料夾結構差異）
-            found_path = None
-            for base in base_dirs:
-                if not os.path.isdir(base):
-                    continue
-                for root, _, files in os.walk(base):
-                    if filename in files:
-                        found_path = os.path.join(root, filename)
-                        break
-                if found_path:
-                    break
-            if found_path:
-                matched_files.append(found_path)
-            else:
-                print(f"警告: 找不到原始 GML 檔案 {filename} (已查詢: {gml_dirs})")
-    
-    return matched_files
+    # 索引每個 worker 只載入一次；回傳已解析的絕對路徑
+    return find_tile_paths(x_min, y_min, x_max, y_max, csv_path=csv_path)
 
 def get_building_bounds(building, namespaces):
     """獲取建築物的邊界座標"""
     try:
-        # 查找所有 posList 元素
-        pos_lists = building.findall('.//gml:posList', namespaces)
-        if not pos_lists:
-            pos_lists = building.findall('.//*[local-name()="posList"]')
-        
-        if not pos_lists:
-            return None
-        
-        # 收集所有座標
-        all_coords = []
-        for pos_list in pos_lists:
-            if pos_list.text:
-                coords = pos_list.text.strip().split()
-                # 確保座標數量是 3 的倍數
-                if len(coords) % 3 == 0:
-                    # 只取 x, y 座標（忽略 z）
-                    coords = [(float(coords[i]), float(coords[i+1])) 
-                             for i in range(0, len(coords), 3)]
-                    all_coords.extend(coords)
-        
-        if not all_coords:
-            return None
-        
-        # 計算邊界
-        x_coords, y_coords = zip(*all_coords)
-        return {
-            'min_x': min(x_coords),
-            'max_x': max(x_coords),
-            'min_y': min(y_coords),
-            'max_y': max(y_coords)
-        }
+        # 所有 posList 一次解析成 (N, 3) 陣列（見 gml_coords.py），只取 x, y
+        coords = element_coords(building, namespaces)
+        return coords_to_bounds(coords)
     except Exception as e:
         print(f"計算建築物邊界時出錯: {e}")
         return None
 
+def coords_to_bounds(coords):
+    """(N, 3) 座標陣列 -> 2D 邊界；沒有座標時回傳 None"""
+    if not len(coords):
+        return None
+    min_x, min_y, _ = coords.min(axis=0).tolist()
+    max_x, max_y, _ = coords.max(axis=0).tolist()
+    return {
+        'min_x': min_x,
+        'max_x': max_x,
+        'min_y': min_y,
+        'max_y': max_y
+    }
+
+def get_building_id(building):
+    """獲取建築物 ID（gml:id 去掉 bldg_ 前綴，否則使用 BUILD_ID 或 name）"""
+    building_id = None
+    for id_attr in ['{http://www.opengis.net/gml}id', 'gml:id', 'id']:
+        if id_attr in building.attrib:
+            building_id = building.attrib[id_attr]
+            if building_id.startswith('bldg_'):
+                building_id = building_id[5:]
+            break
+
+    if not building_id:
+        for elem in building.findall('.//*'):
+            if elem.tag.endswith('BUILD_ID') and elem.text:
+                building_id = elem.text
+                break
+            elif elem.tag.endswith('name') and elem.text:
+                building_id = elem.text
+                break
+
+    return building_id
+
 def is_building_in_range(building_bounds, x_min, x_max, y_min, y_max):
     """檢查建築物是否在指定範圍內"""
     if not building_bounds:
@@ -148,64 +113,18 @@ def is_building_in_range(building_bounds, x_min, x_max, y_min, y_max):
                building_bounds['max_y'] < y_min or
                building_bounds['min_y'] > y_max)
 
-def merge_gml_files(main_file, new_file, output_file):
-    """合併兩個 GML 文件"""
-    # 讀取主文件
-    tree1 = ET.parse(main_file)
-    root1 = tree1.getroot()
-    
-    # 讀取新文件
-    tree2 = ET.parse(new_file)
-    root2 = tree2.getroot()
-    
-    # 將新文件中的 cityObjectMember 元素添加到主文件中
-    for member in root2.findall('.//{http://www.opengis.net/citygml/2.0}cityObjectMember'):
-        root1.append(member)
-    
-    # 更新 boundedBy
-    update_bounded_by(root1)
-    
-    # 保存合併後的文件
-    tree1.write(output_file, encoding='utf-8', xml_declaration=True)
-
-def update_bounded_by(root):
-    """更新 GML 文件的邊界框"""
-    namespaces = {'gml': 'http://www.opengis.net/gml'}
-    
-    # 收集所有座標
-    all_coords = []
-    for pos_list in root.findall('.//gml:posList', namespaces):
-        if pos_list.text:
-            coords = pos_list.text.strip().split()
-            if len(coords) % 3 == 0:
-                for i in range(0, len(coords), 3):
-                    all_coords.append([float(coords[i]), float(coords[i+1]), float(coords[i+2])])
-    
-    if not all_coords:
-        return
+def process_gml_files(matched_gmls, output_dir, output_filename, x_center, y_center, margin_m, excluded_ids=None, compact=False,
+                      mesh_bundle_path=None):
+    """
+    處理符合條件的 GML 文件，並將所有建築物合併到一個輸出文件；回傳寫入的建築物數量（compact=True 時不縮排）
     
-    # 計算新的邊界
-    min_x = min(c[0] for c in all_coords)
-    min_y = min(c[1] for c in all_coords)
-    min_z = min(c[2] for c in all_coords)
-    max_x = max(c[0] for c in all_coords)
-    max_y = max(c[1] for c in all_coords)
-    max_z = max(c[2] for c in all_coords)
-    
-    # 更新 boundedBy 元素
-    bounded_by = root.find('.//gml:boundedBy', namespaces)
-    if bounded_by is not None:
-        lower_corner = bounded_by.find('.//gml:lowerCorner', namespaces)
-        upper_corner = bounded_by.find('.//gml:upperCorner', namespaces)
-        
-        if lower_corner is not None and upper_corner is not None:
-            lower_corner.text = f"{min_x:.3f} {min_y:.3f} {min_z:.3f}"
-            upper_corner.text = f"{max_x:.3f} {max_y:.3f} {max_z:.3f}"
-
-def process_gml_files(matched_gmls, output_dir, output_filename, x_center, y_center, margin_m, excluded_ids=None):
-    """處理符合條件的 GML 文件，並將所有建築物合併到一個輸出文件"""
+    指定 mesh_bundle_path 且網格快取（gml_mesh_store.py）涵蓋所有來源檔案時，改為在該路徑寫出二進位網格，不產生 GML
+    """
     output_dir = Path(output_dir)
     output_dir.mkdir(exist_ok=True)
+    if mesh_bundle_path is not None:
+        # 移除上一次請求留下的網格檔，呼叫端以它是否存在判斷輸出的是哪一種
+        shutil.rmtree(mesh_bundle_path, ignore_errors=True)
     
     # 使用指定的輸出檔名
     output_gml = output_dir / output_filename
@@ -220,18 +139,40 @@ def process_gml_files(matched_gmls, output_dir, output_filename, x_center, y_cen
     y_min = y_center - margin_m
     y_max = y_center + margin_m
     
-    # 創建一個臨時文件來存儲所有建築物 ID
-    temp_ids_file = output_dir / "temp_building_ids.txt"
     all_building_ids = []
     excluded_count = 0  # 记录被排除的建物数量
     
     print(f"排除的建物 ID 列表: {excluded_ids}" if excluded_ids else "无排除的建物 ID")
-    
+    excluded_ids = set(excluded_ids)
+
+    # 若已建立建物索引（create_gml_index.py --building-index），以索引查詢取代整檔解析
+    building_index = get_building_index()
+    indexed_tiles = {}
+
     # 首先收集所有符合條件的建築物 ID
     for gml_file in matched_gmls:
+        tile = building_index.lookup(gml_file) if building_index is not None else None
+        if tile is not None:
+            print(f"\n分析文件（建物索引）: {gml_file}")
+            indexed_tiles[gml_file] = tile
+            for row in building_index.select(tile, x_min, y_min, x_max, y_max):
+                building_id = str(building_index.ids[row])
+                if building_id in excluded_ids:
+                    print(f"排除建物: {building_id}")
+                    excluded_count += 1
+                    continue
+
+                # 最低 z 值不為 0 的建物在提取時一樣會被跳過，這裡先過濾掉
+                min_z = building_index.min_z[row]
+                if np.isnan(min_z) or abs(min_z) > 0.001:
+                    continue
+
+                all_building_ids.append((gml_file, building_id))
+            continue
+
         try:
             print(f"\n分析文件: {gml_file}")
-            
+
             tree = ET.parse(gml_file)
             root = tree.getroot()
             
@@ -250,23 +191,8 @@ def process_gml_files(matched_gmls, output_dir, output_filename, x_center, y_cen
                     continue
                 
                 # 獲取建築物 ID
-                building_id = None
-                for id_attr in ['{http://www.opengis.net/gml}id', 'gml:id', 'id']:
-                    if id_attr in building.attrib:
-                        building_id = building.attrib[id_attr]
-                        if building_id.startswith('bldg_'):
-                            building_id = building_id[5:]
-                        break
-                
-                if not building_id:
-                    for elem in building.findall('.//*'):
-                        if elem.tag.endswith('BUILD_ID') and elem.text:
-                            building_id = elem.text
-                            break
-                        elif elem.tag.endswith('name') and elem.text:
-                            building_id = elem.text
-                            break
-                
+                building_id = get_building_id(building)
+
                 if building_id:
                     # 检查是否在排除列表中
                     if building_id in excluded_ids:
@@ -281,54 +207,91 @@ def process_gml_files(matched_gmls, output_dir, output_filename, x_center, y_cen
     
     if not all_building_ids:
         print("未找到符合範圍的建築物")
-        return
+        return 0
     
     print(f"\n共找到 {len(all_building_ids)} 個符合範圍的建築物")
     if excluded_count > 0:
         print(f"排除了 {excluded_count} 個不需要的建築物")
     
-    # 為每個源文件創建並處理建築物
-    for gml_file, building_ids in itertools.groupby(all_building_ids, key=lambda x: x[0]):
-        # 提取當前文件的建築物 ID
-        current_ids = [bid for _, bid in building_ids]
-        
-        if not current_ids:
-            continue
+    mesh_store = get_mesh_store() if mesh_bundle_path is not None else None
+    if mesh_store is not None:
+        selections = [(gml_file, [bid for _, bid in group])
+                      for gml_file, group in itertools.groupby(all_building_ids, key=lambda x: x[0])]
+        count = mesh_store.write_request_bundle(selections, mesh_bundle_path)
+        if count is not None:
+            print(f"\n已由網格快取寫出 {count} 個建築物: {mesh_bundle_path}")
+            return count
+        print("\n網格快取未涵蓋所有來源檔案，改為產生 GML")
+    
+    # 所有源文件的建築物直接串流寫入同一個輸出文件；boundedBy 以累計的邊界在最後一次寫出
+    writer = CityGMLWriter(str(output_gml), update_envelope=True, compact=compact)
+    try:
+        for gml_file, building_ids in itertools.groupby(all_building_ids, key=lambda x: x[0]):
+            # 提取當前文件的建築物 ID
+            current_ids = [bid for _, bid in building_ids]
             
-        print(f"\n從 {gml_file} 提取 {len(current_ids)} 個建築物")
-        
-        # 將當前的建築物 ID 寫入臨時文件
-        with open(temp_ids_file, 'w', encoding='utf-8') as f:
-            for bid in current_ids:
-                f.write(f"ID: {bid}\n")
-        
-        # 如果是第一個文件，直接輸出到目標文件
-        # 如果不是第一個文件，則需要合併到現有文件中
-        if not output_gml.exists():
-            extract_buildings_from_gml(gml_file, current_ids, str(output_gml))
-        else:
-            # 創建臨時文件
-            temp_output = output_dir / "temp_output.gml"
-            extract_buildings_from_gml(gml_file, current_ids, str(temp_output))
+            if not current_ids:
+                continue
+                
+            print(f"\n從 {gml_file} 提取 {len(current_ids)} 個建築物")
             
-            # 合併文件
-            merge_gml_files(str(output_gml), str(temp_output), str(output_gml))
+            try:
+                if gml_file in indexed_tiles:
+                    # 依建物索引記錄的位元組範圍，只讀取並解析需要的 cityObjectMember
+                    tile = indexed_tiles[gml_file]
+                    rows = building_index.rows_for_ids(tile, current_ids)
+                    members, bounded_by, root = building_index.read_members(gml_file, tile, rows)
+                    found_ids = write_building_members(members, current_ids, writer, get_namespaces(root), bounded_by, copy_member=False)
+                else:
+                    found_ids = write_buildings_from_gml(gml_file, current_ids, writer)
+            except Exception as e:
+                print(f"提取文件 {gml_file} 時出錯: {e}")
+                continue
             
-            # 刪除臨時文件
-            temp_output.unlink()
-    
-    # 清理臨時文件
-    if temp_ids_file.exists():
-        temp_ids_file.unlink()
+            report_missing_buildings(current_ids, found_ids)
+    finally:
+        writer.close()
     
-    # 移除空行
-    with open(output_gml, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    cleaned_lines = [line for line in lines if line.strip()]
-    with open(output_gml, 'w', encoding='utf-8') as f:
-        f.writelines(cleaned_lines)
+    if writer.member_count == 0:
+        print("沒有任何建築物寫入輸出文件")
+        return 0
     
     print(f"\n所有建築物已合併到: {output_gml}")
+    return writer.member_count
+
+def generate_gml(lat, lon, margin, out_path, excluded_ids=None, csv_path="gml_bounding_boxes_v1.csv", compact=False,
+                 mesh_bundle_path=None):
+    """
+    依經緯度與匡列範圍產生 GML（API 直接在行程內呼叫，不需再啟動 Main.py）
+    
+    tile 索引、檔案路徑清單與座標轉換器都會在行程內快取，重複呼叫不需重新載入。
+    
+    Args:
+        lat (float): 中心點緯度（WGS84）
+        lon (float): 中心點經度（WGS84）
+        margin (float): 匡列範圍半徑（公尺）
+        out_path (str): 輸出 GML 檔案路徑
+        excluded_ids (list): 要排除的建物 ID
+        csv_path (str): tile 邊界 CSV
+        compact (bool): 不縮排輸出；GML 只交給轉換程式讀取時使用，檔案較小、寫入較快
+        mesh_bundle_path (str): 網格快取涵蓋請求範圍時，改為寫出此二進位網格（不產生 GML）
+    
+    Returns:
+        int: 寫入的建築物數量；0 表示沒有產生輸出文件
+    """
+    lat, lon, margin = float(lat), float(lon), float(margin)
+    out_path = Path(out_path)
+    
+    # 轉換座標
+    x_center, y_center = wgs84_to_epsg3826(lat, lon)
+    
+    # 找到符合範圍的 GML 文件
+    matched_gmls = find_matching_gmls(csv_path, lat, lon, margin)
+    print(f"找到 {len(matched_gmls)} 個符合條件的 GML 文件")
+    
+    # 處理符合條件的文件
+    return process_gml_files(matched_gmls, out_path.parent, out_path.name, x_center, y_center, margin, excluded_ids, compact,
+                             mesh_bundle_path)
 
 if __name__ == "__main__":
     # 使用者輸入
@@ -354,16 +317,7 @@ if __name__ == "__main__":
     else:
         print("未設定任何要排除的建物ID")
     
-    # 轉換座標
-    x_center, y_center = wgs84_to_epsg3826(lat, lon)
-    
     # 設定路徑
-    csv_path = "gml_bounding_boxes_v1.csv"
     output_dir = "processed_gmls"
     
-    # 找到符合範圍的 GML 文件
-    matched_gmls = find_matching_gmls(csv_path, lat, lon, margin_m)
-    print(f"找到 {len(matched_gmls)} 個符合條件的 GML 文件")
-    
-    # 處理符合條件的文件
-    process_gml_files(matched_gmls, output_dir, output_filename, x_center, y_center, margin_m, all_excluded_ids) 
\ No newline at end of file
+    generate_gml(lat, lon, margin_m, os.path.join(output_dir, output_filename), all_excluded_ids) 
\ No newline at end of file
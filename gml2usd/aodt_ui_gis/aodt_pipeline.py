@@ -0,0 +1,790 @@
+"""
+Conversion pipeline shared by citygml2aodt, citygml2aodt_indoor,
+citygml2aodt_indoor_groundplane_domain and usd2usd.
+
+The scripts are `Variant` configurations of the same stages. Each stage is a
+plain function (or `StageWriter` method), so it can be run, timed, cached or
+parallelised on its own:
+
+    load        load_citygml / load_usd   transformed, cleaned objects -> Scene
+    footprints  build_footprints          merged, centred building footprints
+    center      center_buildings / center_terrain
+    slice       building_pool             z-slicing and interiors per building
+    terrain     build_terrain             clipped ground plane
+    mobility    build_mobility            outside mobility mesh (+ remainder)
+    author      StageWriter               USD stage
+    gltf        gltf_writer               optional glTF of the building meshes
+    tiles       tileset_writer            optional 3D Tiles tileset with building LODs
+
+`convert(args, variant)` runs them in that order, authoring prims in the
+order the scripts always have, and prints the time spent in each stage.
+Nothing runs at import time.
+"""
+
+import contextlib
+import dataclasses
+import functools
+import os
+import re
+import time
+
+import numpy as np
+
+import geometry_tools
+import tessellation_tools
+import aodt_usd
+import building_pool
+import gltf_writer
+import tileset_writer
+import mesh_bundle
+import mesh_cache
+from footprint import extract_footprint
+
+from pxr import Usd, UsdGeom, UsdShade, UsdLux, Sdf, Gf, Vt
+
+
+# ---------------------------------------------------------------------------
+# mesh helpers
+# ---------------------------------------------------------------------------
+
+
+def compact(vertices, indices):
+    # compact indices and remove unused vertices
+    lut = geometry_tools.compactIndices(indices)
+    out_vertices = vertices[lut]
+
+    return out_vertices, indices
+
+
+cleanup_simple = building_pool.cleanup_simple
+
+
+def combine_meshes(vertices, indices):
+    offset = int(0)
+    out_indices = []
+    for v, i in zip(vertices, indices):
+        out_indices.append(i + offset)
+        offset += v.shape[0]
+    return np.concatenate(vertices), np.concatenate(out_indices)
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(epsg_in, epsg_out):
+    # CRS/Transformer construction is slow; a long-lived worker reuses them across conversions
+    import pyproj
+
+    return pyproj.Transformer.from_crs(pyproj.CRS.from_epsg(epsg_in), pyproj.CRS.from_epsg(epsg_out))
+
+
+# ---------------------------------------------------------------------------
+# prim names
+# ---------------------------------------------------------------------------
+
+
+def to_usd_identifier(raw_name: str, prefix: str = "obj") -> str:
+    """Convert an arbitrary string to a valid USD prim identifier.
+
+    USD identifiers must start with [A-Za-z_] and then contain only [A-Za-z0-9_].
+    """
+    safe = re.sub(r"[^A-Za-z0-9_]", "_", str(raw_name or ""))
+    if not safe:
+        safe = prefix
+    if not re.match(r"^[A-Za-z_]", safe):
+        safe = f"{prefix}_{safe}"
+    return safe
+
+
+def usd_safe_prim_name(raw_name: str) -> str:
+    if raw_name is None:
+        return "unnamed"
+    raw_name = str(raw_name).strip()
+    if not raw_name:
+        return "unnamed"
+    name = re.sub(r"[^A-Za-z0-9_]+", "_", raw_name)
+    if not name:
+        name = "unnamed"
+    if name[0].isdigit():
+        name = "_" + name
+    return name
+
+
+def make_unique_name(base: str, used: set) -> str:
+    if base not in used:
+        used.add(base)
+        return base
+    i = 1
+    while f"{base}_{i}" in used:
+        i += 1
+    unique = f"{base}_{i}"
+    used.add(unique)
+    return unique
+
+
+def identifier_building_name(name, structure, used):
+    return to_usd_identifier(name, prefix="b")
+
+
+def identifier_terrain_name(name):
+    return to_usd_identifier(name, prefix="t")
+
+
+def dashless_name(name, structure=None, used=None):
+    return name.replace("-", "_")
+
+
+def gml_name_building_name(name, structure, used):
+    """gml:name attribute when present, made unique across the stage."""
+    raw_building_name = None
+    if isinstance(structure.get("attributes"), dict):
+        raw_building_name = structure["attributes"].get("gml:name")
+    return make_unique_name(usd_safe_prim_name(raw_building_name or name), used)
+
+
+# ---------------------------------------------------------------------------
+# stages
+# ---------------------------------------------------------------------------
+
+MOBILITY_CUT = "cut"  # terrain with building footprints cut out
+MOBILITY_FOOTPRINTS = "footprints"  # the building footprints themselves
+MOBILITY_GROUND_PLANE = "ground_plane"  # a copy of the ground plane
+
+
+@dataclasses.dataclass
+class Scene:
+    buildings: dict = dataclasses.field(default_factory=dict)
+    terrain: dict = dataclasses.field(default_factory=dict)
+    footprints: list = dataclasses.field(default_factory=list)
+    lower: np.ndarray = dataclasses.field(default_factory=lambda: np.full(3, np.finfo(np.float64).max))
+    upper: np.ndarray = dataclasses.field(default_factory=lambda: np.full(3, np.finfo(np.float64).min))
+
+    @property
+    def center(self):
+        center = 0.5 * (self.lower + self.upper)
+        center[2] = 0
+        return center
+
+    def add_building(self, name, structure):
+        self.lower = np.minimum(self.lower, structure["lower"])
+        self.upper = np.maximum(self.upper, structure["upper"])
+        self.buildings[name] = structure
+        fp = extract_footprint(structure["vertices"], structure["indices"], structure["lower"][2] + 0.1)
+        if fp.size:
+            self.footprints.append(fp)
+
+
+def load_citygml(files, epsg_in, epsg_out):
+    """CityGML files or .meshbundles -> Scene, transformed and cleaned (see mesh_cache)."""
+    import pycitygml
+
+    transform = get_transformer(epsg_in, epsg_out)
+    cache = mesh_cache.get_mesh_cache(epsg_in, epsg_out)
+    scene = Scene()
+    for file in files:
+        # CityGML file or a .meshbundle written by the gml2usd service
+        data = mesh_bundle.load_city_objects(file)
+        for name, structure in mesh_cache.cleaned_city_objects(data, transform, cache):
+            if structure["kind"] in (pycitygml.TINRelief, pycitygml.ReliefFeature):
+                scene.terrain[name] = structure
+            else:
+                scene.add_building(name, structure)
+    return scene
+
+
+def load_usd(files):
+    """Triangle meshes of USD stages -> Scene; every mesh is a building."""
+    scene = Scene()
+    for file in files:
+        stage = Usd.Stage.Open(str(file))
+        for prim in stage.Traverse():
+            if not prim.IsA(UsdGeom.Mesh):
+                continue
+            mesh = UsdGeom.Mesh(prim)
+            vertices = np.array(mesh.GetPointsAttr().Get(), dtype=np.float64)
+            indices = np.array(mesh.GetFaceVertexIndicesAttr().Get(), dtype=np.uint32)
+            counts = np.array(mesh.GetFaceVertexCountsAttr().Get())
+            if not (counts == 3).all():
+                print("skipping %s containing non-triangles" % str(prim.GetPath()))
+                continue
+
+            vertices, indices = cleanup_simple(vertices, indices)
+            structure = {
+                "vertices": vertices,
+                "indices": indices,
+                "lower": vertices.min(axis=0),
+                "upper": vertices.max(axis=0),
+            }
+            scene.add_building(prim.GetName(), structure)
+    return scene
+
+
+def build_footprints(scene, fallback=False, start=None, stop=None):
+    """Merged building footprints, centred and flattened to z=0."""
+    footprints = scene.footprints
+    if start is not None and stop is not None:
+        footprints = footprints[start:stop]
+
+    if footprints:
+        footprint_vertices = np.concatenate(footprints, axis=0)
+    elif fallback:
+        # If we couldn't extract any footprint triangles (common for some datasets),
+        # fall back to a simple rectangle footprint from the overall building bbox.
+        lower, upper = scene.lower, scene.upper
+        z = lower[2] if np.isfinite(lower[2]) else 0.0
+        x0, y0 = float(lower[0]), float(lower[1])
+        x1, y1 = float(upper[0]), float(upper[1])
+        # two triangles (6 verts) to match the rest of the pipeline
+        footprint_vertices = np.array(
+            [
+                [x0, y0, z],
+                [x1, y0, z],
+                [x1, y1, z],
+                [x0, y0, z],
+                [x1, y1, z],
+                [x0, y1, z],
+            ],
+            dtype=np.float64,
+        )
+        print("[Footprint] warning: no footprint triangles found; using bbox rectangle fallback.")
+    else:
+        return np.zeros((0, 3), dtype=np.float64), np.zeros((0,), dtype=np.uint32)
+
+    footprint_indices = np.arange(0, footprint_vertices.shape[0], dtype=np.uint32)
+    footprint_vertices -= scene.center
+    footprint_vertices[:, 2] = 0
+    return cleanup_simple(footprint_vertices, footprint_indices)
+
+
+def center_buildings(scene, global_z_offset=False):
+    """Move buildings to the scene centre; without terrain also drop them to z=0."""
+    center = scene.center
+    z_offset = None
+    if not scene.terrain and global_z_offset:
+        # When there is no terrain mesh, rebasing each building by its own min-Z will
+        # incorrectly flatten objects that are entirely above ground (e.g., roofs) onto z=0.
+        z_offset = float(scene.lower[2]) if np.isfinite(scene.lower[2]) else 0.0
+
+    for structure in scene.buildings.values():
+        structure["vertices"] -= center
+        structure["lower"] -= center
+        structure["upper"] -= center
+
+        if not scene.terrain:
+            offset = structure["lower"][2] if z_offset is None else z_offset
+            structure["vertices"][:, 2] -= offset
+            structure["lower"][2] -= offset
+            structure["upper"][2] -= offset
+
+
+def center_terrain(scene):
+    center = scene.center
+    for structure in scene.terrain.values():
+        structure["vertices"] -= center
+        structure["lower"] -= center
+        structure["upper"] -= center
+
+
+def build_terrain(scene):
+    """Ground plane: the (centred) terrain clipped to the buildings' box plus
+    100 m, or a flat rectangle 10 m around the buildings without terrain."""
+    lower, upper, center = scene.lower, scene.upper, scene.center
+    nav_vertices = []
+    nav_indices = []
+
+    for structure in scene.terrain.values():
+        clip_planes = np.array(
+            [
+                [1, 0, 0, upper[0] - center[0] + 100],
+                [-1, 0, 0, -lower[0] + center[0] + 100],
+                [0, 1, 0, upper[1] - center[1] + 100],
+                [0, -1, 0, -lower[1] + center[1] + 100],
+            ],
+            np.float64,
+        )
+
+        vertices, indices = tessellation_tools.clipMesh(structure["vertices"], structure["indices"], clip_planes)
+        vertices, indices = cleanup_simple(vertices, indices)
+        nav_vertices.append(vertices)
+        nav_indices.append(indices)
+
+    if not nav_vertices:
+        nav_vertices.append(
+            np.array(
+                [
+                    [upper[0] - center[0] + 10, upper[1] - center[1] + 10, 0],
+                    [lower[0] - center[0] - 10, upper[1] - center[1] + 10, 0],
+                    [lower[0] - center[0] - 10, lower[1] - center[1] - 10, 0],
+                    [upper[0] - center[0] + 10, lower[1] - center[1] - 10, 0],
+                ],
+                np.float64,
+            )
+        )
+        nav_indices.append(np.array([0, 1, 2, 0, 2, 3], np.uint32))
+
+    terrain_vertices, terrain_indices = combine_meshes(nav_vertices, nav_indices)
+    return cleanup_simple(terrain_vertices, terrain_indices)
+
+
+def build_mobility(mode, terrain_mesh, footprint_mesh, rough=False):
+    """Outdoor mobility mesh for `mode`; returns (outside, remainder) meshes,
+    remainder being what the cut removed (None when nothing is cut)."""
+    empty = (np.zeros((0, 3), dtype=np.float64), np.zeros((0,), dtype=np.uint32))
+    if mode == MOBILITY_GROUND_PLANE:
+        return terrain_mesh, None
+    if mode == MOBILITY_FOOTPRINTS:
+        # 直接使用 footprint 作為 mobility domain，室外地形部分則忽略（變為無法行走）
+        return footprint_mesh, empty
+
+    terrain_vertices, terrain_indices = terrain_mesh
+    footprint_vertices, footprint_indices = footprint_mesh
+
+    print("tessellate")
+    nav_vertices, nav_indices = tessellation_tools.tessellateMesh(terrain_vertices, terrain_indices, 4.0)
+
+    print("cutting")
+    if footprint_vertices.size == 0 or footprint_indices.size == 0:
+        # Some inputs yield no valid building footprints. The native cutting routines
+        # may not handle empty footprints and can segfault. In that case, keep the
+        # original navigation mesh unchanged.
+        nav_outside = nav_indices
+        nav_inside = np.array([], dtype=np.uint32)
+    elif not rough:
+        cuts = footprint_indices + nav_vertices.shape[0]
+        nav_vertices = np.concatenate((nav_vertices, footprint_vertices))
+        cuts = tessellation_tools.extractEdges(cuts)
+        nav_vertices, nav_outside, nav_inside = tessellation_tools.cutLines(nav_vertices, nav_indices, cuts)
+    else:
+        nav_outside = tessellation_tools.cutFootprints(nav_vertices, nav_indices, footprint_vertices, footprint_indices)
+        nav_inside = np.array([], dtype=np.uint32)
+
+    return compact(nav_vertices, nav_outside), compact(nav_vertices, nav_inside)
+
+
+# ---------------------------------------------------------------------------
+# authoring
+# ---------------------------------------------------------------------------
+
+
+def add_attribute_if_not_present(prim, name, type, value, doc):
+    if not prim.GetAttribute(name).IsValid():
+        attr = prim.CreateAttribute(name, type)
+        if value is not None:
+            attr.Set(value)
+        if doc is not None:
+            attr.SetDocumentation(doc)
+        return attr
+
+
+def _add_rf_attributes(xform, object_type):
+    prim = xform.GetPrim()
+    add_attribute_if_not_present(prim, "ObjectType", Sdf.ValueTypeNames.String, object_type, "")
+    add_attribute_if_not_present(prim, "AerialRFDiffraction", Sdf.ValueTypeNames.Bool, True, "")
+    add_attribute_if_not_present(prim, "AerialRFDiffusion", Sdf.ValueTypeNames.Bool, True, "")
+    add_attribute_if_not_present(prim, "AerialRFMesh", Sdf.ValueTypeNames.Bool, True, "")
+    add_attribute_if_not_present(prim, "AerialRFTransmission", Sdf.ValueTypeNames.Bool, False, "")
+
+
+SPLIT_NONE = "none"
+SPLIT_SUBLAYERS = "sublayers"
+SPLIT_PAYLOADS = "payloads"
+
+
+def add_output_arguments(parser):
+    """USD output options shared by the converter scripts (see StageWriter)."""
+    parser.add_argument("--usd_format", choices=("usda", "usdc"), help="file format of a .usd output (default: usdc)")
+    parser.add_argument(
+        "--split",
+        choices=(SPLIT_NONE, SPLIT_SUBLAYERS, SPLIT_PAYLOADS),
+        default=SPLIT_NONE,
+        help="write buildings to per-tile layers, as sublayers or payloads of the output",
+    )
+    parser.add_argument("--tile_size", type=float, default=500.0, help="tile edge in metres for --split and --tiles")
+    parser.add_argument(
+        "--gltf", help="also write the building meshes as glTF (.gltf + .bin) to this path, without ground plane"
+    )
+    parser.add_argument(
+        "--gltf_y_up", action="store_true",
+        help="write --gltf in metres, Y-up (glTF convention) instead of the stage's units and Z-up axis as usd2gltf does",
+    )
+    parser.add_argument(
+        "--tiles", help="also write a 3D Tiles tileset (tileset.json + per-tile LOD GLBs) of the buildings to this directory"
+    )
+    parser.add_argument(
+        "--lod_cell", type=float, default=tileset_writer.DEFAULT_LOD_CELL,
+        help="vertex clustering cell in metres for the simplified --tiles LOD",
+    )
+
+
+class StageWriter:
+    """Authors the AODT stage; the constructor writes the fixed /World and /Looks prims.
+
+    Meshes are written as specs straight into the root layer (aodt_usd's Sdf
+    helpers) rather than through UsdGeom, and their MaterialTag primvars
+    already carry the default material mapping. Wrap bulk authoring in
+    `batch()` so the stage recomposes once instead of once per attribute.
+
+    `usd_format` ("usda" or "usdc") picks the file format of a `.usd` output;
+    crate (usdc) files store each distinct array once. With `split` the
+    building meshes go to one layer per `tile_size` metre square next to
+    the output (`<stem>_tiles/tile_<x>_<y><ext>`, negative indices written as m<n>):
+
+    - "sublayers": the root layer sublayers the tiles; prim paths are unchanged,
+    - "payloads": each tile is a payload on /World/buildings/{exterior,interior}/tile_<x>_<y>,
+      so a stage opened with Usd.Stage.LoadNone can load regions on demand.
+    """
+
+    def __init__(self, output, cm=True, interiors=True, usd_format=None, split=None, tile_size=500.0):
+        self.output = output
+        self.ext = os.path.splitext(output)[1]
+        if usd_format and self.ext.lower() in (".usda", ".usdc") and self.ext.lower() != "." + usd_format:
+            raise ValueError(f"--usd_format {usd_format} does not match the output file {output}")
+        self.layer_args = {"format": usd_format} if usd_format else {}
+        self.split = None if split in (None, SPLIT_NONE) else split
+        self.tile_size = float(tile_size)
+        self.tile_dir = os.path.splitext(output)[0] + "_tiles"
+        self.tiles = {}
+        self._tile_prims = set()
+
+        self.layer = Sdf.Layer.CreateNew(output, self.layer_args)
+        self.stage = stage = Usd.Stage.Open(self.layer)
+        UsdGeom.SetStageUpAxis(stage, UsdGeom.Tokens.z)
+        self.scaler = 1
+        if cm:
+            UsdGeom.SetStageMetersPerUnit(stage, UsdGeom.LinearUnits.centimeters)
+            self.scaler = 100
+        else:
+            UsdGeom.SetStageMetersPerUnit(stage, UsdGeom.LinearUnits.meters)
+
+        usd_world = UsdGeom.Xform.Define(stage, "/World")
+        # add tranform op to world
+        usd_world.AddTranslateOp().Set(value=(0, 0, 0))
+        usd_world.AddRotateXYZOp().Set(Gf.Vec3d(0, 0, 0))
+        usd_world.AddScaleOp().Set((1, 1, 1))
+
+        _add_rf_attributes(UsdGeom.Xform.Define(stage, "/World/buildings"), "building")
+        _add_rf_attributes(UsdGeom.Xform.Define(stage, "/World/buildings/exterior"), "building")
+        if interiors:
+            _add_rf_attributes(UsdGeom.Xform.Define(stage, "/World/buildings/interior"), "buildingInterior")
+
+        mtl_path = Sdf.Path("/Looks/PreviewSurface")
+        self.mtl = UsdShade.Material.Define(stage, mtl_path)
+        shader = UsdShade.Shader.Define(stage, mtl_path.AppendPath("Shader"))
+        shader.CreateIdAttr("UsdPreviewSurface")
+        shader.CreateInput("diffuseColor", Sdf.ValueTypeNames.Color3f).Set(Gf.Vec3f(0.4, 0.4, 0.4))
+        self.mtl.CreateSurfaceOutput().ConnectToSource(shader.ConnectableAPI(), "surface")
+
+    def batch(self):
+        return Sdf.ChangeBlock()
+
+    def region(self, lower, upper):
+        """Tile key of a (centred) building, None when not splitting."""
+        if self.split is None:
+            return None
+        center = 0.5 * (np.asarray(lower) + np.asarray(upper))
+        return int(np.floor(center[0] / self.tile_size)), int(np.floor(center[1] / self.tile_size))
+
+    @staticmethod
+    def _tile_name(region):
+        return ("tile_%d_%d" % region).replace("-", "m")
+
+    def _tile(self, region):
+        if region not in self.tiles:
+            os.makedirs(self.tile_dir, exist_ok=True)
+            path = os.path.join(self.tile_dir, self._tile_name(region) + self.ext)
+            self.tiles[region] = Sdf.Layer.CreateNew(path, self.layer_args)
+            if self.split == SPLIT_SUBLAYERS:
+                self.layer.subLayerPaths.append(self._tile_asset(region))
+        return self.tiles[region]
+
+    def _tile_asset(self, region):
+        return "./%s/%s%s" % (os.path.basename(self.tile_dir), self._tile_name(region), self.ext)
+
+    def _building_path(self, scope, prim_name, region):
+        """(layer, path) a building mesh of /World/buildings/<scope> is written to."""
+        if region is None:
+            return self.layer, f"/World/buildings/{scope}/{prim_name}"
+        layer = self._tile(region)
+        if self.split == SPLIT_SUBLAYERS:
+            return layer, f"/World/buildings/{scope}/{prim_name}"
+
+        # payloads: tile layer root prims /exterior and /interior, one payload prim per tile and scope
+        tile_name = self._tile_name(region)
+        if (scope, region) not in self._tile_prims:
+            self._tile_prims.add((scope, region))
+            root = Sdf.CreatePrimInLayer(layer, "/" + scope)
+            root.specifier = Sdf.SpecifierDef
+            root.typeName = "Xform"
+            prim_spec = Sdf.CreatePrimInLayer(self.layer, f"/World/buildings/{scope}/{tile_name}")
+            prim_spec.specifier = Sdf.SpecifierDef
+            prim_spec.typeName = "Xform"
+            prim_spec.payloadList.Prepend(Sdf.Payload(self._tile_asset(region), "/" + scope))
+        return layer, f"/{scope}/{prim_name}"
+
+    def mesh(self, path, vertices, indices, layer=None):
+        with Sdf.ChangeBlock():
+            return aodt_usd.define_mesh_spec(layer or self.layer, path, self.scaler * vertices, indices)
+
+    def aodt_mesh(self, path, vertices, indices, tags, layer=None, **properties):
+        with Sdf.ChangeBlock():
+            prim_spec = self.mesh(path, vertices, indices, layer)
+            aodt_usd.set_aodt_property_specs(prim_spec, **properties)
+            aodt_usd.add_aodt_material_array_specs(prim_spec, tags, len(indices) // 3)
+        return prim_spec
+
+    def add_building(self, prim_name, vertices, indices, tags, region=None):
+        layer, path = self._building_path("exterior", prim_name, region)
+        self.aodt_mesh(
+            path, vertices, indices, tags, layer,
+            rf_mesh=True, diffuse=True, diffraction=True, transmission=False, object_type="building",
+        )
+
+    def add_interior(self, prim_name, vertices, indices, region=None):
+        layer, path = self._building_path("interior", prim_name, region)
+        self.aodt_mesh(
+            path, vertices, indices, None, layer,
+            rf_mesh=True, diffuse=False, diffraction=False, transmission=False, object_type="buildingInterior",
+        )
+
+    def add_terrain_debug(self, prim_name, vertices, indices):
+        prim_spec = self.mesh("/World/" + prim_name, vertices, indices)
+        # debug only: few prims, bound through the stage API
+        prim = self.stage.GetPrimAtPath(prim_spec.path)
+        UsdShade.MaterialBindingAPI.Apply(prim)
+        UsdShade.MaterialBindingAPI(prim).Bind(self.mtl)
+
+    def add_ground_plane(self, vertices, indices):
+        self.aodt_mesh(
+            "/World/ground_plane", vertices, indices, None,
+            rf_mesh=True, diffuse=False, diffraction=False, transmission=False, object_type="terrain",
+        )
+
+    def add_mobility_domain(self, vertices, indices, mobility_type):
+        with Sdf.ChangeBlock():
+            prim_spec = self.mesh("/World/mobility_domain", vertices, indices)
+            attr = Sdf.AttributeSpec(prim_spec, "primvars:MobilityType", Sdf.ValueTypeNames.IntArray)
+            attr.default = Vt.IntArray.FromNumpy(np.ascontiguousarray(mobility_type, dtype=np.int32))
+            attr.SetInfo(UsdGeom.Tokens.interpolation, UsdGeom.Tokens.uniform)
+
+    def finish(self, check_materials=False):
+        stage = self.stage
+        scenario = aodt_usd.write_scenario_info(stage)
+        stage.SetDefaultPrim(scenario.GetPrim())
+
+        stage.DefinePrim("/Materials", "Scope")
+        standard = stage.DefinePrim("/Materials/standard")
+        # The reference resolves relative to the output layer: <output_dir>/../assets/materials.usda
+        materials_ref = "../assets/materials.usda"
+        materials_abs = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(self.output)), materials_ref))
+        if not check_materials or os.path.exists(materials_abs):
+            standard.GetReferences().AddReference(materials_ref)
+        else:
+            print(f"[Materials] warning: missing materials.usda at {materials_abs}; skipping reference.")
+
+        stage.DefinePrim("/UEs", "Scope")
+        stage.DefinePrim("/RUs", "Scope")
+        stage.DefinePrim("/Panels", "Scope")
+        stage.DefinePrim("/DUs", "Scope")
+
+        light_prim = stage.DefinePrim("/dome_light", "DomeLight")
+        light = UsdLux.DomeLight(light_prim)
+        light.GetIntensityAttr().Set(1000)
+
+        for layer in self.tiles.values():
+            layer.Save()
+        self.layer.Save()
+
+
+# ---------------------------------------------------------------------------
+# variants
+# ---------------------------------------------------------------------------
+
+
+def geographic_origin(args, scene):
+    """(lon, lat, height) of the scene centre when the input CRS is known (CityGML), else None."""
+    epsg = getattr(args, "epsg_out", None)
+    if epsg is None or not np.all(np.isfinite(scene.center)):
+        return None
+    # EPSG:4326 axis order is latitude, longitude
+    lat, lon = get_transformer(epsg, 4326).transform(scene.center[0], scene.center[1])
+    return float(lon), float(lat), 0.0
+
+
+def citygml_input(args):
+    return load_citygml(args.files, args.epsg_in, args.epsg_out)
+
+
+def usd_input(args):
+    return load_usd(args.files)
+
+
+@dataclasses.dataclass(frozen=True)
+class Variant:
+    name: str
+    # args -> Scene
+    load: object = citygml_input
+    building_name: object = identifier_building_name
+    terrain_name: object = identifier_terrain_name
+    # bbox rectangle when no footprint triangles were found
+    footprint_fallback: bool = False
+    # without terrain, drop all buildings by the lowest z instead of each to its own
+    global_z_offset: bool = False
+    mobility: str = MOBILITY_CUT
+    # skip the ../assets/materials.usda reference when the file is missing
+    check_materials: bool = False
+
+
+CITYGML = Variant("citygml2aodt")
+CITYGML_INDOOR = Variant(
+    "citygml2aodt_indoor",
+    building_name=dashless_name,
+    terrain_name=dashless_name,
+    footprint_fallback=True,
+    mobility=MOBILITY_FOOTPRINTS,
+    check_materials=True,
+)
+CITYGML_GROUND_PLANE = Variant(
+    "citygml2aodt_indoor_groundplane_domain",
+    building_name=gml_name_building_name,
+    terrain_name=dashless_name,
+    footprint_fallback=True,
+    global_z_offset=True,
+    mobility=MOBILITY_GROUND_PLANE,
+    check_materials=True,
+)
+USD = Variant("usd2usd", load=usd_input, building_name=dashless_name, terrain_name=dashless_name)
+
+
+# ---------------------------------------------------------------------------
+# driver
+# ---------------------------------------------------------------------------
+
+
+class StageTimer:
+    """Wall time per pipeline stage, printed as the stages finish."""
+
+    def __init__(self):
+        self.times = {}
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.times[name] = self.times.get(name, 0.0) + elapsed
+            print(f"[Pipeline] {name}: {elapsed:.2f}s")
+
+
+def convert(args, variant):
+    """Run the whole pipeline of `variant` for parsed script arguments.
+
+    Returns the StageTimer with the per-stage times.
+    """
+    timed = StageTimer()
+    interiors = not args.disable_interiors
+    extra = bool(args.extra)
+
+    with timed("load"):
+        scene = variant.load(args)
+
+    with timed("footprints"):
+        footprint_mesh = build_footprints(scene, variant.footprint_fallback, args.start, args.stop)
+        center_buildings(scene, variant.global_z_offset)
+
+    tiles = None
+    if args.tiles:
+        tiles = tileset_writer.TilesetWriter(
+            args.tiles, args.tile_size, args.lod_cell, origin=geographic_origin(args, scene)
+        )
+    writer = StageWriter(
+        args.output, cm=args.cm, interiors=interiors,
+        usd_format=args.usd_format, split=args.split, tile_size=args.tile_size,
+    )
+    # same vertex values as the USD meshes (and usd2gltf's export of them) unless --gltf_y_up
+    gltf = None
+    if args.gltf:
+        gltf = gltf_writer.GltfWriter(args.gltf, scale=writer.scaler, y_up=args.gltf_y_up)
+
+    all_nav_vertices = []
+    all_nav_indices = []
+    all_nav_type = []
+
+    # slicing and interior generation may run on a process pool (see building_pool.py),
+    # results come back in building order and are authored here
+    with timed("slice + author buildings"):
+        used_names = set()
+        results = building_pool.process_buildings(
+            list(scene.buildings.values()), interiors=interiors, workers=getattr(args, "workers", None)
+        )
+        with writer.batch():
+            for (name, structure), (vertices, indices, parent, interior, in_bounds) in zip(scene.buildings.items(), results):
+                prim_name = variant.building_name(name, structure, used_names)
+
+                tags = None
+                if "SurfaceTag" in structure:
+                    tags = structure["SurfaceTag"][parent]
+                region = writer.region(structure["lower"], structure["upper"])
+                writer.add_building(prim_name, vertices, indices, tags, region)
+                if gltf is not None:
+                    gltf.add_mesh("exterior", prim_name, vertices, indices)
+                if tiles is not None:
+                    tiles.add_building(prim_name, vertices, indices, structure["lower"], structure["upper"])
+
+                if interior is not None:
+                    inside_vertices, inside_indices = interior
+                    if extra and not in_bounds:
+                        print("interior generation failed for " + name)
+                        continue
+
+                    all_nav_vertices.append(inside_vertices)
+                    all_nav_indices.append(inside_indices)
+                    all_nav_type.append(np.full(len(inside_indices) // 3, 1, dtype=np.int32))
+                    writer.add_interior(prim_name, inside_vertices, inside_indices, region)
+                    if gltf is not None:
+                        gltf.add_mesh("interior", prim_name, inside_vertices, inside_indices)
+
+    with timed("terrain"):
+        center_terrain(scene)
+        if extra:
+            for name, structure in scene.terrain.items():
+                writer.add_terrain_debug(variant.terrain_name(name), structure["vertices"], structure["indices"])
+        terrain_vertices, terrain_indices = build_terrain(scene)
+
+    with timed("mobility"):
+        outside, remainder = build_mobility(
+            variant.mobility, (terrain_vertices, terrain_indices), footprint_mesh, rough=args.rough
+        )
+        if variant.mobility == MOBILITY_GROUND_PLANE:
+            # mobility_domain copies ground_plane triangles; interior nav meshes are not used
+            all_nav_vertices, all_nav_indices, all_nav_type = [], [], []
+        all_nav_vertices.append(outside[0])
+        all_nav_indices.append(outside[1])
+        all_nav_type.append(np.full(len(outside[1]) // 3, 0, dtype=np.int32))
+
+        mobility_vertices, mobility_indices = combine_meshes(all_nav_vertices, all_nav_indices)
+        mobility_type = np.concatenate(all_nav_type)
+
+    with timed("author"):
+        writer.add_ground_plane(terrain_vertices, terrain_indices)
+        writer.add_mobility_domain(mobility_vertices, mobility_indices, mobility_type)
+
+        if args.navdump:
+            mobility_vertices.astype(np.float32).tofile("vertices.bin")
+            mobility_indices.astype(np.uint32).tofile("indices.bin")
+
+        if extra:
+            if remainder is not None:
+                writer.mesh("/World/mobility_remainder", *remainder)
+            writer.mesh("/World/building_footprints", *footprint_mesh)
+
+        writer.finish(check_materials=variant.check_materials)
+
+    if gltf is not None:
+        with timed("gltf"):
+            gltf.write()
+
+    if tiles is not None:
+        with timed("tiles"):
+            tiles.write()
+
+    return timed
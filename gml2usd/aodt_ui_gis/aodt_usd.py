@@ -1,5 +1,6 @@
 import numpy as np
-from pxr import Usd, UsdGeom, UsdShade, Sdf, Gf, Kind
+from pxr import Usd, UsdGeom, UsdShade, Sdf, Gf, Kind, Vt
+from material_defaults import default_material_tags
 
 def add_attribute_if_not_present(prim, name, type, value, doc):
   if not prim.GetAttribute(name).IsValid():
@@ -65,3 +66,38 @@ def add_aodt_material_arrays(mesh, values):
   UsdGeom.PrimvarsAPI(mesh).CreatePrimvar('SurfaceTag', Sdf.ValueTypeNames.IntArray, UsdGeom.Tokens.uniform).Set(values);
   UsdGeom.PrimvarsAPI(mesh).CreatePrimvar('MaterialTag', Sdf.ValueTypeNames.IntArray, UsdGeom.Tokens.uniform).Set(values);
 
+# Sdf-level authoring: writes specs straight into a layer, so thousands of meshes
+# can be authored inside one Sdf.ChangeBlock without recomposing the stage per call.
+
+def _attribute_spec(prim_spec, name, type, value, custom=False):
+  attr = Sdf.AttributeSpec(prim_spec, name, type, Sdf.VariabilityVarying, custom)
+  attr.default = value
+  return attr
+
+def define_mesh_spec(layer, path, points, indices):
+  prim_spec = Sdf.CreatePrimInLayer(layer, path)
+  prim_spec.specifier = Sdf.SpecifierDef
+  prim_spec.typeName = 'Mesh'
+  indices = np.ascontiguousarray(indices, dtype=np.int32).ravel()
+  _attribute_spec(prim_spec, 'points', Sdf.ValueTypeNames.Point3fArray,
+                  Vt.Vec3fArray.FromNumpy(np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 3)))
+  _attribute_spec(prim_spec, 'faceVertexCounts', Sdf.ValueTypeNames.IntArray,
+                  Vt.IntArray.FromNumpy(np.full(len(indices)//3, 3, dtype=np.int32)))
+  _attribute_spec(prim_spec, 'faceVertexIndices', Sdf.ValueTypeNames.IntArray, Vt.IntArray.FromNumpy(indices))
+  return prim_spec
+
+def set_aodt_property_specs(prim_spec, rf_mesh, diffuse, diffraction, transmission, object_type):
+  _attribute_spec(prim_spec, 'AerialRFMesh', Sdf.ValueTypeNames.Bool, bool(rf_mesh), custom=True)
+  _attribute_spec(prim_spec, 'AerialRFDiffuse', Sdf.ValueTypeNames.Bool, bool(diffuse), custom=True)
+  _attribute_spec(prim_spec, 'AerialRFDiffraction', Sdf.ValueTypeNames.Bool, bool(diffraction), custom=True)
+  _attribute_spec(prim_spec, 'AerialRFTransmission', Sdf.ValueTypeNames.Bool, bool(transmission), custom=True)
+  _attribute_spec(prim_spec, 'ObjectType', Sdf.ValueTypeNames.String, object_type, custom=True)
+
+def add_aodt_material_array_specs(prim_spec, values, face_count):
+  # MaterialTag is written already mapped, so no add_default_materials_to_stage pass is needed
+  if values is None:
+    values = np.full(face_count, 0)
+  values = np.ascontiguousarray(values, dtype=np.int32)
+  for name, tags in (('SurfaceTag', values), ('MaterialTag', default_material_tags(values))):
+    attr = _attribute_spec(prim_spec, 'primvars:' + name, Sdf.ValueTypeNames.IntArray, Vt.IntArray.FromNumpy(tags))
+    attr.SetInfo(UsdGeom.Tokens.interpolation, UsdGeom.Tokens.uniform)
@@ -0,0 +1,224 @@
+"""
+Per-building slicing and interior generation for the citygml2aodt converters.
+
+For every building the converters z-slice the exterior mesh and, unless
+interiors are disabled, build the interior grid stack (building_orientation,
+generate_grid_stack, cutLines, cleanup_simple, add_staircase). Buildings are
+independent, so `process_buildings` can farm this out to a process pool:
+
+- the centred vertex and index arrays of all buildings are copied once into
+  two shared memory blocks; tasks only carry offsets into them,
+- each task handles a contiguous chunk of buildings and returns the results
+  (whose sizes are only known after slicing) through the pool,
+- results are yielded in building order, so USD authoring stays on the
+  calling process and the stage is identical to a sequential run.
+
+The pool is started on first use and reused by later conversions in the same
+(warm) process. Its workers exit on their own if the converter process dies.
+
+Configuration (environment):
+    AODT_BUILDING_WORKERS      worker processes (default 1: run in-process)
+    AODT_BUILDING_POOL_MIN     fewer buildings than this run in-process
+"""
+
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory, util
+
+import numpy as np
+
+import geometry_tools
+import tessellation_tools
+
+WORKERS = int(os.environ.get("AODT_BUILDING_WORKERS", "1"))
+MIN_BUILDINGS = int(os.environ.get("AODT_BUILDING_POOL_MIN", "32"))
+# Tasks per worker; more tasks balance uneven buildings better
+CHUNKS_PER_WORKER = 4
+
+
+def cleanup_simple(vertices, indices):
+    lut = geometry_tools.collapseVertices(vertices)
+    indices = lut[indices]
+
+    # remove duplicate and degenerate triangles
+    indices, tri_lut = geometry_tools.cleanupTriangleIndices(indices)
+
+    # compact indices and remove unused vertices
+    lut = geometry_tools.compactIndices(indices)
+    out_vertices = vertices[lut]
+
+    return out_vertices, indices
+
+
+def process_building(vertices, indices, lower, upper, interiors=True):
+    """Slice one (centred) building and generate its interior.
+
+    Returns (vertices, indices, parent, interior, in_bounds): the sliced
+    exterior mesh, the parent triangle of each sliced triangle, and the
+    interior mesh as (vertices, indices) or None. `in_bounds` is False when
+    the interior leaves the building's footprint box; the converters drop
+    such interiors in --extra mode.
+    """
+    slices = np.arange(lower[2] + 0.1, upper[2] - 2, 3)
+    vertices, indices, rings, parent = tessellation_tools.z_slice_mesh(vertices, indices, slices)
+
+    interior = None
+    in_bounds = True
+    if len(slices) != 0 and interiors:
+        p, e1, e2 = tessellation_tools.building_orientation(vertices, rings)
+
+        grid_vertices, grid_indices = tessellation_tools.generate_grid_stack(slices, p, e1, e2)
+
+        cuts = rings + grid_vertices.shape[0]
+        grid_vertices = np.concatenate((grid_vertices, vertices))
+
+        grid_vertices, outside, inside = tessellation_tools.cutLines(grid_vertices, grid_indices, cuts)
+
+        inside_vertices, inside_indices = cleanup_simple(grid_vertices, inside)
+
+        check_lower = (inside_vertices[:, 0:2] > np.array([lower[0:2]]) - 0.5).all()
+        check_upper = (inside_vertices[:, 0:2] < np.array([upper[0:2]]) + 0.5).all()
+        in_bounds = bool(check_lower and check_upper)
+
+        inside_indices = tessellation_tools.add_staircase(inside_vertices, inside_indices, slices)
+        interior = (inside_vertices, inside_indices)
+
+    return vertices, indices, parent, interior, in_bounds
+
+
+def _watch_parent(parent_pid):
+    # Pool workers block on their call queue forever if the converter is killed
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    os._exit(1)
+
+
+def _init_worker(parent_pid):
+    threading.Thread(target=_watch_parent, args=(parent_pid,), daemon=True).start()
+
+
+def _process_chunk(vertex_block, index_block, items, interiors):
+    vertex_shm = shared_memory.SharedMemory(name=vertex_block[0])
+    index_shm = shared_memory.SharedMemory(name=index_block[0])
+    try:
+        all_vertices = np.ndarray(vertex_block[1], dtype=vertex_block[2], buffer=vertex_shm.buf)
+        all_indices = np.ndarray(index_block[1], dtype=index_block[2], buffer=index_shm.buf)
+        results = []
+        for v0, v1, i0, i1, index_dtype, index_shape, lower, upper in items:
+            vertices = all_vertices[v0:v1].copy()
+            indices = all_indices[i0:i1].astype(index_dtype).reshape(index_shape)
+            results.append(process_building(vertices, indices, lower, upper, interiors))
+        del all_vertices, all_indices
+        return results
+    finally:
+        vertex_shm.close()
+        index_shm.close()
+
+
+_EXECUTOR = None
+_EXECUTOR_WORKERS = 0
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_executor(workers):
+    global _EXECUTOR, _EXECUTOR_WORKERS
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None or _EXECUTOR_WORKERS != workers:
+            if _EXECUTOR is not None:
+                _EXECUTOR.shutdown(cancel_futures=True)
+            # spawn: the USD stack of the converter process is not fork-safe
+            _EXECUTOR = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(os.getpid(),),
+            )
+            _EXECUTOR_WORKERS = workers
+        return _EXECUTOR
+
+
+def _discard_executor(wait=True):
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=wait, cancel_futures=True)
+            _EXECUTOR = None
+
+
+# A finalizer rather than atexit: a process started by multiprocessing (e.g. a
+# converter_pool worker) joins its children before atexit handlers run. It must
+# run before the call queue's own finalizer (priority 10) closes the queue.
+util.Finalize(None, _discard_executor, exitpriority=100)
+
+
+def _to_shared(arrays, dtype, width):
+    """Concatenate `arrays` into a new shared memory block; returns (shm, descriptor)."""
+    total = sum(len(a) for a in arrays)
+    shape = (total, width) if width else (total,)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total * (width or 1) * np.dtype(dtype).itemsize))
+    try:
+        out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        offset = 0
+        for a in arrays:
+            out[offset : offset + len(a)] = a
+            offset += len(a)
+        del out
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, (shm.name, shape, np.dtype(dtype).str)
+
+
+def process_buildings(structures, interiors=True, workers=None):
+    """Yield `process_building` results for `structures` (centred load_city_gml
+    structures), in order, using up to `workers` processes."""
+    workers = WORKERS if workers is None else workers
+    if workers <= 1 or len(structures) < max(2, MIN_BUILDINGS):
+        for structure in structures:
+            yield process_building(
+                structure["vertices"], structure["indices"], structure["lower"], structure["upper"], interiors
+            )
+        return
+
+    vertices = [np.asarray(s["vertices"], dtype=np.float64) for s in structures]
+    # index arrays may be flat or (n, 3); they are shared flat and reshaped per building
+    indices = [np.asarray(s["indices"]) for s in structures]
+    index_dtype = np.result_type(*indices)
+    v_offsets = np.concatenate(([0], np.cumsum([len(v) for v in vertices]))).tolist()
+    i_offsets = np.concatenate(([0], np.cumsum([i.size for i in indices]))).tolist()
+
+    vertex_shm, vertex_block = _to_shared(vertices, np.float64, 3)
+    index_shm = None
+    try:
+        index_shm, index_block = _to_shared([i.ravel() for i in indices], index_dtype, 0)
+        items = [
+            (v_offsets[n], v_offsets[n + 1], i_offsets[n], i_offsets[n + 1], indices[n].dtype.str, indices[n].shape,
+             np.array(s["lower"]), np.array(s["upper"]))
+            for n, s in enumerate(structures)
+        ]
+        chunk = -(-len(items) // (workers * CHUNKS_PER_WORKER))
+        executor = _get_executor(workers)
+        futures = [
+            executor.submit(_process_chunk, vertex_block, index_block, items[start : start + chunk], interiors)
+            for start in range(0, len(items), chunk)
+        ]
+        try:
+            for future in futures:
+                yield from future.result()
+        except concurrent.futures.process.BrokenProcessPool:
+            # a worker crashed (e.g. in the native cutting code); start fresh next time
+            _discard_executor(wait=False)
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+    finally:
+        vertex_shm.close()
+        vertex_shm.unlink()
+        if index_shm is not None:
+            index_shm.close()
+            index_shm.unlink()
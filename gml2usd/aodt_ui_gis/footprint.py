@@ -0,0 +1,17 @@
+"""
+Building footprint extraction shared by the citygml2aodt converters and usd2usd.
+"""
+
+import numpy as np
+
+
+def extract_footprint(vertices, indices, z_threshold):
+    """Triangles of the mesh lying entirely at or below `z_threshold`.
+
+    Returns their corner vertices as a (3 * n_triangles, 3) array, three rows
+    per triangle in mesh order. Some GMLs don't contain any triangles near the
+    lowest Z (e.g. open-bottom shells), so the result can be empty, shape (0, 3).
+    """
+    triangles = np.asarray(indices).reshape(-1, 3)
+    below = (vertices[:, 2] <= z_threshold)[triangles].all(axis=1)
+    return vertices[triangles[below].ravel()]
@@ -0,0 +1,148 @@
+"""
+glTF 2.0 output straight from the converters' building arrays.
+
+The gml2usd bundle used to reopen the finished USD and run it through usd2gltf
+just to get the buildings as glTF. `GltfWriter` collects the same (centred,
+metre) vertex and index arrays the USD meshes are authored from and writes
+`<name>.gltf` + `<name>.bin` next to each other, or a single GLB when the
+path ends in `.glb`. Only building meshes are added, so ground_plane and
+mobility_domain are left out by construction.
+
+Node layout mirrors the stage: World / buildings / exterior|interior / <prim>.
+By default the output matches what usd2gltf exports from the stage: vertices
+are multiplied by `scale` (the stage's `scaler`, 100 for --cm) and stay Z-up,
+with no transform on the World node. `y_up=True` instead writes metres with a
+World matrix rotating Z-up into glTF's Y-up frame (used for 3D Tiles GLBs).
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+# glTF constants
+_FLOAT = 5126
+_UNSIGNED_INT = 5125
+_ARRAY_BUFFER = 34962
+_ELEMENT_ARRAY_BUFFER = 34963
+_TRIANGLES = 4
+
+_GLB_MAGIC = 0x46546C67
+_GLB_JSON = 0x4E4F534A
+_GLB_BIN = 0x004E4942
+
+# column-major: (x, y, z) Z-up -> (x, z, -y) Y-up
+_Z_UP_TO_Y_UP = [1, 0, 0, 0, 0, 0, -1, 0, 0, 1, 0, 0, 0, 0, 0, 1]
+
+
+class GltfWriter:
+    def __init__(self, path, scale=1, y_up=False):
+        """scale: multiplies the vertices (ignored with y_up, which always writes metres)."""
+        self.path = path
+        self.scale = 1 if y_up else scale
+        self.y_up = y_up
+        self.bin_path = os.path.splitext(path)[0] + ".bin"
+        self.groups = {}  # group -> [(name, positions, indices)]
+
+    def add_mesh(self, group, name, vertices, indices):
+        indices = np.ascontiguousarray(indices, dtype=np.uint32).ravel()
+        if len(indices) < 3:
+            return
+        vertices = np.asarray(vertices).reshape(-1, 3)
+        if self.scale != 1:
+            vertices = self.scale * vertices
+        positions = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.groups.setdefault(group, []).append((name, positions, indices))
+
+    def write(self):
+        """Write the .gltf and .bin files (one .glb for a .glb path); returns their paths."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        doc, chunks, size = self._document()
+        if self.path.lower().endswith(".glb"):
+            doc_bytes = json.dumps(doc, separators=(",", ":")).encode("utf-8")
+            doc_bytes += b" " * (-len(doc_bytes) % 4)
+            with open(self.path, "wb") as f:
+                f.write(struct.pack("<III", _GLB_MAGIC, 2, 12 + 8 + len(doc_bytes) + (8 + size if size else 0)))
+                f.write(struct.pack("<II", len(doc_bytes), _GLB_JSON))
+                f.write(doc_bytes)
+                if size:
+                    f.write(struct.pack("<II", size, _GLB_BIN))
+                    f.writelines(chunks)
+            return [self.path]
+
+        if size:
+            doc["buffers"][0]["uri"] = os.path.basename(self.bin_path)
+        with open(self.bin_path, "wb") as f:
+            f.writelines(chunks)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, separators=(",", ":"))
+        return [self.path, self.bin_path]
+
+    def _document(self):
+        """The glTF JSON, the binary buffer as a list of chunks, and its size."""
+        doc = {
+            "asset": {"version": "2.0", "generator": "aodt_pipeline"},
+            "scene": 0,
+            "scenes": [{"nodes": [0]}],
+            "nodes": [
+                {"name": "World", "children": [1]},
+                {"name": "buildings", "children": []},
+            ],
+            "meshes": [],
+            "accessors": [],
+            "bufferViews": [],
+        }
+        if self.y_up:
+            doc["nodes"][0]["matrix"] = _Z_UP_TO_Y_UP
+        offset = 0
+        chunks = []
+        for group, meshes in self.groups.items():
+            group_node = {"name": group, "children": []}
+            doc["nodes"][1]["children"].append(len(doc["nodes"]))
+            doc["nodes"].append(group_node)
+            for name, positions, indices in meshes:
+                # float32 and uint32 data keep every view 4-byte aligned
+                doc["bufferViews"].append(
+                    {"buffer": 0, "byteOffset": offset, "byteLength": positions.nbytes, "target": _ARRAY_BUFFER}
+                )
+                chunks.append(positions.tobytes())
+                offset += positions.nbytes
+                doc["bufferViews"].append(
+                    {"buffer": 0, "byteOffset": offset, "byteLength": indices.nbytes, "target": _ELEMENT_ARRAY_BUFFER}
+                )
+                chunks.append(indices.tobytes())
+                offset += indices.nbytes
+
+                doc["accessors"].append({
+                    "bufferView": len(doc["bufferViews"]) - 2,
+                    "componentType": _FLOAT,
+                    "count": len(positions),
+                    "type": "VEC3",
+                    "min": positions.min(axis=0).tolist(),
+                    "max": positions.max(axis=0).tolist(),
+                })
+                doc["accessors"].append({
+                    "bufferView": len(doc["bufferViews"]) - 1,
+                    "componentType": _UNSIGNED_INT,
+                    "count": len(indices),
+                    "type": "SCALAR",
+                })
+                doc["meshes"].append({
+                    "name": name,
+                    "primitives": [{
+                        "attributes": {"POSITION": len(doc["accessors"]) - 2},
+                        "indices": len(doc["accessors"]) - 1,
+                        "mode": _TRIANGLES,
+                    }],
+                })
+                group_node["children"].append(len(doc["nodes"]))
+                doc["nodes"].append({"name": name, "mesh": len(doc["meshes"]) - 1})
+
+        if offset:
+            doc["buffers"] = [{"byteLength": offset}]
+        else:
+            # no buildings: glTF does not allow empty buffers
+            for key in ("meshes", "accessors", "bufferViews"):
+                del doc[key]
+        return doc, chunks, offset
@@ -1,3 +1,5 @@
+import numpy as np
+
 # See /assets materials.usda for default material mapping
 # [surfaceTagID, surfaceTagName, defaultMaterialTagID]
 default_material_map = [
@@ -42,3 +44,24 @@ default_material_map = [
     ]
 
 
+def _material_tag_lut():
+    # Applies the rows in order to every surface tag id, exactly like masking
+    # the array once per row would
+    lut = np.arange(max(max(row[0], row[2]) for row in default_material_map) + 1, dtype=np.int32)
+    for st_id, st_name, default_material in default_material_map:
+        lut[lut == st_id] = default_material
+    return lut
+
+
+# MaterialTag for each SurfaceTag id: material_tag_lut[surface_tags]
+material_tag_lut = _material_tag_lut()
+
+
+def default_material_tags(surface_tags):
+    """MaterialTag array for a SurfaceTag array; ids outside the table are kept."""
+    tags = np.array(surface_tags, dtype=np.int32)
+    if tags.size == 0 or (tags.min() >= 0 and tags.max() < len(material_tag_lut)):
+        return material_tag_lut[tags]
+    known = (tags >= 0) & (tags < len(material_tag_lut))
+    tags[known] = material_tag_lut[tags[known]]
+    return tags
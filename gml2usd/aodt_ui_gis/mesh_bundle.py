@@ -0,0 +1,138 @@
+"""
+Binary intermediate for the CityGML -> USD converters.
+
+A mesh bundle holds the same per-object data `pycitygml.load_city_gml` returns
+(vertices, indices, SurfaceTag, ... plus kind and attributes), stored as a
+directory of columnar `.npy` arrays:
+
+    <name>.meshbundle/
+        meta.json            format version, array key -> file stem, objects
+                             (name, kind, other fields, array keys)
+        a<i>.npy             all objects' arrays of one key, concatenated on axis 0
+        a<i>.offsets.npy     int64 (n_objects + 1) row offsets into a<i>.npy
+
+`load_mesh_bundle` memory-maps the arrays copy-on-write, so each object's
+arrays are views into the files: nothing is parsed or copied until the
+converter modifies them.
+
+The converters accept a bundle wherever a CityGML file is expected (see
+`load_city_objects`); the gml2usd service writes one instead of a GML file
+when its mesh store covers the request.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+MESH_BUNDLE_SUFFIX = ".meshbundle"
+FORMAT_VERSION = 1
+
+
+def is_mesh_bundle(path):
+    return os.path.isfile(os.path.join(path, "meta.json")) and str(path).endswith(MESH_BUNDLE_SUFFIX)
+
+
+def _kind_name(kind):
+    # pycitygml kinds are exported at module level (pycitygml.TINRelief, ...)
+    name = getattr(kind, "name", None)
+    return name if isinstance(name, str) else str(kind).rsplit(".", 1)[-1]
+
+
+def _resolve_kind(name):
+    try:
+        import pycitygml
+    except ImportError:
+        return name
+    return getattr(pycitygml, name, name)
+
+
+def write_mesh_bundle(path, objects):
+    """Write `objects` ({name: structure}, as returned by load_city_gml) to `path`.
+
+    The bundle is written to a temporary directory and renamed into place.
+    """
+    path = str(path)
+    names = list(objects)
+    array_keys = []
+    entries = []
+    for name in names:
+        structure = objects[name]
+        keys = [key for key, value in structure.items() if isinstance(value, np.ndarray)]
+        for key in keys:
+            if key not in array_keys:
+                array_keys.append(key)
+        entries.append(
+            {
+                "name": name,
+                "kind": _kind_name(structure.get("kind")),
+                "fields": {key: value for key, value in structure.items() if key != "kind" and key not in keys},
+                "arrays": keys,
+            }
+        )
+
+    tmp_dir = path + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        for i, key in enumerate(array_keys):
+            parts = [objects[name][key] for name in names if key in objects[name]]
+            offsets = np.zeros(len(names) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(objects[name][key]) if key in objects[name] else 0 for name in names])
+            np.save(os.path.join(tmp_dir, f"a{i}.npy"), np.concatenate(parts), allow_pickle=False)
+            np.save(os.path.join(tmp_dir, f"a{i}.offsets.npy"), offsets, allow_pickle=False)
+        meta = {
+            "version": FORMAT_VERSION,
+            "arrays": {key: f"a{i}" for i, key in enumerate(array_keys)},
+            "objects": entries,
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, default=str)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_dir, path)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load_mesh_bundle(path, mmap_mode="c", names=None):
+    """Load a bundle as {name: structure} with memory-mapped array views.
+
+    mmap_mode="c" (copy-on-write) lets callers modify the arrays in place
+    without touching the file; use "r" for read-only access. `names` limits
+    the result to those objects, in bundle order.
+    """
+    path = str(path)
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported mesh bundle version in {path}")
+
+    columns = {}
+    for key, stem in meta["arrays"].items():
+        columns[key] = (
+            np.load(os.path.join(path, f"{stem}.npy"), mmap_mode=mmap_mode, allow_pickle=False),
+            np.load(os.path.join(path, f"{stem}.offsets.npy"), allow_pickle=False),
+        )
+
+    wanted = None if names is None else set(names)
+    objects = {}
+    for i, entry in enumerate(meta["objects"]):
+        if wanted is not None and entry["name"] not in wanted:
+            continue
+        structure = {"kind": _resolve_kind(entry["kind"]), **entry["fields"]}
+        for key in entry["arrays"]:
+            values, offsets = columns[key]
+            structure[key] = values[offsets[i] : offsets[i + 1]]
+        objects[entry["name"]] = structure
+    return objects
+
+
+def load_city_objects(path):
+    """{name: structure} from a mesh bundle or, for anything else, a CityGML file."""
+    if is_mesh_bundle(path):
+        return load_mesh_bundle(path)
+    import pycitygml
+
+    return pycitygml.load_city_gml(path)
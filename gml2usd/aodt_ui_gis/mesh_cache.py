@@ -0,0 +1,103 @@
+"""
+Cache of cleaned, transformed building meshes.
+
+Before a building is authored the converters transform its vertices to the
+output CRS, merge close vertices, drop duplicate and degenerate triangles and
+compact the index buffer (`clean_city_object`). The result only depends on
+the building's raw mesh and the EPSG pair, so it is cached per source tile:
+
+    <AODT_MESH_CACHE_DIR>/v<CACHE_VERSION>/<epsg_in>_<epsg_out>/<source>.meshbundle
+
+`<source>` is the sha256 of the CityGML tile the building was extracted from.
+The gml2usd mesh store puts it in the "source" field of every object of a
+request bundle; objects without it (plain CityGML input) are always cleaned.
+The cache is filled offline (`create_gml_index.py --mesh-cache` in gml2usd);
+conversions take cached buildings and only clean the misses.
+"""
+
+import os
+
+import geometry_tools
+import mesh_bundle
+
+CACHE_DIR = os.environ.get("AODT_MESH_CACHE_DIR", "")
+# Bump when clean_city_object changes
+CACHE_VERSION = 1
+
+
+def clean_city_object(structure, transform):
+    """Transform and clean one load_city_gml structure in place; returns it."""
+    vertices = structure["vertices"]
+    indices = structure["indices"]
+
+    # coordinate transform
+    vertices[:, 0], vertices[:, 1], vertices[:, 2] = transform.transform(vertices[:, 0], vertices[:, 1], vertices[:, 2])
+
+    # clean up geometry: merge close vertices
+    lut = geometry_tools.collapseVertices(vertices)
+    indices = lut[indices]
+
+    # remove duplicate and degenerate triangles
+    indices, tri_lut = geometry_tools.cleanupTriangleIndices(indices)
+    if "SurfaceTag" in structure:
+        structure["SurfaceTag"] = structure["SurfaceTag"][tri_lut]
+
+    # compact indices and remove unused vertices
+    lut = geometry_tools.compactIndices(indices)
+    vertices = vertices[lut]
+    if "uv" in structure:
+        structure["uv"] = structure["uv"][lut]
+    if "texture_index" in structure:
+        structure["texture_index"] = structure["texture_index"][lut]
+
+    structure["vertices"] = vertices
+    structure["indices"] = indices
+    # compute bounding box
+    structure["lower"] = vertices.min(axis=0)
+    structure["upper"] = vertices.max(axis=0)
+    return structure
+
+
+class MeshCache:
+    """Cleaned meshes for one EPSG pair. Use a fresh instance per conversion:
+    the arrays are copy-on-write maps that the converter modifies in place."""
+
+    def __init__(self, cache_dir, epsg_in, epsg_out):
+        self.root = os.path.join(cache_dir, f"v{CACHE_VERSION}", f"{epsg_in}_{epsg_out}")
+        self._tiles = {}
+
+    def tile_path(self, source):
+        return os.path.join(self.root, source + mesh_bundle.MESH_BUNDLE_SUFFIX)
+
+    def has_tile(self, source):
+        return mesh_bundle.is_mesh_bundle(self.tile_path(source))
+
+    def get(self, name, source):
+        if source not in self._tiles:
+            self._tiles[source] = mesh_bundle.load_mesh_bundle(self.tile_path(source)) if self.has_tile(source) else {}
+        return self._tiles[source].get(name)
+
+    def put_tile(self, source, objects):
+        """Store the cleaned `objects` ({name: structure}) of one source tile."""
+        os.makedirs(self.root, exist_ok=True)
+        mesh_bundle.write_mesh_bundle(self.tile_path(source), objects)
+
+
+def get_mesh_cache(epsg_in, epsg_out):
+    return MeshCache(CACHE_DIR, epsg_in, epsg_out) if CACHE_DIR else None
+
+
+def cleaned_city_objects(data, transform, cache=None):
+    """Yield (name, cleaned structure) for every object of `data`, taking
+    buildings from `cache` when it has them."""
+    hits = 0
+    for name, structure in data.items():
+        source = structure.get("source")
+        cached = cache.get(name, source) if cache is not None and source else None
+        if cached is not None:
+            hits += 1
+            yield name, cached
+        else:
+            yield name, clean_city_object(structure, transform)
+    if cache is not None:
+        print(f"[MeshCache] {hits}/{len(data)} objects from cache")
@@ -0,0 +1,182 @@
+"""
+3D Tiles (1.1) tileset of the converters' building meshes, with per-building LODs.
+
+Buildings are bucketed into `tile_size` metre squares (the same grid as
+`--split`). Every square becomes a chain of three tiles with REPLACE
+refinement, each holding one GLB (written by gltf_writer):
+
+    tile_x_y_box.glb      bounding box of every building (one   geometricError = largest building
+                          merged mesh)
+    tile_x_y_lod1.glb     vertex-clustered on a `lod_cell` grid  geometricError = lod_cell
+    tile_x_y.glb          the meshes as authored to USD          geometricError = 0
+
+so a viewer only fetches the squares in view, and detail only for the near
+ones. Content is Z-up metres relative to the scene centre (GLBs are Y-up as
+glTF requires; 3D Tiles rotates them back). When the scene's geographic
+origin is known, the root transform places that frame as east-north-up at
+the origin on the WGS84 ellipsoid; otherwise the tileset stays local.
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+
+import gltf_writer
+
+DEFAULT_LOD_CELL = 4.0
+
+# WGS84
+_A = 6378137.0
+_E2 = 6.69437999014e-3
+
+# corners of the unit cube (bit 0: x, bit 1: y, bit 2: z) and its outward-facing triangles
+_BOX_CORNERS = np.array([[i & 1, (i >> 1) & 1, (i >> 2) & 1] for i in range(8)], dtype=np.float64)
+_BOX_TRIANGLES = np.array(
+    [
+        [0, 2, 1], [1, 2, 3],  # bottom
+        [4, 5, 6], [5, 7, 6],  # top
+        [0, 1, 4], [1, 5, 4],  # south
+        [2, 6, 3], [3, 6, 7],  # north
+        [0, 4, 2], [2, 4, 6],  # west
+        [1, 3, 5], [3, 7, 5],  # east
+    ],
+    dtype=np.uint32,
+)
+
+
+def cluster_simplify(vertices, indices, cell):
+    """Vertex clustering: vertices in the same `cell` grid cube merge into their
+    mean, triangles that collapse (or duplicate another) are dropped."""
+    vertices = np.asarray(vertices, dtype=np.float64)
+    triangles = np.asarray(indices).reshape(-1, 3)
+    if not len(triangles):
+        return vertices[:0], np.zeros(0, dtype=np.uint32)
+
+    _, cluster = np.unique(np.floor(vertices / cell).astype(np.int64), axis=0, return_inverse=True)
+    cluster = cluster.ravel()
+    counts = np.bincount(cluster)
+    merged = np.stack([np.bincount(cluster, weights=vertices[:, k]) for k in range(3)], axis=1) / counts[:, None]
+
+    triangles = cluster[triangles]
+    keep = (triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & (triangles[:, 0] != triangles[:, 2])
+    triangles = triangles[keep]
+    if len(triangles):
+        _, first = np.unique(np.sort(triangles, axis=1), axis=0, return_index=True)
+        triangles = triangles[np.sort(first)]
+
+    used, remap = np.unique(triangles, return_inverse=True)
+    return merged[used], remap.astype(np.uint32).ravel()
+
+
+def box_mesh(lowers, uppers):
+    """Closed boxes between pairs of corners, merged into one (vertices, indices) mesh."""
+    lowers = np.asarray(lowers, dtype=np.float64).reshape(-1, 1, 3)
+    uppers = np.asarray(uppers, dtype=np.float64).reshape(-1, 1, 3)
+    vertices = (lowers + _BOX_CORNERS * (uppers - lowers)).reshape(-1, 3)
+    offsets = np.arange(len(lowers), dtype=np.uint32)[:, None, None] * len(_BOX_CORNERS)
+    return vertices, (_BOX_TRIANGLES + offsets).ravel()
+
+
+def enu_to_ecef(lon, lat, height=0.0):
+    """Column-major 4x4 placing east-north-up axes at lon/lat (degrees) on the WGS84 ellipsoid."""
+    lon, lat = math.radians(lon), math.radians(lat)
+    sin_lon, cos_lon, sin_lat, cos_lat = math.sin(lon), math.cos(lon), math.sin(lat), math.cos(lat)
+    n = _A / math.sqrt(1 - _E2 * sin_lat * sin_lat)
+    origin = [(n + height) * cos_lat * cos_lon, (n + height) * cos_lat * sin_lon, (n * (1 - _E2) + height) * sin_lat]
+    east = [-sin_lon, cos_lon, 0.0]
+    north = [-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat]
+    up = [cos_lat * cos_lon, cos_lat * sin_lon, sin_lat]
+    return [*east, 0.0, *north, 0.0, *up, 0.0, *origin, 1.0]
+
+
+def _box_volume(lower, upper):
+    center = (np.asarray(lower) + np.asarray(upper)) / 2
+    half = (np.asarray(upper) - np.asarray(lower)) / 2
+    return {"box": [*center.tolist(), half[0], 0, 0, 0, half[1], 0, 0, 0, half[2]]}
+
+
+class TilesetWriter:
+    def __init__(self, path, tile_size, lod_cell=DEFAULT_LOD_CELL, origin=None):
+        """path: output directory (tileset.json + GLBs); origin: (lon, lat, height) of the scene centre or None."""
+        self.path = path
+        self.tile_size = tile_size
+        self.lod_cell = lod_cell
+        self.origin = origin
+        self.tiles = {}  # (i, j) -> [(name, vertices, indices, lower, upper)]
+
+    def add_building(self, name, vertices, indices, lower, upper):
+        if len(indices) < 3:
+            return
+        center = 0.5 * (np.asarray(lower) + np.asarray(upper))
+        key = int(np.floor(center[0] / self.tile_size)), int(np.floor(center[1] / self.tile_size))
+        self.tiles.setdefault(key, []).append((name, vertices, indices, np.asarray(lower), np.asarray(upper)))
+
+    def _write_glb(self, file_name, meshes):
+        writer = gltf_writer.GltfWriter(os.path.join(self.path, file_name), y_up=True)
+        for name, vertices, indices in meshes:
+            writer.add_mesh("buildings", name, vertices, indices)
+        return writer.write()[0]
+
+    def write(self):
+        """Write the GLBs and tileset.json; returns every written path."""
+        os.makedirs(self.path, exist_ok=True)
+        written = []
+        children = []
+        all_lower = np.full(3, np.inf)
+        all_upper = np.full(3, -np.inf)
+        box_error = self.lod_cell
+        for key in sorted(self.tiles):
+            buildings = self.tiles[key]
+            lower = np.min([b[3] for b in buildings], axis=0)
+            upper = np.max([b[4] for b in buildings], axis=0)
+            all_lower, all_upper = np.minimum(all_lower, lower), np.maximum(all_upper, upper)
+            tile_error = max(self.lod_cell, float(max((b[4] - b[3]).max() for b in buildings)))
+            box_error = max(box_error, tile_error)
+
+            name = ("tile_%d_%d" % key).replace("-", "m")
+            boxes = box_mesh([b[3] for b in buildings], [b[4] for b in buildings])
+            written.append(self._write_glb(name + "_box.glb", [("boxes", *boxes)]))
+            written.append(self._write_glb(
+                name + "_lod1.glb", [(b[0], *cluster_simplify(b[1], b[2], self.lod_cell)) for b in buildings]
+            ))
+            written.append(self._write_glb(name + ".glb", [(b[0], b[1], b[2]) for b in buildings]))
+
+            volume = _box_volume(lower, upper)
+            children.append({
+                "boundingVolume": volume,
+                "geometricError": tile_error,
+                "content": {"uri": name + "_box.glb"},
+                "children": [{
+                    "boundingVolume": volume,
+                    "geometricError": self.lod_cell,
+                    "content": {"uri": name + "_lod1.glb"},
+                    "children": [{
+                        "boundingVolume": volume,
+                        "geometricError": 0,
+                        "content": {"uri": name + ".glb"},
+                    }],
+                }],
+            })
+
+        if not children:
+            all_lower = all_upper = np.zeros(3)
+        root = {
+            "boundingVolume": _box_volume(all_lower, all_upper),
+            "geometricError": box_error,
+            "refine": "REPLACE",
+            "children": children,
+        }
+        if self.origin is not None:
+            root["transform"] = enu_to_ecef(*self.origin)
+        tileset = {
+            "asset": {"version": "1.1", "generator": "aodt_pipeline"},
+            # error of showing nothing at all: the whole area
+            "geometricError": max(box_error, float(np.linalg.norm(all_upper - all_lower))),
+            "root": root,
+        }
+        tileset_path = os.path.join(self.path, "tileset.json")
+        with open(tileset_path, "w", encoding="utf-8") as f:
+            json.dump(tileset, f, separators=(",", ":"))
+        return [tileset_path, *written]
@@ -10,7 +10,7 @@ import subprocess
 import os
 from pxr import Usd, UsdGeom, UsdShade, Vt
 import numpy
-from material_defaults import default_material_map
+from material_defaults import default_material_tags
 from area import area
 
 
@@ -120,7 +120,6 @@ def add_default_materials(usd):
 
     for prim in stage.Traverse():
         if prim.IsA(UsdGeom.Mesh):
-            vertices = UsdGeom.Mesh(prim).GetPointsAttr().Get()
             SurfaceTag = UsdGeom.PrimvarsAPI(prim).GetPrimvar("SurfaceTag")
             MaterialTag = UsdGeom.PrimvarsAPI(prim).GetPrimvar("MaterialTag")
             if SurfaceTag and MaterialTag:
@@ -137,7 +136,6 @@ def add_default_materials_to_stage(stage):
 
     for prim in stage.Traverse():
         if prim.IsA(UsdGeom.Mesh):
-            vertices = UsdGeom.Mesh(prim).GetPointsAttr().Get()
             SurfaceTag = UsdGeom.PrimvarsAPI(prim).GetPrimvar("SurfaceTag")
             MaterialTag = UsdGeom.PrimvarsAPI(prim).GetPrimvar("MaterialTag")
             if SurfaceTag and MaterialTag:
@@ -203,13 +201,7 @@ def convert_np_to_vt(array: numpy.ndarray) -> Vt.IntArray:
 
 
 def material_tag_from_surface_tag(surface_tag):
-    material_tag_np = convert_vt_to_np(surface_tag)
-
-    for row in default_material_map:
-        st_id = row[0]
-        st_name = row[1]
-        default_material = row[2]
-        material_tag_np[material_tag_np == st_id] = default_material
+    material_tag_np = default_material_tags(convert_vt_to_np(surface_tag))
 
     material_tag = convert_np_to_vt(material_tag_np)
 
@@ -0,0 +1,325 @@
+"""Pool of long-lived converter processes for the citygml2aodt scripts.
+
+Running `python3 /opt/aodt_ui_gis/<script>` per conversion re-imports pxr,
+pycitygml, geometry_tools and tessellation_tools (and rebuilds the pyproj
+transformers) every time. Instead, each pool worker is a spawned process that
+imports that stack once and then runs `<script>.main(argv)` for every job.
+
+Workers are isolated processes, so a native crash (e.g. a segfault in the
+cutting routines) only kills that worker; it is replaced and the job fails
+with a ConversionError like a non-zero exit of the old subprocess.
+
+Workers are recycled after `max_jobs` jobs or when their RSS has grown by
+more than `max_rss_growth_mb` since warm-up, and killed when a job exceeds
+its timeout. A caller that finds no idle worker within the acquire timeout
+gets a ConverterTimeout instead of waiting forever.
+
+Every gunicorn worker has its own pool, so the container holds
+(gunicorn workers) x CONVERTER_POOL_SIZE warm converters, 4 x 1 with the
+Dockerfile defaults. Each one is a full pxr / pycitygml / geometry stack,
+and while it converts it can start AODT_BUILDING_WORKERS more processes.
+Size CONVERTER_POOL_SIZE (and AODT_BUILDING_WORKERS) against the gunicorn
+worker count and the container's memory, not the CPU count alone.
+
+Configuration (environment):
+    CONVERTER_POOL_SIZE            workers per API process (0 disables the pool)
+    CONVERTER_JOB_TIMEOUT          seconds per conversion
+    CONVERTER_ACQUIRE_TIMEOUT      seconds to wait for an idle worker
+    CONVERTER_MAX_JOBS             jobs before a worker is recycled
+    CONVERTER_MAX_RSS_GROWTH_MB    RSS growth before a worker is recycled
+    AODT_BUILDING_WORKERS          slicing processes per conversion (see
+                                   aodt_ui_gis/building_pool.py)
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import importlib
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+SCRIPT_DIR = os.environ.get("AODT_UI_GIS_DIR", "/opt/aodt_ui_gis")
+
+POOL_SIZE = int(os.environ.get("CONVERTER_POOL_SIZE", "1"))
+JOB_TIMEOUT = float(os.environ.get("CONVERTER_JOB_TIMEOUT", "540"))
+ACQUIRE_TIMEOUT = float(os.environ.get("CONVERTER_ACQUIRE_TIMEOUT", "600"))
+MAX_JOBS = int(os.environ.get("CONVERTER_MAX_JOBS", "50"))
+MAX_RSS_GROWTH_MB = float(os.environ.get("CONVERTER_MAX_RSS_GROWTH_MB", "2048"))
+
+# Imported by every worker before it reports ready.
+PRELOAD_MODULES = (
+    "numpy",
+    "pyproj",
+    "pxr.Usd",
+    "pxr.UsdGeom",
+    "pxr.UsdShade",
+    "pycitygml",
+    "geometry_tools",
+    "tessellation_tools",
+    "aodt_usd",
+    "aodt_pipeline",
+    "building_pool",
+    "footprint",
+    "gltf_writer",
+    "mesh_bundle",
+    "mesh_cache",
+    "tileset_writer",
+    "utils",
+)
+
+# Scripts that expose main(argv); anything else runs as a subprocess.
+POOLED_SCRIPTS = frozenset({
+    "citygml2aodt.py",
+    "citygml2aodt_indoor.py",
+    "citygml2aodt_indoor_groundplane_domain.py",
+    "usd2usd.py",
+})
+
+
+class ConverterTimeout(RuntimeError):
+    pass
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _worker_main(conn, script_dir: str, preload: tuple[str, ...]) -> None:
+    """Worker loop: import the USD stack once, then run jobs until told to stop."""
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    try:
+        for name in preload:
+            importlib.import_module(name)
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+        return
+    conn.send(("ready", _current_rss_mb()))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        script_name, argv = job
+        stdout, stderr = io.StringIO(), io.StringIO()
+        returncode = 0
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                module = importlib.import_module(os.path.splitext(script_name)[0])
+                module.main(argv)
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                if e.code is not None and not isinstance(e.code, int):
+                    print(e.code, file=sys.stderr)
+            except BaseException:
+                returncode = 1
+                traceback.print_exc()
+        conn.send((returncode, stdout.getvalue(), stderr.getvalue(), _current_rss_mb()))
+
+
+class _Worker:
+    def __init__(self, ctx, script_dir: str, preload: tuple[str, ...]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, script_dir, preload),
+            name="aodt-converter",
+            # not daemonic: conversions may start their own building_pool
+            # processes; close() (registered atexit) stops the workers
+            daemon=False,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.baseline_rss_mb = 0.0
+        self.jobs = 0
+
+    def wait_ready(self, timeout: float) -> None:
+        if self.ready:
+            return
+        if not self.conn.poll(timeout):
+            raise ConverterTimeout(f"converter worker did not start within {timeout:.0f}s")
+        status, detail = self.conn.recv()
+        if status != "ready":
+            raise RuntimeError(f"converter worker failed to start:\n{detail}")
+        self.ready = True
+        self.baseline_rss_mb = detail
+
+    def stop(self, timeout: float = 5.0) -> None:
+        try:
+            if self.process.is_alive():
+                self.conn.send(None)
+                self.process.join(timeout)
+        except (OSError, EOFError, BrokenPipeError):
+            pass
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+
+class ConverterPool:
+    """Fixed-size pool of warm converter processes.
+
+    `run()` is thread-safe: callers block until a worker is idle (at most
+    `acquire_timeout` seconds). Replacement workers are started immediately
+    and warm up in the background.
+    """
+
+    def __init__(
+        self,
+        size: int = POOL_SIZE,
+        *,
+        script_dir: str = SCRIPT_DIR,
+        max_jobs: int = MAX_JOBS,
+        max_rss_growth_mb: float = MAX_RSS_GROWTH_MB,
+        startup_timeout: float = 120.0,
+        acquire_timeout: float = ACQUIRE_TIMEOUT,
+        preload: tuple[str, ...] = PRELOAD_MODULES,
+    ):
+        self.size = max(1, int(size))
+        self.script_dir = script_dir
+        self.max_jobs = max_jobs
+        self.max_rss_growth_mb = max_rss_growth_mb
+        self.startup_timeout = startup_timeout
+        self.acquire_timeout = acquire_timeout
+        self.preload = preload
+        # spawn: the USD stack is not fork-safe, and the workers must not inherit
+        # the gunicorn worker's sockets/threads.
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._workers: set[_Worker] = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._ctx, self.script_dir, self.preload)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker: _Worker, *, kill: bool = False) -> None:
+        with self._lock:
+            self._workers.discard(worker)
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+
+    def run(self, script_name: str, argv: list[str], timeout: float | None = JOB_TIMEOUT) -> tuple[int, str, str]:
+        """Run `<script_name>.main(argv)` in a warm worker.
+
+        Returns (returncode, stdout, stderr) like subprocess.run. Raises
+        ConverterTimeout when the job exceeds `timeout` seconds (the worker is
+        killed and replaced), or when no worker becomes idle within the
+        acquire timeout.
+        """
+        if self._closed:
+            raise RuntimeError("converter pool is closed")
+
+        try:
+            worker = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise ConverterTimeout(f"no idle converter worker within {self.acquire_timeout:.0f}s") from None
+        replacement = worker
+        try:
+            if not worker.process.is_alive():
+                self._retire(worker, kill=True)
+                worker = replacement = self._spawn()
+            worker.wait_ready(self.startup_timeout)
+
+            start = time.monotonic()
+            worker.conn.send((script_name, list(argv)))
+            if not worker.conn.poll(timeout):
+                self._retire(worker, kill=True)
+                replacement = self._spawn()
+                raise ConverterTimeout(f"{script_name} exceeded {timeout:.0f}s; worker killed")
+            try:
+                returncode, stdout, stderr, rss_mb = worker.conn.recv()
+            except EOFError:
+                # Native crash inside the worker: report it like a failed subprocess.
+                worker.process.join(1)
+                exitcode = worker.process.exitcode
+                self._retire(worker, kill=True)
+                replacement = self._spawn()
+                return (exitcode if exitcode is not None else -1), "", f"converter worker died (exitcode={exitcode})"
+
+            worker.jobs += 1
+            logger.info(
+                "Converter job %s finished in %.1fs (rc=%s, worker pid=%s, jobs=%d, rss=%.0fMB)",
+                script_name, time.monotonic() - start, returncode, worker.process.pid, worker.jobs, rss_mb,
+            )
+            growth = rss_mb - worker.baseline_rss_mb
+            if worker.jobs >= self.max_jobs or growth > self.max_rss_growth_mb:
+                logger.info(
+                    "Recycling converter worker pid=%s after %d jobs (RSS +%.0fMB)",
+                    worker.process.pid, worker.jobs, growth,
+                )
+                self._retire(worker)
+                replacement = self._spawn()
+            return returncode, stdout, stderr
+        except BaseException:
+            if replacement is worker and not worker.process.is_alive():
+                self._retire(worker, kill=True)
+                replacement = self._spawn()
+            raise
+        finally:
+            self._idle.put(replacement)
+
+    def close(self) -> None:
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+_POOL: ConverterPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_converter_pool() -> ConverterPool | None:
+    """Return this process's converter pool (created on first use), or None
+    when the pool is disabled with CONVERTER_POOL_SIZE=0.
+
+    The pool is per process: each gunicorn worker starts its own
+    CONVERTER_POOL_SIZE warm converters (see the module docstring for the
+    memory this costs).
+    """
+    global _POOL
+    if POOL_SIZE <= 0:
+        return None
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ConverterPool(POOL_SIZE)
+                atexit.register(_POOL.close)
+    return _POOL
@@ -1,5 +1,6 @@
 import os
 import csv
+import argparse
 import xml.etree.ElementTree as ET
 
 def extract_bounding_box_from_gml(gml_file_path):
@@ -30,18 +31,8 @@ def extract_bounding_box_from_gml(gml_file_path):
     except ET.ParseError:
         return None, None
 
-def main():
-    # 三個放置 GML 檔案的資料夾（Windows 路徑記得使用 r'' raw string 或替換成兩條反斜線 \\）
-    directories = [
-        r"C:\Users\zihao\Desktop\台固\三維建物圖資\融合版GML\111_E_BUILD\gml",
-        r"C:\Users\zihao\Desktop\台固\三維建物圖資\融合版GML\111_F_BUILD\gml",
-        r"C:\Users\zihao\Desktop\台固\三維建物圖資\融合版GML\112_O_OK\gml"
-    ]
-
-    # 輸出的 CSV 檔案名稱
-    output_csv = "gml_bounding_boxes.csv"
-
-    # 先蒐集所有 .gml 檔案，才可預先知道總數來顯示進度
+def collect_gml_files(directories):
+    """蒐集資料夾底下所有 .gml 檔案"""
     gml_files = []
     for directory in directories:
         if os.path.isdir(directory):
@@ -51,9 +42,11 @@ def main():
                         gml_files.append(os.path.join(root_dir, file_name))
         else:
             print(f"資料夾不存在或路徑錯誤: {directory}")
+    return gml_files
 
+def write_bounding_box_csv(gml_files, output_csv):
+    """將每個 GML 檔案的 boundedBy 寫入 CSV"""
     total_files = len(gml_files)
-    print(f"找到 {total_files} 個 GML 檔案，開始解析...")
 
     # 開啟 CSV，寫入標頭
     with open(output_csv, mode='w', newline='', encoding='utf-8') as csvfile:
@@ -75,5 +68,84 @@ def main():
     print("所有檔案處理完成，CSV 寫入完成！")
     print(f"輸出檔案：{output_csv}")
 
+def write_building_index(gml_files, index_dir):
+    """建立建物層級索引（建物 ID、2D 邊界、最低 z 值、來源檔案與位元組範圍）"""
+    from gml_building_index import build_building_index
+
+    def progress(idx, total, gml_path, count, reused):
+        status = "未變更，沿用索引" if reused else "已索引"
+        print(f"[{idx}/{total}] {status}：{os.path.basename(gml_path)}（{count} 棟建物）")
+
+    index = build_building_index(gml_files, index_dir, progress=progress)
+    print(f"建物索引建立完成，共 {len(index)} 棟建物")
+    print(f"輸出資料夾：{index_dir}")
+
+def write_mesh_store(gml_files, store_dir):
+    """建立每個 tile 地面建物的網格快取（需 pycitygml，請在 gml2usd 容器內執行）"""
+    from gml_mesh_store import build_mesh_store
+
+    def progress(idx, total, gml_path, count, reused):
+        status = "未變更，沿用網格" if reused else "已建立網格"
+        print(f"[{idx}/{total}] {status}：{os.path.basename(gml_path)}（{count} 棟建物）")
+
+    store = build_mesh_store(gml_files, store_dir, progress=progress)
+    print(f"網格快取建立完成，共 {len(store.tiles)} 個 tile")
+    print(f"輸出資料夾：{store_dir}")
+
+def write_mesh_cache(store_dir, epsg_pair, cache_dir):
+    """由網格快取產生轉換器使用的已清理網格（座標轉換、合併頂點、移除退化三角形）"""
+    from gml_mesh_store import MeshStore, build_mesh_cache
+
+    epsg_in, _, epsg_out = epsg_pair.partition(":")
+
+    def progress(idx, total, filename, count, cached):
+        status = "已存在，略過" if cached else "已清理"
+        print(f"[{idx}/{total}] {status}：{filename}（{count} 棟建物）")
+
+    written = build_mesh_cache(MeshStore.load(store_dir), epsg_in, epsg_out, cache_dir, progress=progress)
+    print(f"已清理網格建立完成（EPSG:{epsg_in} -> EPSG:{epsg_out}），新增 {written} 個 tile")
+    print(f"輸出資料夾：{cache_dir}（轉換器需設定 AODT_MESH_CACHE_DIR 指向此處）")
+
+def main():
+    # 三個放置 GML 檔案的資料夾（Windows 路徑記得使用 r'' raw string 或替換成兩條反斜線 \\）
+    directories = [
+        r"C:\Users\zihao\Desktop\台固\三維建物圖資\融合版GML\111_E_BUILD\gml",
+        r"C:\Users\zihao\Desktop\台固\三維建物圖資\融合版GML\111_F_BUILD\gml",
+        r"C:\Users\zihao\Desktop\台固\三維建物圖資\融合版GML\112_O_OK\gml"
+    ]
+
+    parser = argparse.ArgumentParser(description="建立 GML 檔案邊界 CSV 與建物索引")
+    parser.add_argument("--dirs", nargs="+", default=directories, help="放置 GML 檔案的資料夾")
+    # 輸出的 CSV 檔案名稱
+    parser.add_argument("--output", default="gml_bounding_boxes.csv", help="輸出的 CSV 檔案")
+    parser.add_argument("--building-index", nargs="?", const="gml_index/buildings", default=None,
+                        metavar="DIR", help="同時建立建物層級索引（預設輸出到 gml_index/buildings）")
+    parser.add_argument("--mesh-store", nargs="?", const="gml_index/meshes", default=None,
+                        metavar="DIR", help="同時建立地面建物的網格快取（預設輸出到 gml_index/meshes）")
+    parser.add_argument("--mesh-cache", default=None, metavar="EPSG_IN:EPSG_OUT",
+                        help="由網格快取產生轉換器的已清理網格，例如 3826:32654")
+    parser.add_argument("--mesh-cache-dir", default="gml_index/mesh_cache", metavar="DIR",
+                        help="已清理網格的輸出資料夾（預設 gml_index/mesh_cache）")
+    parser.add_argument("--skip-csv", action="store_true", help="不重新產生 CSV（只建立建物索引）")
+    args = parser.parse_args()
+
+    # 先蒐集所有 .gml 檔案，才可預先知道總數來顯示進度
+    gml_files = collect_gml_files(args.dirs)
+
+    total_files = len(gml_files)
+    print(f"找到 {total_files} 個 GML 檔案，開始解析...")
+
+    if not args.skip_csv:
+        write_bounding_box_csv(gml_files, args.output)
+
+    if args.building_index:
+        write_building_index(gml_files, args.building_index)
+
+    if args.mesh_store:
+        write_mesh_store(gml_files, args.mesh_store)
+
+    if args.mesh_cache:
+        write_mesh_cache(args.mesh_store or "gml_index/meshes", args.mesh_cache, args.mesh_cache_dir)
+
 if __name__ == "__main__":
     main()
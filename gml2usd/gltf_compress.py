@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Size reduction for glTF/GLB outputs, done offline on the written files.
+
+Modes (`COMPRESSION_MODES`):
+- "none":     leave the file as written.
+- "quantize": KHR_mesh_quantization -- positions as int16 (dequantized by a
+              per-mesh node transform), normals/tangents as normalized
+              int8, [0, 1] texcoords as normalized uint16 -- plus 16-bit
+              indices wherever every index fits.
+- "meshopt":  "quantize", then every mesh buffer view is encoded with
+              EXT_meshopt_compression (needs the `meshoptimizer` package).
+
+Mesh data is rewritten into tightly packed views; anything else that lives in
+a buffer (images, animation or skin accessors) is copied over unchanged.
+Meshes with morph targets or skins, and accessors shared between meshes or
+with other glTF objects, are not quantized.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import struct
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+COMPRESSION_MODES = ("none", "quantize", "meshopt")
+
+KHR_MESH_QUANTIZATION = "KHR_mesh_quantization"
+EXT_MESHOPT_COMPRESSION = "EXT_meshopt_compression"
+
+_BYTE = 5120
+_UNSIGNED_BYTE = 5121
+_SHORT = 5122
+_UNSIGNED_SHORT = 5123
+_UNSIGNED_INT = 5125
+_FLOAT = 5126
+_ARRAY_BUFFER = 34962
+_ELEMENT_ARRAY_BUFFER = 34963
+_TRIANGLES = 4
+
+_COMPONENT_DTYPES = {
+    _BYTE: np.dtype(np.int8),
+    _UNSIGNED_BYTE: np.dtype(np.uint8),
+    _SHORT: np.dtype(np.int16),
+    _UNSIGNED_SHORT: np.dtype(np.uint16),
+    _UNSIGNED_INT: np.dtype(np.uint32),
+    _FLOAT: np.dtype(np.float32),
+}
+_TYPE_SIZES = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT2": 4, "MAT3": 9, "MAT4": 16}
+
+_GLB_MAGIC = 0x46546C67
+_GLB_JSON = 0x4E4F534A
+_GLB_BIN = 0x004E4942
+
+# largest int16 magnitude used for positions (keeps the range symmetric)
+_POSITION_RANGE = 32767
+
+
+def _normalize_mode(mode: str | None) -> str:
+    mode = (mode or "none").strip().lower()
+    if mode not in COMPRESSION_MODES:
+        raise ValueError(f"Unknown glTF compression mode {mode!r}; expected one of {', '.join(COMPRESSION_MODES)}")
+    return mode
+
+
+def _read_accessor(doc: dict, buffers: list[bytes], index: int) -> np.ndarray | None:
+    """Accessor data as a (count, components) array, or None if it can't be read plainly."""
+    acc = doc["accessors"][index]
+    if "bufferView" not in acc or "sparse" in acc:
+        return None
+    dtype = _COMPONENT_DTYPES[acc["componentType"]]
+    components = _TYPE_SIZES[acc["type"]]
+    view = doc["bufferViews"][acc["bufferView"]]
+    item_size = dtype.itemsize * components
+    stride = view.get("byteStride") or item_size
+    offset = view.get("byteOffset", 0) + acc.get("byteOffset", 0)
+    count = acc["count"]
+    if count == 0:
+        return np.zeros((0, components), dtype=dtype)
+    data = buffers[view["buffer"]]
+    return np.ndarray(
+        (count, components), dtype=dtype, buffer=data, offset=offset, strides=(stride, dtype.itemsize)
+    ).copy()
+
+
+class _BufferBuilder:
+    """Appends 4-byte aligned chunks to the output buffer."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def add(self, data: bytes) -> int:
+        pad = -self.size % 4
+        if pad:
+            self.chunks.append(b"\0" * pad)
+            self.size += pad
+        offset = self.size
+        self.chunks.append(data)
+        self.size += len(data)
+        return offset
+
+    def getvalue(self) -> bytes:
+        pad = -self.size % 4
+        return b"".join(self.chunks) + b"\0" * pad
+
+
+class _Stream:
+    """A rewritten accessor: the new element array plus how to store it."""
+
+    def __init__(self, array: np.ndarray, accessor: dict, target: int, *, quantized: bool = False, mode: int = _TRIANGLES):
+        self.array = np.ascontiguousarray(array)
+        self.accessor = accessor
+        self.target = target
+        self.quantized = quantized
+        self.mode = mode  # primitive mode, for index streams
+
+    @property
+    def layout(self):
+        """Streams with the same layout can share one buffer view."""
+        triangles = self.target == _ELEMENT_ARRAY_BUFFER and self.mode == _TRIANGLES and len(self.array) % 3 == 0
+        return self.target, self.array.dtype.str, self.array.shape[1], triangles
+
+
+def _pad_components(array: np.ndarray, components: int) -> np.ndarray:
+    """Zero-pad vertices to `components`; attribute strides must be multiples of 4 bytes."""
+    if array.shape[1] == components:
+        return array
+    padded = np.zeros((len(array), components), dtype=array.dtype)
+    padded[:, : array.shape[1]] = array
+    return padded
+
+
+def _attribute_stream(semantic: str, data: np.ndarray, acc: dict, origin, scale) -> _Stream:
+    """Quantize one vertex attribute when KHR_mesh_quantization has a smaller type for it."""
+    is_float = acc["componentType"] == _FLOAT
+    fields = {k: v for k, v in acc.items() if k not in {"bufferView", "byteOffset", "min", "max"}}
+
+    if semantic == "POSITION" and is_float and origin is not None:
+        q = np.rint((data.astype(np.float64) - origin) / scale).astype(np.int16)
+        fields.pop("normalized", None)
+        fields.update(componentType=_SHORT, min=q.min(axis=0).tolist(), max=q.max(axis=0).tolist())
+        return _Stream(_pad_components(q, 4), fields, _ARRAY_BUFFER, quantized=True)
+
+    if semantic in ("NORMAL", "TANGENT") and is_float:
+        q = np.rint(np.clip(data, -1.0, 1.0) * 127.0).astype(np.int8)
+        fields.update(componentType=_BYTE, normalized=True)
+        return _Stream(_pad_components(q, 4), fields, _ARRAY_BUFFER, quantized=True)
+
+    if semantic.startswith("TEXCOORD_") and is_float and len(data) and data.min() >= 0.0 and data.max() <= 1.0:
+        q = np.rint(data * 65535.0).astype(np.uint16)
+        fields.update(componentType=_UNSIGNED_SHORT, normalized=True)
+        return _Stream(q, fields, _ARRAY_BUFFER, quantized=True)
+
+    # keep the type; only repack tightly (padded to 4 bytes per vertex)
+    if "min" in acc and len(data):
+        fields.update(min=data.min(axis=0).tolist(), max=data.max(axis=0).tolist())
+    components = -(-data.shape[1] * data.dtype.itemsize // 4) * 4 // data.dtype.itemsize
+    return _Stream(_pad_components(data, components), fields, _ARRAY_BUFFER)
+
+
+def _index_stream(data: np.ndarray, acc: dict, mode: int) -> _Stream:
+    """Indices as uint16 when every value fits (65535 is reserved for primitive restart)."""
+    indices = data.ravel()
+    dtype = np.uint16 if len(indices) == 0 or int(indices.max()) < 0xFFFF else np.uint32
+    fields = {k: v for k, v in acc.items() if k not in {"bufferView", "byteOffset", "min", "max"}}
+    fields["componentType"] = _UNSIGNED_SHORT if dtype == np.uint16 else _UNSIGNED_INT
+    return _Stream(indices.astype(dtype).reshape(-1, 1), fields, _ELEMENT_ARRAY_BUFFER, mode=mode)
+
+
+def _mesh_usage(doc: dict):
+    """Which meshes/primitives use each accessor, and which accessors anything else uses."""
+    meshes_by_accessor = defaultdict(set)
+    primitive_uses = defaultdict(int)
+    for m, mesh in enumerate(doc.get("meshes", [])):
+        for primitive in mesh.get("primitives", []):
+            used = set(primitive.get("attributes", {}).values())
+            if "indices" in primitive:
+                used.add(primitive["indices"])
+            for target in primitive.get("targets", []):
+                used.update(target.values())
+            for index in used:
+                meshes_by_accessor[index].add(m)
+                primitive_uses[index] += 1
+
+    foreign = set()
+    for skin in doc.get("skins", []):
+        if "inverseBindMatrices" in skin:
+            foreign.add(skin["inverseBindMatrices"])
+    for animation in doc.get("animations", []):
+        for sampler in animation.get("samplers", []):
+            foreign.update((sampler.get("input"), sampler.get("output")))
+    return meshes_by_accessor, primitive_uses, foreign
+
+
+def _optimize_primitive(indices: np.ndarray, attributes: dict[str, np.ndarray], vertex_count: int):
+    """Reorder triangles for the vertex cache and vertices for fetch order (improves meshopt ratios)."""
+    import meshoptimizer
+
+    indices = np.ascontiguousarray(indices.ravel(), dtype=np.uint32)
+    optimized = np.empty_like(indices)
+    meshoptimizer.optimize_vertex_cache(optimized, indices, len(indices), vertex_count)
+    if attributes is None:
+        return optimized, None
+
+    remap = np.empty(vertex_count, dtype=np.uint32)
+    unique = meshoptimizer.optimize_vertex_fetch_remap(remap, optimized, len(optimized), vertex_count)
+    # unreferenced vertices map to ~0 and are dropped
+    used = remap != 0xFFFFFFFF
+    reordered = {}
+    for semantic, data in attributes.items():
+        out = np.zeros((unique, data.shape[1]), dtype=data.dtype)
+        out[remap[used]] = data[used]
+        reordered[semantic] = out
+    return remap[optimized], reordered
+
+
+def _encode_view(raw: np.ndarray, target: int, triangles: bool) -> tuple[bytes, dict]:
+    """EXT_meshopt_compression payload and extension fields for one buffer view."""
+    import meshoptimizer
+
+    # EXT_meshopt_compression is defined for vertex codec version 0 and index codec version 1
+    meshoptimizer.encode_vertex_version(0)
+    meshoptimizer.encode_index_version(1)
+    if target == _ELEMENT_ARRAY_BUFFER:
+        indices = raw.ravel().astype(np.uint32)
+        vertex_count = int(indices.max()) + 1 if len(indices) else 0
+        if triangles:
+            encoded = meshoptimizer.encode_index_buffer(indices, len(indices), vertex_count)
+        else:
+            encoded = meshoptimizer.encode_index_sequence(indices, len(indices), vertex_count)
+        return encoded, {"mode": "TRIANGLES" if triangles else "INDICES", "byteStride": raw.dtype.itemsize}
+    vertex_size = raw.shape[1] * raw.dtype.itemsize
+    encoded = meshoptimizer.encode_vertex_buffer(raw.view(np.uint8).reshape(len(raw), vertex_size), len(raw), vertex_size)
+    return encoded, {"mode": "ATTRIBUTES", "byteStride": vertex_size}
+
+
+def compress_gltf(doc: dict, buffers: list[bytes], mode: str) -> tuple[dict, bytes]:
+    """Rewrite a parsed glTF document and its buffer contents.
+
+    Returns the new document and the contents of its single (binary) buffer;
+    the caller sets `buffers[0].uri` or stores the bytes as a GLB chunk.
+    """
+    mode = _normalize_mode(mode)
+    meshopt = mode == "meshopt"
+    if meshopt:
+        import meshoptimizer  # noqa: F401  (fail before rewriting anything)
+
+    doc = json.loads(json.dumps(doc))
+    accessors = doc.get("accessors", [])
+    meshes_by_accessor, primitive_uses, foreign = _mesh_usage(doc)
+    skinned = {node["mesh"] for node in doc.get("nodes", []) if "mesh" in node and "skin" in node}
+
+    def exclusive(index, mesh_index):
+        return (
+            meshes_by_accessor[index] == {mesh_index}
+            and index not in foreign
+            and "sparse" not in accessors[index]
+            and "bufferView" in accessors[index]
+        )
+
+    streams = {}  # accessor index -> _Stream
+    dequantize = {}  # mesh index -> (origin, scale)
+    for m, mesh in enumerate(doc.get("meshes", [])):
+        primitives = mesh.get("primitives", [])
+        quantizable = (
+            m not in skinned
+            and all("targets" not in p for p in primitives)
+            and all(exclusive(i, m) for p in primitives for i in p.get("attributes", {}).values())
+        )
+        if quantizable:
+            positions = [_read_accessor(doc, buffers, p["attributes"]["POSITION"]) for p in primitives
+                         if "POSITION" in p.get("attributes", {})]
+            positions = [p for p in positions if p is not None and len(p)]
+            if positions and all(
+                accessors[p["attributes"]["POSITION"]]["componentType"] == _FLOAT
+                for p in primitives if "POSITION" in p.get("attributes", {})
+            ):
+                lower = np.min([p.min(axis=0) for p in positions], axis=0).astype(np.float64)
+                upper = np.max([p.max(axis=0) for p in positions], axis=0).astype(np.float64)
+                # rounded so the node translation stays short in the JSON
+                origin = np.round((lower + upper) / 2, 4)
+                # uniform scale keeps normals correct under the dequantization transform
+                scale = float(np.maximum(upper - origin, origin - lower).max() / _POSITION_RANGE) or 1.0
+                dequantize[m] = (origin, scale)
+
+        for primitive in primitives:
+            attributes = primitive.get("attributes", {})
+            index = primitive.get("indices")
+            indices = None
+            if index is not None and index not in streams and exclusive(index, m):
+                indices = _read_accessor(doc, buffers, index)
+
+            data = None
+            if quantizable:
+                data = {semantic: _read_accessor(doc, buffers, i) for semantic, i in attributes.items()}
+                if any(d is None for d in data.values()):
+                    data = None
+
+            if meshopt and indices is not None and primitive.get("mode", _TRIANGLES) == _TRIANGLES and len(indices) % 3 == 0 and len(indices):
+                own_vertices = data is not None and all(primitive_uses[i] == 1 for i in [index, *attributes.values()])
+                vertex_count = accessors[next(iter(attributes.values()))]["count"] if attributes else 0
+                if vertex_count and int(indices.max()) < vertex_count:
+                    indices, reordered = _optimize_primitive(indices, data if own_vertices else None, vertex_count)
+                    if reordered is not None:
+                        data = reordered
+
+            if data is not None:
+                origin, scale = dequantize.get(m, (None, None))
+                for semantic, i in attributes.items():
+                    if i not in streams:
+                        streams[i] = _attribute_stream(semantic, data[semantic], accessors[i], origin, scale)
+                        streams[i].accessor["count"] = len(data[semantic])
+            if indices is not None:
+                streams[index] = _index_stream(indices, accessors[index], primitive.get("mode", _TRIANGLES))
+
+    # --- write the new buffer -------------------------------------------------
+    out = _BufferBuilder()
+    fallback_size = 0  # EXT_meshopt_compression: decoded views live in a buffer without data
+    old_views = doc.get("bufferViews", [])
+    views = []
+    copied = {}
+
+    def copy_view(view_index):
+        if view_index not in copied:
+            view = dict(old_views[view_index])
+            start = view.get("byteOffset", 0)
+            data = buffers[view["buffer"]][start:start + view["byteLength"]]
+            view.update(buffer=0, byteOffset=out.add(bytes(data)))
+            copied[view_index] = len(views)
+            views.append(view)
+        return copied[view_index]
+
+    for i, acc in enumerate(accessors):
+        if i in streams:
+            continue
+        if "bufferView" in acc:
+            acc["bufferView"] = copy_view(acc["bufferView"])
+        sparse = acc.get("sparse")
+        if sparse:
+            sparse["indices"]["bufferView"] = copy_view(sparse["indices"]["bufferView"])
+            sparse["values"]["bufferView"] = copy_view(sparse["values"]["bufferView"])
+
+    # one view per stream layout instead of per accessor: city meshes are small and
+    # numerous, so per-accessor views would cost more JSON than they hold in data
+    groups = defaultdict(list)
+    for i in sorted(streams):
+        groups[streams[i].layout].append(i)
+    for (target, _, _, triangles), members in groups.items():
+        offset = 0
+        for i in members:
+            accessors[i] = streams[i].accessor
+            accessors[i]["bufferView"] = len(views)
+            if offset:
+                accessors[i]["byteOffset"] = offset
+            offset += streams[i].array.nbytes
+
+        raw = np.concatenate([streams[i].array for i in members])
+        view = {"byteLength": raw.nbytes, "target": target}
+        if target == _ARRAY_BUFFER:
+            view["byteStride"] = raw.shape[1] * raw.dtype.itemsize
+        if meshopt:
+            encoded, ext = _encode_view(raw, target, triangles)
+            ext.update(buffer=0, byteOffset=out.add(encoded), byteLength=len(encoded), count=len(raw))
+            view.update(buffer=1, byteOffset=fallback_size, extensions={EXT_MESHOPT_COMPRESSION: ext})
+            fallback_size += raw.nbytes + (-raw.nbytes % 4)
+        else:
+            view.update(buffer=0, byteOffset=out.add(raw.tobytes()))
+        views.append(view)
+
+    for image in doc.get("images", []):
+        if "bufferView" in image:
+            image["bufferView"] = copy_view(image["bufferView"])
+
+    data = out.getvalue()
+    doc["bufferViews"] = views
+    doc["buffers"] = [{"byteLength": len(data)}]
+    used = set(doc.get("extensionsUsed", []))
+    required = set(doc.get("extensionsRequired", []))
+    if meshopt and fallback_size:
+        doc["buffers"].append({"byteLength": fallback_size, "extensions": {EXT_MESHOPT_COMPRESSION: {"fallback": True}}})
+        # the fallback buffer has no data, so loaders must decode
+        used.add(EXT_MESHOPT_COMPRESSION)
+        required.add(EXT_MESHOPT_COMPRESSION)
+
+    if any(s.quantized for s in streams.values()):
+        used.add(KHR_MESH_QUANTIZATION)
+        required.add(KHR_MESH_QUANTIZATION)
+
+    # positions are stored relative to the mesh bounds; the node transform maps them
+    # back, on the node itself when it is a plain leaf, otherwise on a new child node
+    nodes = doc.get("nodes", [])
+    animated = {c.get("target", {}).get("node") for a in doc.get("animations", []) for c in a.get("channels", [])}
+    for n, node in enumerate(list(nodes)):
+        m = node.get("mesh")
+        if m not in dequantize:
+            continue
+        origin, scale = dequantize[m]
+        transform = {"translation": origin.tolist(), "scale": [scale] * 3}
+        plain = not any(k in node for k in ("matrix", "translation", "rotation", "scale", "children"))
+        if plain and n not in animated:
+            node.update(transform)
+            continue
+        child = {"mesh": node.pop("mesh"), **transform}
+        if "name" in node:
+            child["name"] = node["name"]
+        node.setdefault("children", []).append(len(nodes))
+        nodes.append(child)
+
+    if used:
+        doc["extensionsUsed"] = sorted(used)
+    if required:
+        doc["extensionsRequired"] = sorted(required)
+    return doc, data
+
+
+def _load_buffer(base_dir: Path, buffer: dict, glb_bin: bytes | None = None) -> bytes:
+    uri = buffer.get("uri")
+    if uri is None:
+        if glb_bin is None:
+            raise ValueError("glTF buffer has neither a uri nor a GLB binary chunk")
+        return glb_bin
+    if uri.startswith("data:"):
+        return base64.b64decode(uri.split(",", 1)[1])
+    return (base_dir / uri).read_bytes()
+
+
+def compress_gltf_file(gltf_path: str, mode: str) -> list[str]:
+    """Compress a .gltf with external (or data URI) buffers in place.
+
+    All buffers are replaced by one `<stem>.bin` next to the .gltf; the old .bin
+    files are removed. Returns the .gltf and .bin paths.
+    """
+    mode = _normalize_mode(mode)
+    path = Path(gltf_path)
+    bin_path = path.with_suffix(".bin")
+    if mode == "none":
+        return [str(path), str(bin_path)] if bin_path.exists() else [str(path)]
+
+    doc = json.loads(path.read_text(encoding="utf-8"))
+    if not doc.get("buffers"):
+        return [str(path)]
+    buffers = [_load_buffer(path.parent, b) for b in doc["buffers"]]
+    old_files = {path.parent / b["uri"] for b in doc["buffers"] if not b.get("uri", "data:").startswith("data:")}
+
+    doc, data = compress_gltf(doc, buffers, mode)
+    for old in old_files - {bin_path}:
+        old.unlink(missing_ok=True)
+    bin_path.write_bytes(data)
+    doc["buffers"][0]["uri"] = bin_path.name
+    path.write_text(json.dumps(doc, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    logger.info(f"glTF compression ({mode}): {path} -> {bin_path.name} {len(data)} bytes")
+    return [str(path), str(bin_path)]
+
+
+def compress_glb_file(glb_path: str, mode: str) -> str:
+    """Compress a .glb in place; returns its path."""
+    mode = _normalize_mode(mode)
+    path = Path(glb_path)
+    if mode == "none":
+        return str(path)
+
+    raw = path.read_bytes()
+    magic, version, _ = struct.unpack_from("<III", raw, 0)
+    if magic != _GLB_MAGIC or version != 2:
+        raise ValueError(f"Not a glTF 2.0 binary: {path}")
+    doc, glb_bin, offset = None, None, 12
+    while offset < len(raw):
+        length, kind = struct.unpack_from("<II", raw, offset)
+        chunk = raw[offset + 8:offset + 8 + length]
+        if kind == _GLB_JSON:
+            doc = json.loads(chunk.decode("utf-8"))
+        elif kind == _GLB_BIN and glb_bin is None:
+            glb_bin = chunk
+        offset += 8 + length
+    if not doc or not doc.get("buffers"):
+        return str(path)
+
+    buffers = [_load_buffer(path.parent, b, glb_bin) for b in doc["buffers"]]
+    doc, data = compress_gltf(doc, buffers, mode)
+    doc_bytes = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    doc_bytes += b" " * (-len(doc_bytes) % 4)
+    total = 12 + 8 + len(doc_bytes) + 8 + len(data)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<III", _GLB_MAGIC, 2, total))
+        f.write(struct.pack("<II", len(doc_bytes), _GLB_JSON))
+        f.write(doc_bytes)
+        f.write(struct.pack("<II", len(data), _GLB_BIN))
+        f.write(data)
+    logger.info(f"glTF compression ({mode}): {path} {len(raw)} -> {total} bytes")
+    return str(path)
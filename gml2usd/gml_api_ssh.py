@@ -1,34 +1,33 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify, send_file
-import subprocess
+from flask import Flask, Response, request, jsonify, send_file
 import os
+import shutil
 import time
-import io
 import logging
 import argparse
 from logging.handlers import RotatingFileHandler
 import datetime
+import io
 import traceback
 import sys
+import multiprocessing
+import uuid
 from local_citygml2usd import convert_citygml_to_usd, ConversionError
+from converter_pool import SCRIPT_DIR, get_converter_pool
 from obj_converter import OBJToGMLConverter, validate_obj_required_objects, OBJValidationError
 from usd_to_gltf import usd_to_glb, usd_to_gltf_zip, usd_to_gltf_dir, usd_to_gltf_single_file
+from gltf_compress import COMPRESSION_MODES, compress_glb_file, compress_gltf_file
+from gml_jobs import DONE, JobQueue
+from gml_mesh_store import MESH_BUNDLE_SUFFIX
+from gml_result_cache import file_digest, file_versions, get_result_cache, make_cache_key
+from gml_zip_stream import ZipStream, write_zip
+from gml_tile_index import get_path_manifest, get_tile_index, reload_path_manifest
+from Main import find_matching_gmls, generate_gml, read_excluded_ids_from_file
 import requests
 import re
+from urllib.parse import quote
 
 
-def _zip_files(zip_path: str, files: list[tuple[str, str]]) -> None:
-    """Create a zip that contains a set of files.
-
-    files: list of (arcname, filepath)
-    """
-    import zipfile
-
-    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
-    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for arcname, filepath in files:
-            zf.write(filepath, arcname=arcname)
-
 # 创建日志目录
 os.makedirs('logs', exist_ok=True)
 
@@ -87,6 +86,395 @@ def health_check():
     logger.info(f"健康检查: {response}")
     return jsonify(response)
 
+class PipelineError(RuntimeError):
+    """轉換流程失敗；payload / status_code 即回傳給 client 的 JSON 錯誤"""
+
+    def __init__(self, payload: dict, status_code: int = 500):
+        super().__init__(payload.get("message", "pipeline failed"))
+        self.payload = {"status": "error", **payload}
+        self.status_code = status_code
+
+
+def _no_progress(stage: str) -> None:
+    pass
+
+
+def _parse_gltf_compression(value) -> str:
+    """glTF 網格壓縮模式（none / quantize / meshopt），未指定為 none；不支援的值回 400"""
+    mode = str(value).strip().lower() if value is not None else ''
+    mode = mode or 'none'
+    if mode not in COMPRESSION_MODES:
+        raise PipelineError({"message": f"Unsupported gltf_compression: {value}", "supported": list(COMPRESSION_MODES)}, 400)
+    return mode
+
+
+def _remove_files(paths) -> None:
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            logger.warning(f"Cleanup failed: {e}")
+
+
+# 設定後（例如 /_gml2usd_files），X_ACCEL_DIRS 內的常駐檔案改由 gateway 的 nginx 直接送出，
+# Flask 只回傳 X-Accel-Redirect header（nginx 需掛載相同目錄，見 Simulation_Agent/gateway/nginx.conf）
+X_ACCEL_REDIRECT_PREFIX = os.environ.get("GML_X_ACCEL_REDIRECT_PREFIX", "").rstrip("/")
+X_ACCEL_DIRS = ("processed_cache", "processed_jobs")
+
+
+def _x_accel_location(path: str) -> str | None:
+    working_dir = os.path.dirname(os.path.abspath(__file__))
+    rel = os.path.relpath(os.path.abspath(path), working_dir)
+    if rel.split(os.sep, 1)[0] not in X_ACCEL_DIRS:
+        return None
+    return f"{X_ACCEL_REDIRECT_PREFIX}/{quote(rel.replace(os.sep, '/'))}"
+
+
+class _ResponseFile(io.FileIO):
+    """交給 send_file 的檔案物件：WSGI server 仍拿到真正的 fd（wsgi.file_wrapper，gunicorn 可用 sendfile）。
+
+    werkzeug 對 direct passthrough 的 body 不會呼叫 Response.close，call_on_close 的 callback 因此不會執行；
+    server 送完後關閉 file wrapper 時會關閉這個檔案，這裡再關閉 response 讓 callback 執行。
+    """
+
+    response = None
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        response, self.response = self.response, None
+        if response is not None:
+            response.close()
+
+
+def _send_artifact(artifact):
+    """直接從磁碟串流回傳（不先讀進記憶體）；temp_paths 在回應送完、連線關閉後才刪除
+
+    artifact: (path, mimetype, download_name, temp_paths)，temp_paths 為交付後要刪除的檔案；
+              path 也可以是 ZipStream（bundle 邊打包邊送出，不落地）
+    """
+    path, mimetype, download_name, temp_paths = artifact
+    if isinstance(path, ZipStream):
+        response = Response(path, mimetype=mimetype, direct_passthrough=True)
+        response.headers.set("Content-Disposition", "attachment", filename=download_name)
+        # 讓 gateway nginx 直接轉送，不先緩衝整個 zip
+        response.headers["X-Accel-Buffering"] = "no"
+        # WSGI server 關閉 ZipStream 時與它自己的暫存檔一起刪除
+        path.cleanup.extend(temp_paths)
+        return response
+
+    location = _x_accel_location(path) if X_ACCEL_REDIRECT_PREFIX and path not in temp_paths else None
+    if location is not None:
+        # nginx 依 header 自行讀檔，body 留空；path 不是暫存檔，其餘暫存檔可以直接刪除
+        response = send_file(path, mimetype=mimetype, download_name=download_name)
+        response.response.close()
+        response.set_data(b"")
+        response.headers["X-Accel-Redirect"] = location
+        _remove_files(temp_paths)
+        return response
+
+    if not temp_paths:
+        return send_file(path, mimetype=mimetype, download_name=download_name)
+
+    body = _ResponseFile(path)
+    response = send_file(body, mimetype=mimetype, download_name=download_name, last_modified=os.path.getmtime(path))
+    response.content_length = os.fstat(body.fileno()).st_size
+    body.response = response
+    # 檔案已開啟，刪除不影響串流；回應送完（或連線中斷）後才執行
+    response.call_on_close(lambda: _remove_files(temp_paths))
+    return response
+
+
+def _bundle_gltf_path(working_dir: str, base_name: str, unique_suffix: str = "") -> str:
+    """預設 bundle 的 glTF 暫存位置；轉換程式可直接寫到這裡（--gltf），_export_usd 就不必再由 USD 轉出"""
+    return os.path.join(working_dir, "processed_bundles", f"{base_name}_gltf{unique_suffix}", f"{base_name}.gltf")
+
+
+def _tiles_dir_path(working_dir: str, base_name: str, unique_suffix: str = "") -> str:
+    """output=tiles 的 3D Tiles 暫存目錄；轉換程式以 --tiles 直接寫到這裡"""
+    return os.path.join(working_dir, "processed_bundles", f"{base_name}_tiles{unique_suffix}")
+
+
+def _export_usd(usd_path: str, output_format: str, base_name: str, working_dir: str, *, unique_suffix: str = "",
+                cleanup_gltf: bool = True, prebuilt_gltf: str = None, prebuilt_tiles: str = None,
+                compression: str = "none", stream: bool = False):
+    """USD -> 預設 bundle zip（USD + glTF）、glb / gltf / gltf_zip 或 tiles zip；回傳 (path, mimetype, download_name)，USD 輸出則回傳 None
+
+    unique_suffix: 加在服務端暫存檔名上（並行請求互不覆蓋），download_name 不含
+
+    prebuilt_gltf: 轉換時已一併寫出的 bundle glTF（見 _bundle_gltf_path），存在時直接打包
+    prebuilt_tiles: 轉換時寫出的 3D Tiles 目錄（見 _tiles_dir_path），output=tiles 時打包成 zip
+    compression: glTF 網格壓縮（none / quantize / meshopt，見 gltf_compress.py）
+    stream: bundle 回傳 ZipStream（回應時才邊讀邊打包），而不是先寫到磁碟的 zip
+    """
+    if output_format == '':
+        bundle_dir = os.path.join(working_dir, "processed_bundles")
+        os.makedirs(bundle_dir, exist_ok=True)
+
+        if prebuilt_gltf and os.path.exists(prebuilt_gltf):
+            tmp_gltf_dir = os.path.dirname(prebuilt_gltf)
+            generated = [prebuilt_gltf, os.path.splitext(prebuilt_gltf)[0] + ".bin"]
+            generated = compress_gltf_file(prebuilt_gltf, compression) if compression != "none" else generated
+        else:
+            tmp_gltf_dir = os.path.dirname(_bundle_gltf_path(working_dir, base_name, unique_suffix))
+            generated = usd_to_gltf_dir(usd_path, tmp_gltf_dir, base_name=base_name, compression=compression)
+
+        bundle_name = f"{base_name}_bundle.zip"
+        files = [(f"{base_name}.usd", usd_path)]
+        for f in generated:
+            files.append((os.path.basename(f), f))
+        gltf_temp = [*generated, tmp_gltf_dir] if cleanup_gltf else []
+
+        if stream:
+            # glTF 暫存檔在回應送完後由 ZipStream.close 刪除
+            return ZipStream(files, cleanup=gltf_temp), 'application/zip', bundle_name
+
+        bundle_zip_path = write_zip(os.path.join(bundle_dir, f"{base_name}_bundle{unique_suffix}.zip"), files)
+        _remove_files(gltf_temp)
+        return bundle_zip_path, 'application/zip', bundle_name
+
+    if output_format == 'tiles':
+        if not prebuilt_tiles or not os.path.isfile(os.path.join(prebuilt_tiles, "tileset.json")):
+            raise PipelineError({"message": "output=tiles 需要轉換時一併產生 tileset（僅 /process_gml 支援）"}, 400)
+        names = sorted(os.listdir(prebuilt_tiles))
+        for name in names:
+            if name.endswith(".glb"):
+                compress_glb_file(os.path.join(prebuilt_tiles, name), compression)
+        tiles_name = f"{base_name}_tiles.zip"
+        files = [(name, os.path.join(prebuilt_tiles, name)) for name in names]
+        tiles_temp = [prebuilt_tiles] if cleanup_gltf else []
+        if stream:
+            return ZipStream(files, cleanup=tiles_temp), 'application/zip', tiles_name
+
+        tiles_zip_path = write_zip(os.path.join(working_dir, "processed_bundles", f"{base_name}_tiles{unique_suffix}.zip"), files)
+        _remove_files(tiles_temp)
+        return tiles_zip_path, 'application/zip', tiles_name
+
+    if output_format in {'glb', 'gltf', 'gltf_zip'}:
+        gltf_out_dir = os.path.join(working_dir, "processed_gltfs")
+        os.makedirs(gltf_out_dir, exist_ok=True)
+
+        if output_format == 'glb':
+            glb_path = os.path.join(gltf_out_dir, f"{base_name}{unique_suffix}.glb")
+            usd_to_glb(usd_path, glb_path, compression=compression)
+            return glb_path, 'model/gltf-binary', f"{base_name}.glb"
+
+        if output_format == 'gltf':
+            gltf_path = os.path.join(gltf_out_dir, f"{base_name}{unique_suffix}.gltf")
+            usd_to_gltf_single_file(usd_path, gltf_path, base_name=base_name, compression=compression)
+            return gltf_path, 'model/gltf+json', f"{base_name}.gltf"
+
+        zip_path = os.path.join(gltf_out_dir, f"{base_name}_gltf{unique_suffix}.zip")
+        usd_to_gltf_zip(usd_path, zip_path, base_name=base_name, compression=compression)
+        return zip_path, 'application/zip', f"{base_name}_gltf.zip"
+
+    return None
+
+
+GML_PIPELINE_STAGES = ("generate_gml", "convert_usd", "export")
+# 會影響輸出內容的服務端模組；轉換腳本目錄（SCRIPT_DIR）內的 .py 全部納入。任一變更都會使結果快取失效
+PIPELINE_SOURCES = ("Main.py", "gml_transport_v2.py", "gml_coords.py", "gml_building_index.py", "gml_mesh_store.py",
+                    "usd_to_gltf.py", "gltf_compress.py", "gml_zip_stream.py", "gml_api_ssh.py")
+
+
+def _pipeline_sources(working_dir: str) -> list[str]:
+    """結果快取 key 用的原始碼清單：SCRIPT_DIR 下所有 .py（轉換腳本匯入的模組都在這裡）+ PIPELINE_SOURCES"""
+    try:
+        scripts = [entry.path for entry in os.scandir(SCRIPT_DIR) if entry.is_file() and entry.name.endswith(".py")]
+    except OSError:
+        scripts = []
+    return scripts + [os.path.join(working_dir, name) for name in PIPELINE_SOURCES]
+
+
+def _gml_cache_key(lat, lon, margin, gml_name, epsg_in, epsg_out, disable_interiors, output_format, gltf_compression,
+                   working_dir) -> str:
+    """結果快取 key：正規化後的請求參數 + 來源 tile 版本 + 排除清單內容 + 轉換腳本版本"""
+    lat, lon, margin = float(lat), float(lon), float(margin)
+    tiles = find_matching_gmls(os.path.join(working_dir, "gml_bounding_boxes_v1.csv"), lat, lon, margin)
+    return make_cache_key(
+        {
+            "lat": round(lat, 7),
+            "lon": round(lon, 7),
+            "margin": round(margin, 3),
+            "gml_name": gml_name,
+            "epsg_in": str(epsg_in),
+            "epsg_out": str(epsg_out),
+            "disable_interiors": disable_interiors,
+            "output": output_format,
+            "gltf_compression": gltf_compression,
+        },
+        file_versions(tiles),
+        file_digest(os.path.join(working_dir, "excluded_buildings.txt")),
+        file_versions(_pipeline_sources(working_dir)),
+    )
+
+
+def _run_gml_pipeline(data: dict, progress=_no_progress, stream: bool = False, unique_suffix: str | None = None):
+    """經緯度 -> GML -> USD (-> glTF)；回傳 (artifact_path, mimetype, download_name, temp_paths)
+
+    stream=True 時預設 bundle 的 artifact_path 為 ZipStream（見 _send_artifact）
+    unique_suffix: 這次請求的 GML / 網格 / USD / glTF / tiles 暫存檔名後綴（預設為新的 uuid）。
+    串流回應在送出期間才讀取這些檔案、送完才刪除，同名（預設 project_id）的並行請求不能共用路徑；
+    gml_name 只用在 download_name
+    """
+    project_id = data.get('project_id','0')
+    default_gml_name = f"map_aodt_{project_id}.gml"
+
+    lat = data.get('lat', 24.78703)
+    lon = data.get('lon', 120.99693)
+    margin = data.get('margin', 200)
+    gml_name = data.get('gml_name', default_gml_name)
+    epsg_in = data.get('epsg_in', '3826')
+    epsg_out = data.get('epsg_out', '32654')
+    disable_interiors = _parse_bool(data.get('disable_interiors', False), default=False)
+    keep_files = _parse_bool(data.get('keep_files', False), default=False)
+    output_raw = data.get('output', None)
+    output_format = (str(output_raw).strip().lower() if output_raw is not None else '')
+    gltf_compression = _parse_gltf_compression(data.get('gltf_compression'))
+
+    # Ensure output directories exist (host volume mounts may not be present on a fresh machine)
+    os.makedirs(os.path.join("processed_gmls"), exist_ok=True)
+    os.makedirs(os.path.join("processed_usds"), exist_ok=True)
+
+    #設定local的usd位置
+    base_name = gml_name.split(".gml")[0]
+    usd_name = base_name + ".usd"
+    unique_suffix = unique_suffix or f"_{uuid.uuid4().hex}"
+    work_name = f"{base_name}{unique_suffix}"
+    working_file = os.path.abspath(__file__)
+    working_dir = os.path.dirname(working_file)
+    usd_path = os.path.join(working_dir,f"processed_usds/{work_name}.usd")
+
+    # 记录请求信息
+    logger.info(
+        f"收到处理请求: lat={lat}, lon={lon}, margin={margin}, gml_name={gml_name}, "
+        f"disable_interiors={disable_interiors}, keep_files={keep_files}"
+    )
+
+    # 相同站點的重複請求直接由結果快取回傳（keep_files 需要實際產生 GML/USD，不走快取）
+    result_cache = get_result_cache() if _parse_bool(data.get('cache', True), default=True) and not keep_files else None
+    cache_key = None
+    if result_cache is not None:
+        try:
+            cache_key = _gml_cache_key(lat, lon, margin, gml_name, epsg_in, epsg_out, disable_interiors, output_format,
+                                       gltf_compression, working_dir)
+        except Exception as e:
+            logger.warning(f"計算結果快取 key 失敗，不使用快取: {e}")
+        cached = result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            logger.info(f"命中結果快取: {cache_key} ({cached['size']} bytes)")
+            return cached["path"], cached["mimetype"], cached["download_name"], []
+
+    # Step 1: generate GML in-process (warm imports, cached tile index / transformer)
+    progress("generate_gml")
+    gml_path = os.path.join(working_dir, "processed_gmls", f"{work_name}.gml")
+    # 不保留檔案時，網格快取涵蓋範圍內直接寫出二進位網格給轉換程式（見 gml_mesh_store.py），否則產生 GML
+    bundle_path = None if keep_files else os.path.splitext(gml_path)[0] + MESH_BUNDLE_SUFFIX
+    excluded_ids = read_excluded_ids_from_file(os.path.join(working_dir, "excluded_buildings.txt"))
+    logger.info(f"产生 GML: {gml_path}")
+    try:
+        # 未保留的 GML 只給轉換程式讀取，不需要縮排
+        building_count = generate_gml(lat, lon, margin, gml_path, excluded_ids, compact=not keep_files,
+                                      mesh_bundle_path=bundle_path)
+    except Exception as e:
+        logger.error(f"处理失败: {e}\n{traceback.format_exc()}")
+        raise PipelineError({"message": f"process fail: {e}"}) from e
+    input_path = bundle_path if bundle_path and os.path.isdir(bundle_path) else gml_path
+
+    # Verify GML was actually generated before converting to USD.
+    if not building_count or not os.path.exists(input_path):
+        logger.error("GML generation produced no buildings: %s", gml_path)
+        try:
+            existing = os.listdir(os.path.join(working_dir, "processed_gmls"))
+        except Exception:
+            existing = []
+        raise PipelineError({
+            "message": "GML generation failed (file not created)",
+            "expected_gml": os.path.join("processed_gmls", os.path.basename(gml_path)),
+            "processed_gmls_listing": existing,
+        })
+
+    # Step 2: convert GML -> USD locally in this container
+    progress("convert_usd")
+    # 預設 bundle 的 glTF 由轉換程式用同一份網格一起寫出，不再重新開啟 USD 轉換
+    gltf_path = _bundle_gltf_path(working_dir, base_name, unique_suffix) if output_format == '' else None
+    tiles_dir = _tiles_dir_path(working_dir, base_name, unique_suffix) if output_format == 'tiles' else None
+    try:
+        convert_citygml_to_usd(
+            gml_path=os.path.join("processed_gmls", os.path.basename(input_path)),
+            usd_path=usd_path,
+            epsg_in=str(epsg_in),
+            epsg_out=str(epsg_out),
+            rough=True,
+            disable_interiors=disable_interiors,
+            gltf_path=gltf_path,
+            tiles_dir=tiles_dir,
+        )
+    except ConversionError as conv_err:
+        logger.error(f"USD 转换失败: {conv_err}")
+        raise PipelineError({
+            "message": "USD conversion failed",
+            "details": str(conv_err),
+            "expected_gml": os.path.join("processed_gmls", os.path.basename(gml_path)),
+        }) from conv_err
+
+
+    # 检查GML,USD文件是否已创建
+    if not os.path.exists(input_path):
+        logger.error(f"未能找到生成的GML文件: {input_path}")
+        raise PipelineError({"message": f"未能找到生成的GML文件 {input_path}"}, 404)
+    if not os.path.exists(usd_path):
+        logger.error(f"未能找到生成的USD文件: {usd_path}")
+        raise PipelineError({"message": f"未能找到生成的USD文件 {usd_path}"}, 404)
+
+    if input_path == gml_path:
+        # 获取文件大小
+        file_size = os.path.getsize(gml_path)
+
+        # 检查文件是否为空或非常小(可能只有XML头)
+        if file_size < 300:  # 假设有效GML文件至少300字节
+            logger.warning(f"GML文件已生成但没有建筑物数据: {gml_path}, 大小: {file_size}字节")
+        else:
+            logger.info(f"GML文件已成功生成: {gml_path}, 大小: {file_size}字节")
+    else:
+        logger.info(f"已由網格快取產生 {building_count} 棟建物: {input_path}")
+
+    # Default: if output is not specified, return a bundle zip (USD + glTF assets)
+    progress("export")
+    temp_paths = [] if keep_files else [usd_path, input_path]
+    exported = _export_usd(usd_path, output_format, base_name, working_dir, unique_suffix=unique_suffix,
+                           prebuilt_gltf=gltf_path, prebuilt_tiles=tiles_dir, compression=gltf_compression,
+                           stream=stream)
+    if exported is not None:
+        streamed = isinstance(exported[0], ZipStream)
+        artifact = (*exported, temp_paths if streamed else [exported[0], *temp_paths])
+    else:
+        # Default / explicit USD output
+        artifact = (usd_path, 'application/octet-stream', usd_name, temp_paths)
+
+    if cache_key is not None:
+        path, mimetype, download_name, temp_paths = artifact
+        if isinstance(path, ZipStream):
+            # 串流的同時寫一份到 processed_bundles，完整送出後才放進快取（中斷的回應不進快取）；
+            # 暫存檔名加上 uuid，同名的並行請求不會寫到同一個檔案
+            path.tee(os.path.join(working_dir, "processed_bundles", f".stream-{uuid.uuid4().hex}-{download_name}"))
+            path.on_complete(lambda tee_path: result_cache.put(cache_key, tee_path, mimetype, download_name))
+        else:
+            # 快取保留一份（可行時為 hard link），原本的檔案照常當暫存檔刪除；快取失敗時照常回傳原本的檔案
+            try:
+                cached = result_cache.put(cache_key, path, mimetype, download_name)
+            except Exception as e:
+                logger.warning(f"寫入結果快取失敗，直接回傳檔案: {e}")
+                cached = None
+            if cached is not None:
+                artifact = (cached["path"], mimetype, download_name, temp_paths)
+    return artifact
+
+
 @app.route('/process_gml', methods=['POST'])
 def process_gml():
     """GML处理接口"""
@@ -101,228 +489,10 @@ def process_gml():
                 "message": "wrong format"
             }), 400
 
-        project_id = data.get('project_id','0')
-        default_gml_name = f"map_aodt_{project_id}.gml"
-
-        
-        lat = data.get('lat', 24.78703)
-        lon = data.get('lon', 120.99693)
-        margin = data.get('margin', 200)
-        gml_name = data.get('gml_name', default_gml_name)
-        epsg_in = data.get('epsg_in', '3826')
-        epsg_out = data.get('epsg_out', '32654')
-        disable_interiors = _parse_bool(data.get('disable_interiors', False), default=False)
-        keep_files = _parse_bool(data.get('keep_files', False), default=False)
-        output_raw = data.get('output', None)
-        output_format = (str(output_raw).strip().lower() if output_raw is not None else '')
-
-        # Ensure output directories exist (host volume mounts may not be present on a fresh machine)
-        os.makedirs(os.path.join("processed_gmls"), exist_ok=True)
-        os.makedirs(os.path.join("processed_usds"), exist_ok=True)
-
-        #設定local的usd位置
-        usd_name = gml_name.split(".gml")[0] + ".usd"
-        working_file = os.path.abspath(__file__)
-        working_dir = os.path.dirname(working_file)
-        usd_path = os.path.join(working_dir,f"processed_usds/{usd_name}")
-   
-
-        # 记录请求信息
-        logger.info(
-            f"收到处理请求: lat={lat}, lon={lon}, margin={margin}, gml_name={gml_name}, "
-            f"disable_interiors={disable_interiors}, keep_files={keep_files}"
-        )
-        
-        # Step 1: generate GML locally (Main.py is interactive; we feed stdin)
-        cmd = [
-            'python3', 'Main.py'
-        ]
-        
-
-        
-        # 记录即将执行的命令
-        logger.info(f"执行命令: {' '.join(cmd)}")
-        
-        # 执行命令
-        # Feed interactive answers to Main.py
-        inputs = f"{lat}\n{lon}\n{margin}\n{gml_name}\n\n".encode()
-        process = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=working_dir,
-        )
-        
-        # 读取输出
-        stdout_bytes, stderr_bytes = process.communicate(inputs)
-        stdout = stdout_bytes.decode(errors='replace')
-        stderr = stderr_bytes.decode(errors='replace')
-        
-        # 检查是否成功
-        if process.returncode != 0:
-            logger.error(f"处理失败: {stderr}")
-            return jsonify({
-                "status": "error",
-                "message": f"process fail: {stderr}",
-                "details": stdout
-            }), 500
+        return _send_artifact(_run_gml_pipeline(data, stream=True))
 
-        # Verify GML was actually generated before converting to USD.
-        gml_path = os.path.join(working_dir, "processed_gmls", gml_name)
-        if not os.path.exists(gml_path):
-            logger.error(
-                "Main.py completed but expected GML file is missing: %s; stdout=%s; stderr=%s",
-                gml_path,
-                stdout[-2000:],
-                stderr[-2000:],
-            )
-            try:
-                existing = os.listdir(os.path.join(working_dir, "processed_gmls"))
-            except Exception:
-                existing = []
-            return jsonify({
-                "status": "error",
-                "message": "GML generation failed (file not created)",
-                "expected_gml": os.path.join("processed_gmls", gml_name),
-                "processed_gmls_listing": existing,
-                "stdout_tail": stdout[-2000:],
-                "stderr_tail": stderr[-2000:],
-            }), 500
-
-        # Step 2: convert GML -> USD locally in this container
-        try:
-            convert_citygml_to_usd(
-                gml_path=os.path.join("processed_gmls", gml_name),
-                usd_path=usd_path,
-                epsg_in=str(epsg_in),
-                epsg_out=str(epsg_out),
-                rough=True,
-                disable_interiors=disable_interiors,
-            )
-        except ConversionError as conv_err:
-            logger.error(f"USD 转换失败: {conv_err}")
-            return jsonify({
-                "status": "error",
-                "message": "USD conversion failed",
-                "details": str(conv_err),
-                "expected_gml": os.path.join("processed_gmls", gml_name),
-            }), 500
-        
-        
-        # 检查GML,USD文件是否已创建
-        gml_path = os.path.join("processed_gmls", gml_name)
-        if not os.path.exists(gml_path):
-            logger.error(f"未能找到生成的GML文件: {gml_path}")
-            return jsonify({
-                "status": "error",
-                "message": f"未能找到生成的GML文件 {gml_path}",
-                "details": stdout
-            }), 404
-        if not os.path.exists(usd_path):
-            logger.error(f"未能找到生成的USD文件: {usd_path}")
-            return jsonify({
-                "status": "error",
-                "message": f"未能找到生成的USD文件 {usd_path}",
-                "details": stdout
-            }), 404
-
-        # 获取文件大小
-        file_size = os.path.getsize(gml_path)
-        
-        # 检查文件是否为空或非常小(可能只有XML头)
-        if file_size < 300:  # 假设有效GML文件至少300字节
-            logger.warning(f"GML文件已生成但没有建筑物数据: {gml_path}, 大小: {file_size}字节")
-        else:
-            logger.info(f"GML文件已成功生成: {gml_path}, 大小: {file_size}字节")
-
-        # Return files and delete the files
-        # Default: if output is not specified, return a bundle zip (USD + glTF assets)
-        if output_format == '':
-            bundle_dir = os.path.join(working_dir, "processed_bundles")
-            os.makedirs(bundle_dir, exist_ok=True)
-
-            tmp_gltf_dir = os.path.join(bundle_dir, os.path.splitext(usd_name)[0] + "_gltf")
-            generated = usd_to_gltf_dir(usd_path, tmp_gltf_dir, base_name=os.path.splitext(usd_name)[0])
-
-            bundle_zip_path = os.path.join(bundle_dir, os.path.splitext(usd_name)[0] + "_bundle.zip")
-            files = [(os.path.basename(usd_path), usd_path)]
-            for f in generated:
-                files.append((os.path.basename(f), f))
-            _zip_files(bundle_zip_path, files)
-
-            return_data = io.BytesIO()
-            with open(bundle_zip_path, 'rb') as fo:
-                return_data.write(fo.read())
-            return_data.seek(0)
-
-            os.remove(bundle_zip_path)
-            for f in generated:
-                try:
-                    os.remove(f)
-                except Exception:
-                    pass
-            try:
-                os.rmdir(tmp_gltf_dir)
-            except Exception:
-                pass
-            if not keep_files:
-                os.remove(usd_path)
-                os.remove(gml_path)
-            return send_file(return_data, mimetype='application/zip', download_name=os.path.basename(bundle_zip_path))
-
-        if output_format in {'glb', 'gltf', 'gltf_zip'}:
-            gltf_out_dir = os.path.join(working_dir, "processed_gltfs")
-            os.makedirs(gltf_out_dir, exist_ok=True)
-
-            if output_format == 'glb':
-                glb_path = os.path.join(gltf_out_dir, os.path.splitext(usd_name)[0] + ".glb")
-                usd_to_glb(usd_path, glb_path)
-                return_data = io.BytesIO()
-                with open(glb_path, 'rb') as fo:
-                    return_data.write(fo.read())
-                return_data.seek(0)
-                os.remove(glb_path)
-                if not keep_files:
-                    os.remove(usd_path)
-                    os.remove(gml_path)
-                return send_file(return_data, mimetype='model/gltf-binary', download_name=os.path.basename(glb_path))
-
-            if output_format == 'gltf':
-                gltf_path = os.path.join(gltf_out_dir, os.path.splitext(usd_name)[0] + ".gltf")
-                usd_to_gltf_single_file(usd_path, gltf_path, base_name=os.path.splitext(usd_name)[0])
-                return_data = io.BytesIO()
-                with open(gltf_path, 'rb') as fo:
-                    return_data.write(fo.read())
-                return_data.seek(0)
-                os.remove(gltf_path)
-                if not keep_files:
-                    os.remove(usd_path)
-                    os.remove(gml_path)
-                return send_file(return_data, mimetype='model/gltf+json', download_name=os.path.basename(gltf_path))
-
-            zip_path = os.path.join(gltf_out_dir, os.path.splitext(usd_name)[0] + "_gltf.zip")
-            usd_to_gltf_zip(usd_path, zip_path, base_name=os.path.splitext(usd_name)[0])
-            return_data = io.BytesIO()
-            with open(zip_path, 'rb') as fo:
-                return_data.write(fo.read())
-            return_data.seek(0)
-            os.remove(zip_path)
-            if not keep_files:
-                os.remove(usd_path)
-                os.remove(gml_path)
-            return send_file(return_data, mimetype='application/zip', download_name=os.path.basename(zip_path))
-
-        # Default / explicit USD output
-        return_data = io.BytesIO()
-        with open(usd_path,'rb') as fo:
-            return_data.write(fo.read())
-        return_data.seek(0)
-        if not keep_files:
-            os.remove(usd_path)
-            os.remove(gml_path)
-        return send_file(return_data, mimetype='application/octet-stream')
-    
+    except PipelineError as e:
+        return jsonify(e.payload), e.status_code
     except Exception as e:
         # 记录异常堆栈
         error_trace = traceback.format_exc()
@@ -332,11 +502,199 @@ def process_gml():
             "message": f"内部服务器错误: {str(e)}",
             "stack_trace": error_trace
         }), 500
-    
+
+
+OBJ_PIPELINE_STAGES = ("validate_obj", "obj_to_gml", "convert_usd", "export")
+
+
+def _prepare_obj_request() -> dict:
+    """解析 /process_obj 的 form-data 並先把上傳的 OBJ 存檔；回傳可交給 _run_obj_pipeline 的參數"""
+    # 1. 檢查檔案
+    if 'obj_file' not in request.files:
+        raise PipelineError({"message": "No obj_file part"}, 400)
+
+    file = request.files['obj_file']
+    if file.filename == '':
+        raise PipelineError({"message": "No selected file"}, 400)
+
+    # 2. 取得參數
+    project_id = request.form.get('project_id', f"obj_{int(time.time())}")
+    lat_str = request.form.get('lat')
+    lon_str = request.form.get('lon')
+    epsg_gml = request.form.get('epsg_gml', '3826')
+    epsg_usd = request.form.get('epsg_usd', '32654')
+    disable_interiors = _parse_bool(request.form.get('disable_interiors', None), default=False)
+    skip_obj_validation = _parse_bool(request.form.get('skip_obj_validation', None), default=False)
+    # Converter script inside /opt/aodt_ui_gis
+    # Default: indoor + groundplane + domain pipeline.
+    script_name = (
+        request.form.get('script_name', 'citygml2aodt_indoor_groundplane_domain.py')
+        or 'citygml2aodt_indoor_groundplane_domain.py'
+    ).strip()
+    output_raw = request.form.get('output')
+    output_format = (output_raw.strip().lower() if isinstance(output_raw, str) else '')
+    gltf_compression = _parse_gltf_compression(request.form.get('gltf_compression'))
+    keep_files = (request.form.get('keep_files', '0') or '0').strip() == '1'
+
+    # Naming for responses: default to uploaded OBJ stem (e.g. Askey.obj -> Askey.*)
+    # You can override with output_basename=form field.
+    response_base = _safe_base_name(request.form.get('output_basename'), default="")
+    if not response_base:
+        response_base = _safe_base_name(file.filename, default=_safe_base_name(project_id, default="output"))
+
+    # Optional validation: ensure OBJ contains specific object/group names.
+    # - required_objects: comma-separated list, e.g. "floor,roof"
+    # - required_object: repeatable field, e.g. -F required_object=floor -F required_object=roof
+    required_objects = []
+    required_objects_csv = request.form.get('required_objects')
+    if required_objects_csv:
+        required_objects.extend([x.strip() for x in required_objects_csv.split(',') if x.strip()])
+    required_objects.extend([x.strip() for x in request.form.getlist('required_object') if x.strip()])
+
+    # Default behavior: enforce common key elements unless user explicitly skips validation.
+    if not required_objects and not skip_obj_validation:
+        required_objects = ['floor', 'roof']
+
+    if not lat_str or not lon_str:
+        raise PipelineError({"message": "Missing lat or lon parameters"}, 400)
+
+    lat = float(lat_str)
+    lon = float(lon_str)
+
+    # 3. 準備路徑
+    working_file = os.path.abspath(__file__)
+    working_dir = os.path.dirname(working_file)
+
+    # 暫存檔名加上 uuid，同一個 project_id 的並行請求（含 job）不會共用路徑
+    tmp_suffix = f"{project_id}_{uuid.uuid4().hex}"
+    obj_filename = f"{tmp_suffix}.obj"
+    gml_filename = f"map_aodt_{tmp_suffix}.gml"
+    usd_filename = f"map_aodt_{tmp_suffix}.usd"
+
+    # 暫存 obj
+    upload_dir = os.path.join(working_dir, "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    obj_path = os.path.join(upload_dir, obj_filename)
+
+    # 輸出 gml/usd 路徑
+    gml_out_dir = os.path.join(working_dir, "processed_gmls")
+    usd_out_dir = os.path.join(working_dir, "processed_usds")
+    os.makedirs(gml_out_dir, exist_ok=True)
+    os.makedirs(usd_out_dir, exist_ok=True)
+
+    logger.info(f"Saving uploaded OBJ to {obj_path}")
+    file.save(obj_path)
+
+    return {
+        "lat": lat,
+        "lon": lon,
+        "epsg_gml": epsg_gml,
+        "epsg_usd": epsg_usd,
+        "disable_interiors": disable_interiors,
+        "skip_obj_validation": skip_obj_validation,
+        "required_objects": required_objects,
+        "script_name": script_name,
+        "output_format": output_format,
+        "gltf_compression": gltf_compression,
+        "keep_files": keep_files,
+        "response_base": response_base,
+        "working_dir": working_dir,
+        "obj_path": obj_path,
+        "gml_path": os.path.join(gml_out_dir, gml_filename),
+        "usd_path": os.path.join(usd_out_dir, usd_filename),
+    }
+
+
+def _run_obj_pipeline(params: dict, progress=_no_progress, stream: bool = False, unique_suffix: str | None = None):
+    """已上傳的 OBJ -> GML -> USD (-> glTF)；回傳 (artifact_path, mimetype, download_name, temp_paths)
+
+    stream=True 時預設 bundle 的 artifact_path 為 ZipStream（見 _send_artifact）
+    unique_suffix: glTF / zip 暫存檔名後綴（預設為新的 uuid）；OBJ/GML/USD 路徑已由 _prepare_obj_request 決定
+    """
+    obj_path = params["obj_path"]
+    gml_path = params["gml_path"]
+    usd_path = params["usd_path"]
+    output_format = params["output_format"]
+    keep_files = params["keep_files"]
+    response_base = params["response_base"]
+    required_objects = params["required_objects"]
+
+    # 3.5 Validate OBJ content before conversion
+    if not params["skip_obj_validation"]:
+        progress("validate_obj")
+        try:
+            validate_obj_required_objects(obj_path, required_objects)
+        except OBJValidationError as ve:
+            logger.warning(f"OBJ validation failed: {ve}")
+            if not keep_files:
+                _remove_files([obj_path])
+            raise PipelineError({
+                "message": "OBJ validation failed",
+                "missing": getattr(ve, 'missing', []),
+                "present": getattr(ve, 'present', []),
+                "required": getattr(ve, 'required', required_objects),
+                "hint": "請確認 OBJ 檔內有使用 'o <name>' 或 'g <name>' 宣告名稱，例如：o floor、o roof（或 g floor、g roof）。",
+                "details": str(ve),
+            }, 400) from ve
+
+    # 4. OBJ -> GML
+    progress("obj_to_gml")
+    logger.info(f"Converting OBJ to GML with origin ({params['lat']}, {params['lon']}) -> EPSG:{params['epsg_gml']}")
+    converter = OBJToGMLConverter()
+    # 要回傳或保留的 GML 維持縮排，其餘只給轉換程式讀取
+    compact = output_format != 'gml' and not keep_files
+    converter.process(obj_path, gml_path, params["lat"], params["lon"], params["epsg_gml"], compact=compact)
+
+    # Optional: return GML for validation
+    if output_format == 'gml':
+        logger.info(f"Returning GML (skip USD conversion): {gml_path}")
+        if not os.path.exists(gml_path):
+            raise PipelineError({"message": "GML file not generated"})
+        temp_paths = [] if keep_files else [obj_path, gml_path]
+        return gml_path, 'application/xml', f"{response_base}.gml", temp_paths
+
+    # 5. GML -> USD
+    progress("convert_usd")
+    logger.info(
+        f"Converting GML to USD: {gml_path} -> {usd_path} (script={params['script_name']}, "
+        f"disable_interiors={params['disable_interiors']})"
+    )
+    convert_citygml_to_usd(
+        gml_path=gml_path,
+        usd_path=usd_path,
+        epsg_in=params["epsg_gml"],
+        epsg_out=params["epsg_usd"],
+        rough=True,
+        script_name=params["script_name"],
+        disable_interiors=params["disable_interiors"],
+    )
+
+    # 6. 回傳 USD
+    if not os.path.exists(usd_path):
+        raise PipelineError({"message": "USD file not generated"})
+
+    # Default: if output is not specified, return a bundle zip (USD + glTF assets)
+    progress("export")
+    temp_paths = [] if keep_files else [obj_path, gml_path, usd_path]
+    exported = _export_usd(
+        usd_path, output_format, response_base, params["working_dir"],
+        unique_suffix=unique_suffix or f"_{uuid.uuid4().hex}", cleanup_gltf=not keep_files,
+        compression=params["gltf_compression"], stream=stream,
+    )
+    if exported is not None:
+        path, mimetype, _ = exported
+        extension = '.glb' if output_format == 'glb' else '.gltf' if output_format == 'gltf' else '.zip'
+        if isinstance(path, ZipStream):
+            return path, mimetype, f"{response_base}{extension}", temp_paths
+        return path, mimetype, f"{response_base}{extension}", temp_paths and [path, *temp_paths]
+
+    return usd_path, 'application/octet-stream', f"{response_base}.usd", temp_paths
+
+
 @app.route('/process_obj', methods=['POST'])
 def process_obj():
     """OBJ处理接口 - 接收OBJ並轉換為USD (經由GML)
-    Required form-data: 
+    Required form-data:
       - obj_file: The .obj file
       - lat: Origin latitude (WGS84)
       - lon: Origin longitude (WGS84)
@@ -346,278 +704,112 @@ def process_obj():
       - epsg_usd: EPSG code for final USD (default 32654)
             - output: 'gml' or 'usd' (default 'usd')
             - keep_files: '1' to keep temp files (default cleanup)
+            - gltf_compression: 'none' | 'quantize' | 'meshopt' for glTF outputs (default 'none')
     """
     try:
         logger.info(f"收到 OBJ 處理請求")
-        
-        # 1. 檢查檔案
-        if 'obj_file' not in request.files:
-            return jsonify({"status": "error", "message": "No obj_file part"}), 400
-            
-        file = request.files['obj_file']
-        if file.filename == '':
-            return jsonify({"status": "error", "message": "No selected file"}), 400
-
-        # 2. 取得參數
-        project_id = request.form.get('project_id', f"obj_{int(time.time())}")
-        lat_str = request.form.get('lat')
-        lon_str = request.form.get('lon')
-        epsg_gml = request.form.get('epsg_gml', '3826') 
-        epsg_usd = request.form.get('epsg_usd', '32654')
-        disable_interiors = _parse_bool(request.form.get('disable_interiors', None), default=False)
-        skip_obj_validation = _parse_bool(request.form.get('skip_obj_validation', None), default=False)
-        # Converter script inside /opt/aodt_ui_gis
-        # Default: indoor + groundplane + domain pipeline.
-        script_name = (
-            request.form.get('script_name', 'citygml2aodt_indoor_groundplane_domain.py')
-            or 'citygml2aodt_indoor_groundplane_domain.py'
-        ).strip()
-        output_raw = request.form.get('output')
-        output_format = (output_raw.strip().lower() if isinstance(output_raw, str) else '')
-        keep_files = (request.form.get('keep_files', '0') or '0').strip() == '1'
-
-        # Naming for responses: default to uploaded OBJ stem (e.g. Askey.obj -> Askey.*)
-        # You can override with output_basename=form field.
-        response_base = _safe_base_name(request.form.get('output_basename'), default="")
-        if not response_base:
-            response_base = _safe_base_name(file.filename, default=_safe_base_name(project_id, default="output"))
-
-        # Optional validation: ensure OBJ contains specific object/group names.
-        # - required_objects: comma-separated list, e.g. "floor,roof"
-        # - required_object: repeatable field, e.g. -F required_object=floor -F required_object=roof
-        required_objects = []
-        required_objects_csv = request.form.get('required_objects')
-        if required_objects_csv:
-            required_objects.extend([x.strip() for x in required_objects_csv.split(',') if x.strip()])
-        required_objects.extend([x.strip() for x in request.form.getlist('required_object') if x.strip()])
-
-        # Default behavior: enforce common key elements unless user explicitly skips validation.
-        if not required_objects and not skip_obj_validation:
-            required_objects = ['floor', 'roof']
-        
-        if not lat_str or not lon_str:
-             return jsonify({"status": "error", "message": "Missing lat or lon parameters"}), 400
-             
-        lat = float(lat_str)
-        lon = float(lon_str)
-
-        # 3. 準備路徑
-        working_file = os.path.abspath(__file__)
-        working_dir = os.path.dirname(working_file)
-        
-        # Keep temp filenames unique-ish to reduce collisions across concurrent requests.
-        tmp_suffix = f"{project_id}_{int(time.time())}"
-        obj_filename = f"{tmp_suffix}.obj"
-        gml_filename = f"map_aodt_{tmp_suffix}.gml"
-        usd_filename = f"map_aodt_{tmp_suffix}.usd"
-        
-        # 暫存 obj
-        upload_dir = os.path.join(working_dir, "uploads")
-        os.makedirs(upload_dir, exist_ok=True)
-        obj_path = os.path.join(upload_dir, obj_filename)
-        
-        # 輸出 gml/usd 路徑
-        gml_out_dir = os.path.join(working_dir, "processed_gmls")
-        usd_out_dir = os.path.join(working_dir, "processed_usds")
-        os.makedirs(gml_out_dir, exist_ok=True)
-        os.makedirs(usd_out_dir, exist_ok=True)
-        
-        gml_path = os.path.join(gml_out_dir, gml_filename)
-        usd_path = os.path.join(usd_out_dir, usd_filename)
-        
-        logger.info(f"Saving uploaded OBJ to {obj_path}")
-        file.save(obj_path)
-
-        # 3.5 Validate OBJ content before conversion
-        if not skip_obj_validation:
-            try:
-                validate_obj_required_objects(obj_path, required_objects)
-            except OBJValidationError as ve:
-                logger.warning(f"OBJ validation failed: {ve}")
-                if not keep_files:
-                    try:
-                        os.remove(obj_path)
-                    except Exception:
-                        pass
+        return _send_artifact(_run_obj_pipeline(_prepare_obj_request(), stream=True))
+
+    except PipelineError as e:
+        return jsonify(e.payload), e.status_code
+    except Exception as e:
+        error_trace = traceback.format_exc()
+        logger.error(f"处理 process_obj 时发生错误: {str(e)}\n{error_trace}")
+        return jsonify({
+            "status": "error",
+            "message": f"Server Error: {str(e)}",
+            "stack_trace": error_trace
+        }), 500
+
+
+job_queue = JobQueue({
+    "gml": (_run_gml_pipeline, GML_PIPELINE_STAGES),
+    "obj": (_run_obj_pipeline, OBJ_PIPELINE_STAGES),
+})
+
+
+def _job_response(job: dict) -> dict:
+    stages = [s for s in job["stages"] if s["state"] != "skipped"]
+    finished = sum(1 for s in stages if s["state"] == "done")
+    response = {
+        "status": "success",
+        "job_id": job["job_id"],
+        "kind": job["kind"],
+        "state": job["state"],
+        "stage": job["stage"],
+        "progress": 1.0 if job["state"] == DONE else round(finished / len(stages), 3) if stages else 0.0,
+        "stages": job["stages"],
+        "created": datetime.datetime.fromtimestamp(job["created"]).isoformat(),
+        "updated": datetime.datetime.fromtimestamp(job["updated"]).isoformat(),
+    }
+    if job["state"] == DONE:
+        response["result_url"] = f"/jobs/{job['job_id']}/result"
+        response["result_size"] = job["result"]["size"]
+    if job["error"]:
+        response["error"] = job["error"]
+    return response
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """非同步轉換：立即回傳 job_id，再以 GET /jobs/<id> 查詢進度、GET /jobs/<id>/result 下載結果
+    - JSON body：同 /process_gml 的參數
+    - multipart form-data 含 obj_file：同 /process_obj 的參數
+    """
+    try:
+        if request.files:
+            logger.info(f"收到 OBJ 非同步處理請求")
+            job = job_queue.submit("obj", _prepare_obj_request())
+        else:
+            data = request.get_json(silent=True)
+            if not data:
                 return jsonify({
                     "status": "error",
-                    "message": "OBJ validation failed",
-                    "missing": getattr(ve, 'missing', []),
-                    "present": getattr(ve, 'present', []),
-                    "required": getattr(ve, 'required', required_objects),
-                    "hint": "請確認 OBJ 檔內有使用 'o <name>' 或 'g <name>' 宣告名稱，例如：o floor、o roof（或 g floor、g roof）。",
-                    "details": str(ve),
+                    "message": "wrong format"
                 }), 400
-        
-        # 4. OBJ -> GML
-        logger.info(f"Converting OBJ to GML with origin ({lat}, {lon}) -> EPSG:{epsg_gml}")
-        converter = OBJToGMLConverter()
-        converter.process(obj_path, gml_path, lat, lon, epsg_gml)
-
-        # Optional: return GML for validation
-        if output_format == 'gml':
-            logger.info(f"Returning GML (skip USD conversion): {gml_path}")
-            return_data = io.BytesIO()
-            if os.path.exists(gml_path):
-                with open(gml_path, 'rb') as fo:
-                    return_data.write(fo.read())
-                return_data.seek(0)
-
-                if not keep_files:
-                    try:
-                        os.remove(obj_path)
-                        os.remove(gml_path)
-                    except Exception as e:
-                        logger.warning(f"Cleanup failed: {e}")
-
-                return send_file(
-                    return_data,
-                    mimetype='application/xml',
-                    download_name=f"{response_base}.gml",
-                )
-            else:
-                return jsonify({"status": "error", "message": "GML file not generated"}), 500
-        
-        # 5. GML -> USD
-        logger.info(
-            f"Converting GML to USD: {gml_path} -> {usd_path} (script={script_name}, "
-            f"disable_interiors={disable_interiors})"
-        )
-        convert_citygml_to_usd(
-            gml_path=gml_path,
-            usd_path=usd_path,
-            epsg_in=epsg_gml,
-            epsg_out=epsg_usd,
-            rough=True,
-            script_name=script_name,
-            disable_interiors=disable_interiors,
-        )
+            logger.info(f"收到非同步處理請求")
+            _parse_gltf_compression(data.get('gltf_compression'))  # 不支援的值在送出前就回 400
+            job = job_queue.submit("gml", data)
 
-        # 6. 回傳 USD
-        return_data = io.BytesIO()
-        if os.path.exists(usd_path):
-            # Default: if output is not specified, return a bundle zip (USD + glTF assets)
-            if output_format == '':
-                bundle_dir = os.path.join(working_dir, "processed_bundles")
-                os.makedirs(bundle_dir, exist_ok=True)
-
-                tmp_gltf_dir = os.path.join(bundle_dir, f"{response_base}_gltf_{int(time.time())}")
-                generated = usd_to_gltf_dir(usd_path, tmp_gltf_dir, base_name=response_base)
-
-                bundle_zip_path = os.path.join(bundle_dir, f"{response_base}_bundle_{int(time.time())}.zip")
-                files = [(f"{response_base}.usd", usd_path)]
-                for f in generated:
-                    files.append((os.path.basename(f), f))
-                _zip_files(bundle_zip_path, files)
-
-                with open(bundle_zip_path, 'rb') as fo:
-                    return_data.write(fo.read())
-                return_data.seek(0)
-
-                if not keep_files:
-                    try:
-                        os.remove(obj_path)
-                        os.remove(gml_path)
-                        os.remove(usd_path)
-                        for f in generated:
-                            try:
-                                os.remove(f)
-                            except Exception:
-                                pass
-                        try:
-                            os.rmdir(tmp_gltf_dir)
-                        except Exception:
-                            pass
-                        os.remove(bundle_zip_path)
-                    except Exception as e:
-                        logger.warning(f"Cleanup failed: {e}")
-
-                return send_file(return_data, mimetype='application/zip', download_name=f"{response_base}.zip")
-
-            # Optional: USD -> GLB / glTF
-            if output_format in {'glb', 'gltf', 'gltf_zip'}:
-                gltf_out_dir = os.path.join(working_dir, "processed_gltfs")
-                os.makedirs(gltf_out_dir, exist_ok=True)
-
-                if output_format == 'glb':
-                    glb_path = os.path.join(gltf_out_dir, f"{response_base}_{int(time.time())}.glb")
-                    usd_to_glb(usd_path, glb_path)
-                    with open(glb_path, 'rb') as fo:
-                        return_data.write(fo.read())
-                    return_data.seek(0)
-
-                    if not keep_files:
-                        try:
-                            os.remove(obj_path)
-                            os.remove(gml_path)
-                            os.remove(usd_path)
-                            os.remove(glb_path)
-                        except Exception as e:
-                            logger.warning(f"Cleanup failed: {e}")
-
-                    return send_file(return_data, mimetype='model/gltf-binary', download_name=f"{response_base}.glb")
-
-                if output_format == 'gltf':
-                    gltf_path = os.path.join(gltf_out_dir, f"{response_base}_{int(time.time())}.gltf")
-                    usd_to_gltf_single_file(usd_path, gltf_path, base_name=response_base)
-                    with open(gltf_path, 'rb') as fo:
-                        return_data.write(fo.read())
-                    return_data.seek(0)
-
-                    if not keep_files:
-                        try:
-                            os.remove(obj_path)
-                            os.remove(gml_path)
-                            os.remove(usd_path)
-                            os.remove(gltf_path)
-                        except Exception as e:
-                            logger.warning(f"Cleanup failed: {e}")
-
-                    return send_file(return_data, mimetype='model/gltf+json', download_name=f"{response_base}.gltf")
-
-                zip_path = os.path.join(gltf_out_dir, f"{response_base}_gltf_{int(time.time())}.zip")
-                usd_to_gltf_zip(usd_path, zip_path, base_name=response_base)
-                with open(zip_path, 'rb') as fo:
-                    return_data.write(fo.read())
-                return_data.seek(0)
-
-                if not keep_files:
-                    try:
-                        os.remove(obj_path)
-                        os.remove(gml_path)
-                        os.remove(usd_path)
-                        os.remove(zip_path)
-                    except Exception as e:
-                        logger.warning(f"Cleanup failed: {e}")
-
-                return send_file(return_data, mimetype='application/zip', download_name=f"{response_base}.zip")
-
-            with open(usd_path,'rb') as fo:
-                return_data.write(fo.read())
-            return_data.seek(0)
-            
-            # 清理
-            if not keep_files:
-                try:
-                    os.remove(obj_path)
-                    os.remove(gml_path)
-                    os.remove(usd_path)
-                except Exception as e:
-                    logger.warning(f"Cleanup failed: {e}")
-
-            return send_file(return_data, mimetype='application/octet-stream', download_name=f"{response_base}.usd")
-        else:
-             return jsonify({"status": "error", "message": "USD file not generated"}), 500
+        return jsonify(_job_response(job)), 202
 
+    except PipelineError as e:
+        return jsonify(e.payload), e.status_code
     except Exception as e:
         error_trace = traceback.format_exc()
-        logger.error(f"处理 process_obj 时发生错误: {str(e)}\n{error_trace}")
+        logger.error(f"建立 job 时发生错误: {str(e)}\n{error_trace}")
         return jsonify({
             "status": "error",
-            "message": f"Server Error: {str(e)}",
-            "stack_trace": error_trace
+            "message": f"内部服务器错误: {str(e)}"
         }), 500
 
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查詢 job 狀態與各階段進度"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"job {job_id} not found"}), 404
+    return jsonify(_job_response(job))
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """下載已完成 job 的結果（直接從磁碟串流）"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"job {job_id} not found"}), 404
+    if job["state"] != DONE:
+        response = _job_response(job)
+        response["status"] = "error"
+        response["message"] = f"job is {job['state']}"
+        return jsonify(response), 409
+
+    result = job["result"]
+    if not os.path.exists(result["path"]):
+        return jsonify({"status": "error", "message": "job result expired"}), 410
+    return _send_artifact((result["path"], result["mimetype"], result["download_name"], []))
+
 @app.route('/list_files', methods=['GET'])
 def list_files():
     """列出已处理的GML文件"""
@@ -656,6 +848,28 @@ def list_files():
             "message": f"内部服务器错误: {str(e)}"
         }), 500
 
+@app.route('/reload_manifest', methods=['POST'])
+def reload_manifest():
+    """重新掃描原始 GML 資料夾，重建檔名 -> 路徑清單（其他 worker 會在下次查詢時自動載入）"""
+    try:
+        start = time.time()
+        manifest = reload_path_manifest()
+        elapsed = time.time() - start
+        logger.info(f"重建檔案路徑清單: {len(manifest)} 個檔案, 耗時 {elapsed:.2f}s")
+        return jsonify({
+            "status": "success",
+            "count": len(manifest),
+            "elapsed_seconds": round(elapsed, 3)
+        })
+
+    except Exception as e:
+        error_trace = traceback.format_exc()
+        logger.error(f"重建檔案路徑清單时发生错误: {str(e)}\n{error_trace}")
+        return jsonify({
+            "status": "error",
+            "message": f"内部服务器错误: {str(e)}"
+        }), 500
+
 class StreamToLogger:
     def __init__(self, logger, level=logging.INFO):
         self.logger = logger
@@ -673,6 +887,20 @@ class StreamToLogger:
 sys.stdout = StreamToLogger(logger, logging.INFO)
 sys.stderr = StreamToLogger(logger, logging.ERROR)
 
+# 啟動時先載入 tile 索引並建立（或載入）檔名 -> 路徑清單，避免第一個請求才去讀取/掃描
+try:
+    get_tile_index()
+    get_path_manifest()
+except Exception as e:
+    logger.warning(f"預先載入 tile 索引或檔案路徑清單失敗，將在第一次查詢時重試: {e}")
+
+# 預先啟動轉換 worker（見 converter_pool.py）；spawn 出來的 worker 也會匯入本模組，因此只在主行程啟動
+if multiprocessing.parent_process() is None:
+    try:
+        get_converter_pool()
+    except Exception as e:
+        logger.warning(f"預先啟動轉換 worker 失敗，將在第一次轉換時重試: {e}")
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Building-level index over the CityGML source tiles.
+
+For every `cityObjectMember` of every tile we record the building id, its 2D
+bbox (EPSG:3826), its lowest z, the tile it comes from and the byte range of
+the member inside that tile. The index is stored as a directory of columnar
+`.npy` arrays plus a `meta.json` describing the tiles:
+
+    gml_index/buildings/
+        meta.json     tiles: filename, size, mtime, XML header, boundedBy, row range
+        ids.npy       building id (str)
+        bbox.npy      (N, 4) float64: min_x, min_y, max_x, max_y
+        min_z.npy     float64, NaN when the building has no coordinates
+        offset.npy    int64 byte offset of the cityObjectMember start tag
+        length.npy    int64 byte length of the cityObjectMember element
+
+Rows are grouped by tile, so a request only slices the rows of the tiles it
+matched and then reads the selected byte ranges instead of parsing the whole
+file. Tiles whose size or mtime no longer match the index are reported as
+not indexed and callers fall back to a full parse.
+
+The index is built offline by `create_gml_index.py --building-index`.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from gml_coords import element_coords
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_INDEX_DIR = os.environ.get("GML_BUILDING_INDEX", os.path.join("gml_index", "buildings"))
+
+INDEX_FORMAT_VERSION = 1
+
+GML_NS = "http://www.opengis.net/gml"
+
+_MEMBER_OPEN_RE = re.compile(rb"<(?:[\w.-]+:)?cityObjectMember[\s/>]")
+_MEMBER_CLOSE_RE = re.compile(rb"</(?:[\w.-]+:)?cityObjectMember\s*>")
+_ROOT_OPEN_RE = re.compile(rb"<((?:[\w.-]+:)?CityModel)[\s>]")
+_BOUNDED_BY_RE = re.compile(rb"<((?:[\w.-]+:)?boundedBy)[\s>].*?</\1\s*>", re.S)
+
+
+class BuildingIndexError(RuntimeError):
+    pass
+
+
+def _find_tag_end(buf, start: int) -> int:
+    """Return the offset just after the `>` closing the start tag at `start`."""
+    quote = None
+    i = start
+    n = len(buf)
+    while i < n:
+        c = buf[i:i + 1]
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in (b'"', b"'"):
+            quote = c
+        elif c == b">":
+            return i + 1
+        i += 1
+    raise BuildingIndexError("Unterminated start tag")
+
+
+def _read_header(buf) -> tuple[bytes, bytes]:
+    """Return (header, closing_tag): everything up to the end of the CityModel
+    start tag (XML declaration included), and the matching end tag."""
+    match = _ROOT_OPEN_RE.search(buf)
+    if match is None:
+        raise BuildingIndexError("CityModel root element not found")
+    header = bytes(buf[:_find_tag_end(buf, match.start())])
+    return header, b"</" + match.group(1) + b">"
+
+
+def _parse_fragment(header: bytes, closing: bytes, fragment: bytes) -> ET.Element:
+    """Parse a fragment of a tile inside its original root element so that
+    namespace prefixes and the declared encoding resolve as in the tile."""
+    return ET.fromstring(header + fragment + closing)
+
+
+def _iter_member_ranges(buf):
+    """Yield the (offset, length) byte range of each cityObjectMember."""
+    pos = 0
+    while True:
+        match = _MEMBER_OPEN_RE.search(buf, pos)
+        if match is None:
+            return
+        start = match.start()
+        tag_end = _find_tag_end(buf, start)
+        if buf[tag_end - 2:tag_end] == b"/>":
+            pos = tag_end
+            continue
+        close = _MEMBER_CLOSE_RE.search(buf, tag_end)
+        if close is None:
+            raise BuildingIndexError(f"Unterminated cityObjectMember at byte {start}")
+        yield start, close.end() - start
+        pos = close.end()
+
+
+def scan_tile(path: str) -> tuple[dict, list[tuple[str, tuple[float, float, float, float], float, int, int]]]:
+    """Scan one tile and return (tile_info, rows).
+
+    Each row is (building_id, bbox, min_z, offset, length). Members without a
+    building, an id or any coordinates are not indexed; they can never be
+    selected by `Main.process_gml_files` either.
+    """
+    # 沿用請求流程中的判斷邏輯，確保索引選出的建物與逐檔解析時一致
+    from Main import coords_to_bounds, get_building_id
+    from gml_transport_v2 import get_namespaces
+
+    st = os.stat(path)
+    rows = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        header, closing = _read_header(buf)
+        namespaces = get_namespaces(_parse_fragment(header, closing, b""))
+
+        # 與 root.find('.//gml:boundedBy') 相同：取文件中第一個 gml:boundedBy
+        bounded_by = None
+        for match in _BOUNDED_BY_RE.finditer(buf, len(header)):
+            elem = _parse_fragment(header, closing, match.group(0))[0]
+            if elem.tag == f"{{{GML_NS}}}boundedBy":
+                bounded_by = match.group(0).decode("latin-1")
+                break
+
+        for offset, length in _iter_member_ranges(buf):
+            member = _parse_fragment(header, closing, buf[offset:offset + length])[0]
+            building = next((e for e in member.iter() if e.tag.endswith("}Building")), None)
+            if building is None:
+                continue
+            building_id = get_building_id(building)
+            # 邊界與最低 z 值由同一次解析的座標陣列求得（與 get_building_bounds / get_lowest_z 相同）
+            try:
+                coords = element_coords(building, namespaces)
+            except ValueError:
+                continue
+            bounds = coords_to_bounds(coords)
+            if not building_id or not bounds:
+                continue
+            bbox = (bounds["min_x"], bounds["min_y"], bounds["max_x"], bounds["max_y"])
+            rows.append((building_id, bbox, float(coords[:, 2].min()), offset, length))
+
+    tile = {
+        "filename": os.path.basename(path),
+        "path": os.path.abspath(path),
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        # header/boundedBy 以 latin-1 存放，可無損還原成原始位元組
+        "header": header.decode("latin-1"),
+        "closing": closing.decode("latin-1"),
+        "bounded_by": bounded_by,
+    }
+    return tile, rows
+
+
+class BuildingIndex:
+    """Columnar building index loaded with memory-mapped arrays."""
+
+    def __init__(self, index_dir: str, tiles: list[dict], arrays: dict[str, np.ndarray]):
+        self.index_dir = index_dir
+        self.tiles = tiles
+        self.ids = arrays["ids"]
+        self.bbox = arrays["bbox"]
+        self.min_z = arrays["min_z"]
+        self.offset = arrays["offset"]
+        self.length = arrays["length"]
+        self._by_filename = {tile["filename"]: tile for tile in tiles}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "BuildingIndex":
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_FORMAT_VERSION:
+            raise BuildingIndexError(f"Unsupported building index version in {index_dir}")
+        arrays = {
+            name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+            for name in ("ids", "bbox", "min_z", "offset", "length")
+        }
+        return cls(index_dir, meta["tiles"], arrays)
+
+    def lookup(self, gml_file: str) -> dict | None:
+        """Return the tile entry for `gml_file`, or None when the tile is not
+        indexed or has changed on disk since the index was built."""
+        tile = self._by_filename.get(os.path.basename(gml_file))
+        if tile is None:
+            return None
+        try:
+            st = os.stat(gml_file)
+        except OSError:
+            return None
+        if st.st_size != tile["size"] or st.st_mtime != tile["mtime"]:
+            return None
+        return tile
+
+    def select(self, tile: dict, x_min: float, y_min: float, x_max: float, y_max: float) -> np.ndarray:
+        """Rows of `tile` whose bbox intersects the query range, in file order."""
+        start, stop = tile["rows"]
+        b = self.bbox[start:stop]
+        hit = (b[:, 2] >= x_min) & (b[:, 0] <= x_max) & (b[:, 3] >= y_min) & (b[:, 1] <= y_max)
+        return start + np.flatnonzero(hit)
+
+    def rows_for_ids(self, tile: dict, building_ids) -> np.ndarray:
+        """Rows of `tile` whose building id is in `building_ids`, in file order."""
+        start, stop = tile["rows"]
+        wanted = np.asarray(list(building_ids), dtype=self.ids.dtype)
+        return start + np.flatnonzero(np.isin(self.ids[start:stop], wanted))
+
+    def read_members(self, gml_file: str, tile: dict, rows) -> tuple[list[ET.Element], ET.Element | None, ET.Element]:
+        """Read and parse only the given rows of `gml_file`.
+
+        Returns (city_object_members, bounded_by, root) where `root` is an empty
+        element carrying the tile's root tag, for namespace lookup.
+        """
+        header = tile["header"].encode("latin-1")
+        closing = tile["closing"].encode("latin-1")
+        bounded_by = tile.get("bounded_by")
+        parts = [bounded_by.encode("latin-1")] if bounded_by else []
+        with open(gml_file, "rb") as f:
+            for row in rows:
+                f.seek(int(self.offset[row]))
+                parts.append(f.read(int(self.length[row])))
+        root = _parse_fragment(header, closing, b"".join(parts))
+        children = list(root)
+        if bounded_by:
+            bounded_by_elem, members = children[0], children[1:]
+        else:
+            bounded_by_elem, members = None, children
+        for child in children:
+            root.remove(child)
+        return members, bounded_by_elem, root
+
+
+def _write_index(index_dir: str, tiles: list[dict], arrays: dict[str, np.ndarray]) -> None:
+    """Write the index to a temporary directory and swap it into place."""
+    tmp_dir = f"{index_dir}.tmp"
+    old_dir = f"{index_dir}.old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array, allow_pickle=False)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_FORMAT_VERSION, "tiles": tiles}, f, ensure_ascii=False)
+
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def build_building_index(gml_files: list[str], index_dir: str = DEFAULT_INDEX_DIR, *, progress=None) -> BuildingIndex:
+    """Scan `gml_files` and write the building index to `index_dir`.
+
+    Tiles already present in an existing index with the same size and mtime
+    are not rescanned; their rows are copied over.
+    """
+    previous = None
+    if os.path.exists(os.path.join(index_dir, "meta.json")):
+        try:
+            previous = BuildingIndex.load(index_dir)
+        except Exception as e:
+            logger.warning("Ignoring existing building index %s: %s", index_dir, e)
+
+    tiles = []
+    ids, bbox, min_z, offset, length = [], [], [], [], []
+    total = len(gml_files)
+    for n, path in enumerate(gml_files, start=1):
+        first_row = len(ids)
+        old_tile = previous.lookup(path) if previous is not None else None
+        if old_tile is not None:
+            start, stop = old_tile["rows"]
+            tile = dict(old_tile, path=os.path.abspath(path))
+            ids.extend(previous.ids[start:stop].tolist())
+            bbox.extend(previous.bbox[start:stop].tolist())
+            min_z.extend(previous.min_z[start:stop].tolist())
+            offset.extend(previous.offset[start:stop].tolist())
+            length.extend(previous.length[start:stop].tolist())
+            reused = True
+        else:
+            try:
+                tile, rows = scan_tile(path)
+            except (OSError, ValueError, ET.ParseError) as e:
+                logger.warning("Skipping %s: %s", path, e)
+                continue
+            for building_id, box, z, off, size in rows:
+                ids.append(building_id)
+                bbox.append(box)
+                min_z.append(z)
+                offset.append(off)
+                length.append(size)
+            reused = False
+
+        tile["rows"] = [first_row, len(ids)]
+        tiles.append(tile)
+        if progress is not None:
+            progress(n, total, path, len(ids) - first_row, reused)
+
+    arrays = {
+        "ids": np.asarray(ids, dtype=str),
+        "bbox": np.asarray(bbox, dtype=np.float64).reshape(-1, 4),
+        "min_z": np.asarray(min_z, dtype=np.float64),
+        "offset": np.asarray(offset, dtype=np.int64),
+        "length": np.asarray(length, dtype=np.int64),
+    }
+    del previous
+    _write_index(index_dir, tiles, arrays)
+    logger.info("Built building index with %d buildings from %d tiles: %s", len(ids), len(tiles), index_dir)
+    return BuildingIndex.load(index_dir)
+
+
+_INDEX_LOCK = threading.Lock()
+_LOADED_INDEXES: dict[str, tuple[float, BuildingIndex]] = {}
+
+
+def get_building_index(index_dir: str = DEFAULT_INDEX_DIR) -> BuildingIndex | None:
+    """Return the building index, or None if it has not been built.
+
+    The index is loaded once per process and reloaded when `meta.json` is
+    replaced by a rebuild.
+    """
+    meta_path = os.path.join(index_dir, "meta.json")
+    try:
+        mtime = os.path.getmtime(meta_path)
+    except OSError:
+        return None
+
+    key = os.path.abspath(index_dir)
+    cached = _LOADED_INDEXES.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with _INDEX_LOCK:
+        cached = _LOADED_INDEXES.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            index = BuildingIndex.load(index_dir)
+        except Exception as e:
+            logger.warning("Failed to load building index %s: %s", index_dir, e)
+            return None
+        _LOADED_INDEXES[key] = (mtime, index)
+        return index
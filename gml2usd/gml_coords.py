@@ -0,0 +1,88 @@
+"""Bulk gml:posList parsing shared by the bounds / lowest-z / envelope code.
+
+All posList texts of an element are parsed with a single `np.fromstring`
+call (C loop, no per-value Python floats) into one float64 (N, 3) array;
+bounds, minimum z and the boundedBy envelope are then plain reductions over
+that array. Callers that need several of them should parse once with
+`element_coords` and reduce the same array.
+
+The rule of the old loops is kept: a posList whose value count is not a
+multiple of 3 is ignored.
+
+Malformed text is detected by comparing the number of parsed values with the
+number of whitespace-separated tokens rather than by relying on numpy: newer
+releases raise from `fromstring`, older ones (such as the pinned 2.2) only
+emit a DeprecationWarning and return the values read so far.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+import warnings
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+GML_NS = "http://www.opengis.net/gml"
+
+_EMPTY = np.empty((0, 3), dtype=np.float64)
+
+
+def poslist_elements(element: ET.Element, namespaces: dict | None = None) -> list[ET.Element]:
+    """gml:posList descendants of `element` (any namespace as a fallback)."""
+    gml_uri = (namespaces or {}).get("gml", GML_NS)
+    found = list(element.iter(f"{{{gml_uri}}}posList"))
+    if not found:
+        found = [e for e in element.iter() if isinstance(e.tag, str) and e.tag.endswith("posList")]
+    return found
+
+
+def _fromstring(text: str, count: int) -> np.ndarray:
+    """np.fromstring(text, sep=" "), raising ValueError unless exactly `count` values were read."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        try:
+            values = np.fromstring(text, dtype=np.float64, sep=" ")
+        except ValueError:
+            values = None
+    if values is None or values.size != count:
+        raise ValueError(f"could not convert posList to float: {text[:80]!r}")
+    return values
+
+
+def _parse_each(texts: list[str]) -> np.ndarray:
+    arrays = [values for values in (_fromstring(t, len(t.split())) for t in texts) if values.size % 3 == 0]
+    if not arrays:
+        return _EMPTY
+    return np.concatenate(arrays).reshape(-1, 3)
+
+
+def parse_poslists(texts: Iterable[str | None]) -> np.ndarray:
+    """Parse posList texts into one float64 (N, 3) array.
+
+    Lists whose value count is not a multiple of 3 are skipped. Non-numeric
+    values raise ValueError, as float() did.
+    """
+    # fromstring returns [-1.] for whitespace-only input
+    texts = [t for t in texts if t and not t.isspace()]
+    if not texts:
+        return _EMPTY
+    if len(texts) == 1:
+        return _parse_each(texts)
+
+    # One fromstring call for all lists; the "nan" separators mark where each list ends.
+    values = _fromstring(" nan ".join(texts), sum(len(t.split()) for t in texts) + len(texts) - 1)
+    separators = np.isnan(values)
+    breaks = np.flatnonzero(separators).tolist()
+    if len(breaks) != len(texts) - 1:
+        # the data itself contains NaN, so the separators are ambiguous
+        return _parse_each(texts)
+    edges = [-1, *breaks, values.size]
+    if any((end - start - 1) % 3 for start, end in zip(edges, edges[1:])):
+        return _parse_each(texts)
+    return values[~separators].reshape(-1, 3)
+
+
+def element_coords(element: ET.Element, namespaces: dict | None = None) -> np.ndarray:
+    """All posList coordinates below `element` as a float64 (N, 3) array."""
+    return parse_poslists(e.text for e in poslist_elements(element, namespaces))
@@ -0,0 +1,266 @@
+"""Asynchronous conversion jobs for the gml2usd API.
+
+`POST /jobs` stores the request parameters in a job directory, puts the job on
+an in-process queue and returns its id immediately; a small pool of worker
+threads runs the pipeline and records per-stage progress. The heavy steps run
+in the converter pool processes (see converter_pool.py), so the threads mostly
+wait on pipes and the gunicorn worker stays free for other requests.
+
+Job state is kept on disk (`<GML_JOB_DIR>/<job_id>/job.json`, written
+atomically) rather than in memory, because gunicorn runs several worker
+processes and `GET /jobs/<id>` may land on a different one than the submit.
+
+Configuration (environment):
+    GML_JOB_DIR        job state and results (default: processed_jobs)
+    GML_JOB_WORKERS    worker threads per API process (default: 1)
+    GML_JOB_TTL        seconds a finished job and its result are kept (default: 86400)
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_JOB_DIR = os.environ.get("GML_JOB_DIR", "processed_jobs")
+JOB_WORKERS = int(os.environ.get("GML_JOB_WORKERS", "1"))
+JOB_TTL = float(os.environ.get("GML_JOB_TTL", str(24 * 3600)))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_ACTIVE_STATES = (QUEUED, RUNNING)
+
+# runner(params, progress, unique_suffix=...) -> (artifact_path, mimetype, download_name, temp_paths)
+Runner = Callable[..., tuple]
+
+
+class JobError(RuntimeError):
+    pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """One directory per job holding job.json and, once done, the result file."""
+
+    def __init__(self, root: str = DEFAULT_JOB_DIR):
+        self.root = os.path.abspath(root)
+
+    def job_dir(self, job_id: str) -> str:
+        # job ids are uuid4 hex; anything else never maps to a directory
+        if not job_id or not job_id.isalnum():
+            raise JobError(f"invalid job id: {job_id!r}")
+        return os.path.join(self.root, job_id)
+
+    def _job_file(self, job_id: str) -> str:
+        return os.path.join(self.job_dir(job_id), "job.json")
+
+    def _write(self, job: dict) -> None:
+        path = self._job_file(job["job_id"])
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def create(self, kind: str, params: dict, stages: Sequence[str]) -> dict:
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id))
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "state": QUEUED,
+            "stage": None,
+            "stages": [{"name": name, "state": "pending", "started": None, "finished": None} for name in stages],
+            "created": now,
+            "updated": now,
+            "pid": os.getpid(),
+            "params": params,
+            "result": None,
+            "error": None,
+        }
+        self._write(job)
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        try:
+            with open(self._job_file(job_id), encoding="utf-8") as f:
+                job = json.load(f)
+        except (OSError, ValueError, JobError):
+            return None
+        # The process that owns a queued/running job is gone (gunicorn worker restarted)
+        if job["state"] in _ACTIVE_STATES and not _pid_alive(job["pid"]):
+            job["state"] = FAILED
+            job["error"] = {"message": "worker process exited before the job finished"}
+        return job
+
+    def update(self, job: dict, **fields) -> dict:
+        job.update(fields)
+        job["updated"] = time.time()
+        self._write(job)
+        return job
+
+    def purge_expired(self, ttl: float = JOB_TTL) -> int:
+        """Remove finished jobs (and their results) not updated for `ttl` seconds."""
+        if not os.path.isdir(self.root):
+            return 0
+        cutoff = time.time() - ttl
+        removed = 0
+        for job_id in os.listdir(self.root):
+            job = self.get(job_id) if job_id.isalnum() else None
+            if job is None or job["state"] in _ACTIVE_STATES or job["updated"] > cutoff:
+                continue
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+            removed += 1
+        return removed
+
+
+class JobProgress:
+    """Callable handed to a pipeline: progress("stage") marks the previous stage
+    done and `stage` running."""
+
+    def __init__(self, store: JobStore, job: dict):
+        self.store = store
+        self.job = job
+
+    def _stage(self, name: str) -> dict:
+        for stage in self.job["stages"]:
+            if stage["name"] == name:
+                return stage
+        stage = {"name": name, "state": "pending", "started": None, "finished": None}
+        self.job["stages"].append(stage)
+        return stage
+
+    def _finish_current(self, state: str) -> None:
+        if self.job["stage"] is not None:
+            stage = self._stage(self.job["stage"])
+            stage["state"] = state
+            stage["finished"] = time.time()
+
+    def __call__(self, name: str) -> None:
+        self._finish_current("done")
+        stage = self._stage(name)
+        stage["state"] = RUNNING
+        stage["started"] = time.time()
+        self.store.update(self.job, stage=name)
+
+    def finish(self, state: str, **fields) -> None:
+        self._finish_current("done" if state == DONE else FAILED)
+        for stage in self.job["stages"]:
+            if stage["state"] == "pending":
+                stage["state"] = "skipped"
+        self.store.update(self.job, state=state, stage=None, **fields)
+
+
+def _remove_paths(paths) -> None:
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning("Cleanup failed for %s: %s", path, e)
+
+
+class JobQueue:
+    """In-process queue plus worker threads running the registered pipelines.
+
+    runners maps a job kind to (runner, stages); runner(params, progress,
+    unique_suffix="_<job_id>") returns an artifact tuple (path, mimetype,
+    download_name, temp_paths). The runner names its intermediate files with
+    unique_suffix, so jobs (and sync requests) with the same parameters never
+    share a path. The artifact is moved into the job directory and temp_paths
+    are removed.
+    """
+
+    def __init__(self, runners: dict[str, tuple[Runner, Sequence[str]]], *, store: JobStore | None = None, workers: int = JOB_WORKERS):
+        self.runners = runners
+        self.store = store or JobStore()
+        self.workers = max(1, int(workers))
+        self._queue: queue.Queue[dict] = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker, name="gml-job-worker", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind: str, params: dict) -> dict:
+        if kind not in self.runners:
+            raise JobError(f"unknown job kind: {kind}")
+        os.makedirs(self.store.root, exist_ok=True)
+        try:
+            self.store.purge_expired()
+        except OSError as e:
+            logger.warning("Purging expired jobs failed: %s", e)
+        job = self.store.create(kind, params, self.runners[kind][1])
+        self._ensure_workers()
+        self._queue.put(job)
+        logger.info("Queued %s job %s (%d waiting)", kind, job["job_id"], self._queue.qsize())
+        return job
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception:
+                logger.exception("Job %s crashed the job worker", job["job_id"])
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: dict) -> None:
+        runner, _ = self.runners[job["kind"]]
+        progress = JobProgress(self.store, job)
+        self.store.update(job, state=RUNNING)
+        start = time.monotonic()
+        try:
+            path, mimetype, download_name, temp_paths = runner(job["params"], progress, unique_suffix=f"_{job['job_id']}")
+        except Exception as e:
+            payload = dict(getattr(e, "payload", None) or {"message": str(e)})
+            payload.setdefault("stack_trace", traceback.format_exc())
+            logger.error("Job %s failed: %s", job["job_id"], e)
+            progress.finish(FAILED, error=payload)
+            return
+
+        result_name = download_name or os.path.basename(path)
+        result_path = os.path.join(self.store.job_dir(job["job_id"]), "result_" + os.path.basename(result_name))
+        if path in temp_paths:
+            shutil.move(path, result_path)
+        else:
+            shutil.copyfile(path, result_path)
+        _remove_paths(p for p in temp_paths if p != path)
+
+        progress.finish(DONE, result={
+            "path": result_path,
+            "mimetype": mimetype,
+            "download_name": download_name or os.path.basename(path),
+            "size": os.path.getsize(result_path),
+        })
+        logger.info("Job %s done in %.1fs", job["job_id"], time.monotonic() - start)
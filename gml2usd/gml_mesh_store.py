@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Per-tile mesh store feeding the binary converter intermediate.
+
+Without it every request writes a GML file that citygml2aodt immediately
+parses and triangulates again with `pycitygml.load_city_gml`. The store keeps,
+for every source tile, the pycitygml meshes of the tile's ground buildings,
+extracted exactly as a request would extract them (bldg_ id prefix, generated
+floor), as a mesh bundle (see aodt_ui_gis/mesh_bundle.py):
+
+    gml_index/meshes/
+        meta.json                   tiles: filename, size, mtime, sha256, bundle, object count
+        <tile>.meshbundle/          one bundle per tile, objects named bldg_<id>
+
+For a request whose tiles are all in the store and unchanged on disk,
+`Main.generate_gml` gathers the selected buildings into one request bundle
+(a handful of array copies, no XML) and the converter memory-maps it instead
+of parsing GML. Otherwise the request falls back to writing GML.
+
+Every gathered object carries the sha256 of its tile in a "source" field.
+The converters use it to look the building up in their cache of cleaned,
+transformed meshes (aodt_ui_gis/mesh_cache.py), which `build_mesh_cache`
+fills from the store for one EPSG pair.
+
+The store and the cache are built offline by `create_gml_index.py
+--mesh-store [--mesh-cache EPSG_IN:EPSG_OUT]`, which needs pycitygml (and
+pyproj / geometry_tools for the cache); run it inside the gml2usd container.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from converter_pool import SCRIPT_DIR
+from gml_transport_v2 import CityGMLWriter, find_member_building, iter_city_object_members, select_member
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_STORE_DIR = os.environ.get("GML_MESH_STORE", os.path.join("gml_index", "meshes"))
+
+STORE_FORMAT_VERSION = 2
+
+# Same as mesh_bundle.MESH_BUNDLE_SUFFIX; requests name their bundle <gml stem> + suffix.
+MESH_BUNDLE_SUFFIX = ".meshbundle"
+
+
+class MeshStoreError(RuntimeError):
+    pass
+
+
+def _mesh_bundle():
+    """Import mesh_bundle.py, which lives next to the converter scripts."""
+    if SCRIPT_DIR not in sys.path:
+        sys.path.append(SCRIPT_DIR)
+    import mesh_bundle
+    return mesh_bundle
+
+
+def _mesh_cache():
+    """Import mesh_cache.py (converter side of the cleaned-mesh cache)."""
+    _mesh_bundle()
+    import mesh_cache
+    return mesh_cache
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_name(building_id: str) -> str:
+    """Name pycitygml gives an extracted building (its gml:id after build_output_member)."""
+    return f"bldg_{building_id}"
+
+
+def build_tile_meshes(gml_file: str, bundle_path: str) -> int:
+    """Extract the ground buildings of `gml_file`, triangulate them with
+    pycitygml and write them to `bundle_path`. Returns the object count."""
+    mesh_bundle = _mesh_bundle()
+    expected = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_gml = os.path.join(tmp, "tile.gml")
+        writer = CityGMLWriter(tmp_gml, compact=True)
+        try:
+            # select_member 會逐棟印出訊息，離線建立時不需要
+            with contextlib.redirect_stdout(io.StringIO()):
+                for member, namespaces, bounded_by in iter_city_object_members(gml_file):
+                    _, building_id = find_member_building(member, namespaces)
+                    if building_id is None:
+                        continue
+                    selected = select_member(member, {building_id}, namespaces, copy_member=False)
+                    if selected is not None:
+                        expected.append(object_name(building_id))
+                        writer.write_member(selected[1], namespaces, bounded_by)
+        finally:
+            writer.close()
+        objects = mesh_bundle.load_city_objects(tmp_gml) if expected else {}
+
+    # Requests look buildings up by name; a tile whose objects do not map 1:1
+    # to its buildings is left out of the store and keeps the GML path.
+    if set(objects) != set(expected):
+        unexpected = sorted(set(objects) ^ set(expected))
+        raise MeshStoreError(f"pycitygml objects do not match the extracted buildings (e.g. {unexpected[:3]})")
+    mesh_bundle.write_mesh_bundle(bundle_path, objects)
+    return len(objects)
+
+
+class MeshStore:
+    def __init__(self, store_dir: str, tiles: dict[str, dict]):
+        self.store_dir = store_dir
+        self.tiles = tiles
+
+    @classmethod
+    def load(cls, store_dir: str) -> "MeshStore":
+        with open(os.path.join(store_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_FORMAT_VERSION:
+            raise MeshStoreError(f"Unsupported mesh store version in {store_dir}")
+        return cls(store_dir, meta["tiles"])
+
+    def lookup(self, gml_file: str) -> dict | None:
+        """Return the tile entry for `gml_file`, or None when the tile is not
+        in the store or has changed on disk since it was built."""
+        tile = self.tiles.get(os.path.basename(gml_file))
+        if tile is None:
+            return None
+        try:
+            st = os.stat(gml_file)
+        except OSError:
+            return None
+        if st.st_size != tile["size"] or st.st_mtime != tile["mtime"]:
+            return None
+        return tile
+
+    def bundle_path(self, tile: dict) -> str:
+        return os.path.join(self.store_dir, tile["bundle"])
+
+    def write_request_bundle(self, selections, out_path: str) -> int | None:
+        """Gather the selected buildings into one bundle at `out_path`.
+
+        `selections` is [(gml_file, building_ids), ...] in output order, as
+        `Main.process_gml_files` would extract them. Returns the number of
+        buildings written, or None (nothing written) when a tile is not covered.
+        Buildings missing from a covered tile are not ground buildings; the
+        GML path skips them as well.
+        """
+        mesh_bundle = _mesh_bundle()
+        tiles = [self.lookup(gml_file) for gml_file, _ in selections]
+        if any(tile is None for tile in tiles):
+            return None
+        objects = {}
+        for (_, building_ids), tile in zip(selections, tiles):
+            names = [object_name(building_id) for building_id in building_ids]
+            tile_objects = mesh_bundle.load_mesh_bundle(self.bundle_path(tile), mmap_mode="r", names=names)
+            for structure in tile_objects.values():
+                structure["source"] = tile["sha256"]
+            objects.update(tile_objects)
+        if objects:
+            mesh_bundle.write_mesh_bundle(out_path, objects)
+        return len(objects)
+
+
+def _write_meta(store_dir: str, tiles: dict[str, dict]) -> None:
+    path = os.path.join(store_dir, "meta.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": STORE_FORMAT_VERSION, "tiles": tiles}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def build_mesh_store(gml_files: list[str], store_dir: str = DEFAULT_STORE_DIR, *, progress=None) -> MeshStore:
+    """Build (or update) the mesh store for `gml_files`.
+
+    Tiles already in the store with the same size and mtime are kept as they
+    are. Tiles that fail are logged and left out, so requests touching them
+    fall back to GML.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    previous = None
+    if os.path.exists(os.path.join(store_dir, "meta.json")):
+        try:
+            previous = MeshStore.load(store_dir)
+        except Exception as e:
+            logger.warning("Ignoring existing mesh store %s: %s", store_dir, e)
+
+    tiles = {}
+    total = len(gml_files)
+    for n, path in enumerate(gml_files, start=1):
+        filename = os.path.basename(path)
+        old_tile = previous.lookup(path) if previous is not None else None
+        if old_tile is not None:
+            tiles[filename] = old_tile
+            reused = True
+        else:
+            bundle = os.path.splitext(filename)[0] + MESH_BUNDLE_SUFFIX
+            try:
+                st = os.stat(path)
+                sha256 = file_sha256(path)
+                count = build_tile_meshes(path, os.path.join(store_dir, bundle))
+            except Exception as e:
+                logger.warning("Skipping %s: %s", path, e)
+                continue
+            tiles[filename] = {
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "sha256": sha256,
+                "bundle": bundle,
+                "objects": count,
+            }
+            reused = False
+        if progress is not None:
+            progress(n, total, path, tiles[filename]["objects"], reused)
+
+    _write_meta(store_dir, tiles)
+    referenced = {tile["bundle"] for tile in tiles.values()}
+    for name in os.listdir(store_dir):
+        if name.endswith(MESH_BUNDLE_SUFFIX) and name not in referenced:
+            shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+    logger.info("Built mesh store with %d tiles: %s", len(tiles), store_dir)
+    return MeshStore(store_dir, tiles)
+
+
+def build_mesh_cache(store: MeshStore, epsg_in: str, epsg_out: str, cache_dir: str, *, progress=None) -> int:
+    """Fill the converters' cleaned-mesh cache for one EPSG pair from `store`.
+
+    Each tile bundle is transformed and cleaned exactly as citygml2aodt would
+    (`mesh_cache.clean_city_object`) and stored under its sha256, so tiles
+    already cached, or cached under another filename, are skipped. Returns
+    the number of tiles written.
+    """
+    import pyproj
+
+    mesh_bundle = _mesh_bundle()
+    mesh_cache = _mesh_cache()
+    transform = pyproj.Transformer.from_crs(pyproj.CRS.from_epsg(epsg_in), pyproj.CRS.from_epsg(epsg_out))
+    cache = mesh_cache.MeshCache(cache_dir, epsg_in, epsg_out)
+
+    written = 0
+    total = len(store.tiles)
+    for n, (filename, tile) in enumerate(store.tiles.items(), start=1):
+        cached = cache.has_tile(tile["sha256"])
+        if not cached:
+            objects = mesh_bundle.load_mesh_bundle(store.bundle_path(tile))
+            for structure in objects.values():
+                mesh_cache.clean_city_object(structure, transform)
+            cache.put_tile(tile["sha256"], objects)
+            written += 1
+        if progress is not None:
+            progress(n, total, filename, tile["objects"], cached)
+    logger.info("Built mesh cache for EPSG:%s -> EPSG:%s (%d new tiles): %s", epsg_in, epsg_out, written, cache.root)
+    return written
+
+
+_STORE_LOCK = threading.Lock()
+_LOADED_STORES: dict[str, tuple[float, MeshStore]] = {}
+
+
+def get_mesh_store(store_dir: str = DEFAULT_STORE_DIR) -> MeshStore | None:
+    """Return the mesh store, or None if it has not been built.
+
+    Loaded once per process and reloaded when `meta.json` is replaced.
+    """
+    meta_path = os.path.join(store_dir, "meta.json")
+    try:
+        mtime = os.path.getmtime(meta_path)
+    except OSError:
+        return None
+
+    key = os.path.abspath(store_dir)
+    cached = _LOADED_STORES.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with _STORE_LOCK:
+        try:
+            store = MeshStore.load(store_dir)
+        except Exception as e:
+            logger.warning("Failed to load mesh store %s: %s", store_dir, e)
+            return None
+        _LOADED_STORES[key] = (mtime, store)
+        return store
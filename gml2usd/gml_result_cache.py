@@ -0,0 +1,183 @@
+"""Disk-backed, content-addressed cache of finished conversion results.
+
+A result is stored under the sha256 of everything that determines its bytes
+(normalized request parameters, the versions of the source tiles it was built
+from, the exclusion list, ...), so a repeat request for the same site is
+answered straight from disk without extraction, conversion or glTF export.
+
+Layout: `<root>/<key>/meta.json` + `<root>/<key>/<artifact>`. Entries are
+published with an atomic directory rename, so concurrent gunicorn workers can
+share one cache. The mtime of meta.json is the last-access time; when the
+cache grows past `max_bytes` the least recently used entries are removed.
+Caching is best-effort: an artifact larger than `max_bytes` is not stored,
+and `put` returns None instead of an entry in that case.
+
+Configuration (environment):
+    GML_RESULT_CACHE_DIR       cache directory (default: processed_cache)
+    GML_RESULT_CACHE_MAX_MB    size limit in MB; 0 disables the cache (default: 10240)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CACHE_DIR = os.environ.get("GML_RESULT_CACHE_DIR", "processed_cache")
+DEFAULT_MAX_MB = float(os.environ.get("GML_RESULT_CACHE_MAX_MB", "10240"))
+
+# Bump when the pipeline output changes in a way the key cannot see.
+CACHE_VERSION = 1
+
+
+def make_cache_key(*parts) -> str:
+    """sha256 of the JSON encoding of `parts` (dict keys sorted)."""
+    payload = json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_versions(paths: Iterable[str]) -> list[tuple[str, int, int]]:
+    """(name, size, mtime_ns) for each existing file, sorted; used as a cheap version stamp."""
+    versions = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        versions.append((os.path.basename(path), st.st_size, st.st_mtime_ns))
+    return sorted(versions)
+
+
+def file_digest(path: str) -> str | None:
+    """sha256 of a small file's content, or None if it does not exist."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class ResultCache:
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = int(DEFAULT_MAX_MB * 1024 * 1024)):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str) -> dict | None:
+        """Return the entry ({path, mimetype, download_name, size}) and mark it used, or None."""
+        meta_path = os.path.join(self._entry_dir(key), "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            path = os.path.join(self._entry_dir(key), meta["file"])
+            if not os.path.isfile(path):
+                return None
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return {"path": path, "mimetype": meta["mimetype"], "download_name": meta["download_name"], "size": meta["size"]}
+
+    def put(self, key: str, source_path: str, mimetype: str, download_name: str | None) -> dict | None:
+        """Store a copy of `source_path` (hard link when possible) under `key` and return the entry.
+
+        Returns None when the artifact does not fit in the cache (or was evicted
+        again before it could be read back); the caller then serves `source_path`.
+        """
+        size = os.path.getsize(source_path)
+        if size > self.max_bytes:
+            logger.info("Result cache: %s (%.1f MB) exceeds the cache size; not cached", key, size / (1024 * 1024))
+            return None
+        os.makedirs(self.root, exist_ok=True)
+        file_name = os.path.basename(download_name or source_path)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+        try:
+            target = os.path.join(tmp_dir, file_name)
+            try:
+                os.link(source_path, target)
+            except OSError:
+                shutil.copyfile(source_path, target)
+            meta = {
+                "file": file_name,
+                "mimetype": mimetype,
+                "download_name": download_name,
+                "size": os.path.getsize(target),
+                "created": time.time(),
+            }
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            try:
+                os.rename(tmp_dir, self._entry_dir(key))
+            except OSError:
+                # Another worker published the same key first; keep theirs.
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self.evict()
+        entry = self.get(key)
+        if entry is None:
+            logger.warning("Result cache entry %s was evicted right after it was written", key)
+        return entry
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        if not self._evict_lock.acquire(blocking=False):
+            return 0
+        try:
+            entries = []
+            total = 0
+            for name in os.listdir(self.root):
+                entry_dir = os.path.join(self.root, name)
+                meta_path = os.path.join(entry_dir, "meta.json")
+                try:
+                    last_used = os.stat(meta_path).st_mtime
+                    size = sum(e.stat().st_size for e in os.scandir(entry_dir) if e.is_file())
+                except OSError:
+                    # half-written temp dir of a crashed worker: drop it once it is old
+                    if name.startswith(".tmp-") and time.time() - os.stat(entry_dir).st_mtime > 3600:
+                        shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                entries.append((last_used, size, entry_dir))
+                total += size
+
+            removed = 0
+            entries.sort()
+            while total > self.max_bytes and entries:
+                _, size, entry_dir = entries.pop(0)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                removed += 1
+            if removed:
+                logger.info("Result cache: evicted %d entries (%.1f MB kept)", removed, total / (1024 * 1024))
+            return removed
+        except OSError as e:
+            logger.warning("Result cache eviction failed: %s", e)
+            return 0
+        finally:
+            self._evict_lock.release()
+
+
+_CACHE: ResultCache | None = None
+
+
+def get_result_cache() -> ResultCache | None:
+    """Return the process-wide cache, or None when GML_RESULT_CACHE_MAX_MB=0."""
+    global _CACHE
+    if DEFAULT_MAX_MB <= 0:
+        return None
+    if _CACHE is None:
+        _CACHE = ResultCache()
+    return _CACHE
@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Persistent spatial index over the CityGML tile envelopes.
+
+`gml_bounding_boxes_v1.csv` lists every source tile with its envelope in
+EPSG:3826. Instead of re-reading that CSV on every request, we pack the
+envelopes into a static STR (Sort-Tile-Recursive) R-tree once, save it as
+`gml_tile_index.npz`, and keep the loaded tree in memory for the lifetime of
+the worker process.
+
+Tile filenames are resolved to paths through a filename -> path manifest
+(`gml_path_manifest.bin`) built by walking the dataset folders once. The file
+is memory-mapped, so all gunicorn workers (and Main.py subprocesses) share a
+single copy through the page cache. It is rebuilt when the mtime of any
+walked directory changes, or explicitly via `reload_path_manifest()` (the
+API exposes this as `POST /reload_manifest`, reachable from localhost only).
+The directory mtimes are checked at most every
+`GML_PATH_MANIFEST_CHECK_SECONDS` (default 30) seconds per process; a
+manifest replaced by a rebuild is unmapped.
+
+Usage:
+    python3 gml_tile_index.py build [--csv gml_bounding_boxes_v1.csv] [--out gml_tile_index.npz]
+    python3 gml_tile_index.py query <x_min> <y_min> <x_max> <y_max>
+    python3 gml_tile_index.py manifest [--out gml_path_manifest.bin]
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CSV_PATH = "gml_bounding_boxes_v1.csv"
+DEFAULT_INDEX_PATH = os.environ.get("GML_TILE_INDEX", "gml_tile_index.npz")
+DEFAULT_MANIFEST_PATH = os.environ.get("GML_PATH_MANIFEST", "gml_path_manifest.bin")
+MANIFEST_CHECK_INTERVAL = float(os.environ.get("GML_PATH_MANIFEST_CHECK_SECONDS", "30"))
+DEFAULT_NODE_CAPACITY = 16
+
+# 有些資料集是把 .gml 直接放在資料夾底下（沒有 /gml 子資料夾），因此同時支援兩種結構：
+# - ./gml_original_file/<AREA>/gml/<file>.gml
+# - ./gml_original_file/<AREA>/<file>.gml
+DEFAULT_BASE_DIRS = [
+    "./gml_original_file/111_E_BUILD",
+    "./gml_original_file/111_F_BUILD",
+    "./gml_original_file/112_O_OK",
+]
+
+INDEX_FORMAT_VERSION = 1
+
+MANIFEST_MAGIC = b"GMLPATH1"
+_MANIFEST_HEAD = struct.Struct("<8sQQ")  # magic, header length, entry count
+
+
+def _parse_corner(text: str) -> tuple[float, float] | None:
+    parts = str(text or "").split()
+    if len(parts) < 2:
+        return None
+    try:
+        return float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+
+
+def read_tile_envelopes(csv_path: str) -> tuple[list[str], np.ndarray]:
+    """Read (filenames, boxes) from the bounding-box CSV.
+
+    boxes is a float64 array of shape (N, 4): min_x, min_y, max_x, max_y.
+    Rows whose corners cannot be parsed are skipped.
+    """
+    filenames: list[str] = []
+    boxes: list[tuple[float, float, float, float]] = []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            lower = _parse_corner(row.get("LowerCorner"))
+            upper = _parse_corner(row.get("UpperCorner"))
+            filename = (row.get("Filename") or "").strip()
+            if not filename or lower is None or upper is None:
+                logger.warning("Skipping tile with invalid envelope: %r", row)
+                continue
+            filenames.append(filename)
+            boxes.append((lower[0], lower[1], upper[0], upper[1]))
+    return filenames, np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def _str_order(boxes: np.ndarray, capacity: int) -> np.ndarray:
+    """Return the Sort-Tile-Recursive ordering of `boxes`."""
+    n = boxes.shape[0]
+    if n <= capacity:
+        return np.arange(n)
+    cx = 0.5 * (boxes[:, 0] + boxes[:, 2])
+    cy = 0.5 * (boxes[:, 1] + boxes[:, 3])
+    n_nodes = math.ceil(n / capacity)
+    n_slabs = math.ceil(math.sqrt(n_nodes))
+    slab_size = n_slabs * capacity
+
+    by_x = np.argsort(cx, kind="stable")
+    order = []
+    for start in range(0, n, slab_size):
+        slab = by_x[start:start + slab_size]
+        order.append(slab[np.argsort(cy[slab], kind="stable")])
+    return np.concatenate(order)
+
+
+def _pack_level(boxes: np.ndarray, capacity: int) -> np.ndarray:
+    """Bounding boxes of consecutive groups of `capacity` entries."""
+    n = boxes.shape[0]
+    starts = np.arange(0, n, capacity)
+    return np.column_stack([
+        np.minimum.reduceat(boxes[:, 0], starts),
+        np.minimum.reduceat(boxes[:, 1], starts),
+        np.maximum.reduceat(boxes[:, 2], starts),
+        np.maximum.reduceat(boxes[:, 3], starts),
+    ])
+
+
+class TileIndex:
+    """Static packed R-tree over tile envelopes.
+
+    levels[0] holds the leaf entries (one box per tile, in STR order, with
+    `items[i]` the index into `filenames`). Every following level holds the
+    boxes of consecutive groups of `capacity` entries of the level below, so
+    the children of node `i` are entries `[i*capacity, (i+1)*capacity)`.
+    The last level is the single root node.
+    """
+
+    def __init__(self, filenames: list[str], items: np.ndarray, levels: list[np.ndarray], capacity: int):
+        self.filenames = list(filenames)
+        self.items = items
+        self.levels = levels
+        self.capacity = int(capacity)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @classmethod
+    def build(cls, filenames: list[str], boxes: np.ndarray, capacity: int = DEFAULT_NODE_CAPACITY) -> "TileIndex":
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if boxes.shape[0] == 0:
+            return cls(filenames, np.zeros(0, dtype=np.int64), [boxes], capacity)
+
+        # Leaves are sorted once (STR); upper levels pack consecutive nodes,
+        # which are already spatially coherent because of that ordering.
+        order = _str_order(boxes, capacity)
+        levels = [boxes[order]]
+        while levels[-1].shape[0] > 1:
+            levels.append(_pack_level(levels[-1], capacity))
+        return cls(filenames, order.astype(np.int64), levels, capacity)
+
+    def query(self, x_min: float, y_min: float, x_max: float, y_max: float) -> list[str]:
+        """Return the filenames of all tiles whose envelope intersects the bbox."""
+        if not len(self.items):
+            return []
+        fan_out = np.arange(self.capacity)
+        nodes = np.zeros(1, dtype=np.int64)
+        for depth in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[depth]
+            b = boxes[nodes]
+            hit = (b[:, 2] >= x_min) & (b[:, 0] <= x_max) & (b[:, 3] >= y_min) & (b[:, 1] <= y_max)
+            nodes = nodes[hit]
+            if not nodes.size:
+                return []
+            if depth:
+                nodes = (nodes[:, None] * self.capacity + fan_out).ravel()
+                nodes = nodes[nodes < self.levels[depth - 1].shape[0]]
+        return [self.filenames[i] for i in np.sort(self.items[nodes])]
+
+    def save(self, path: str, *, source_mtime: float = 0.0) -> None:
+        arrays = {f"level_{i}": level for i, level in enumerate(self.levels)}
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            version=np.int64(INDEX_FORMAT_VERSION),
+            capacity=np.int64(self.capacity),
+            source_mtime=np.float64(source_mtime),
+            filenames=np.asarray(self.filenames, dtype=str),
+            items=self.items,
+            **arrays,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> tuple["TileIndex", float]:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported tile index version in {path}")
+            n_levels = sum(1 for key in data.files if key.startswith("level_"))
+            levels = [data[f"level_{i}"] for i in range(n_levels)]
+            index = cls(data["filenames"].tolist(), data["items"], levels, int(data["capacity"]))
+            return index, float(data["source_mtime"])
+
+
+
+def build_tile_index(
+    csv_path: str = DEFAULT_CSV_PATH,
+    index_path: str = DEFAULT_INDEX_PATH,
+    *,
+    capacity: int = DEFAULT_NODE_CAPACITY,
+) -> TileIndex:
+    """Build the tile index from the bounding-box CSV and save it to disk."""
+    filenames, boxes = read_tile_envelopes(csv_path)
+    index = TileIndex.build(filenames, boxes, capacity=capacity)
+    index.save(index_path, source_mtime=os.path.getmtime(csv_path))
+    logger.info("Built tile index with %d tiles: %s", len(index), index_path)
+    return index
+
+
+_INDEX_LOCK = threading.Lock()
+_LOADED_INDEXES: dict[str, TileIndex] = {}
+
+
+def get_tile_index(csv_path: str = DEFAULT_CSV_PATH, index_path: str = DEFAULT_INDEX_PATH) -> TileIndex:
+    """Return the tile index, loading it at most once per process.
+
+    The on-disk index is (re)built from the CSV when it is missing or older
+    than the CSV. If the index cannot be written (read-only deployment), the
+    in-memory tree is still used.
+    """
+    key = os.path.abspath(index_path)
+    index = _LOADED_INDEXES.get(key)
+    if index is not None:
+        return index
+
+    with _INDEX_LOCK:
+        index = _LOADED_INDEXES.get(key)
+        if index is not None:
+            return index
+
+        csv_mtime = os.path.getmtime(csv_path) if os.path.exists(csv_path) else None
+        if os.path.exists(index_path):
+            try:
+                index, source_mtime = TileIndex.load(index_path)
+                if csv_mtime is not None and source_mtime < csv_mtime:
+                    logger.info("Tile index %s is older than %s; rebuilding", index_path, csv_path)
+                    index = None
+            except Exception as e:
+                logger.warning("Failed to load tile index %s: %s", index_path, e)
+                index = None
+
+        if index is None:
+            try:
+                index = build_tile_index(csv_path, index_path)
+            except OSError as e:
+                logger.warning("Cannot write tile index %s (%s); using in-memory index", index_path, e)
+                index = TileIndex.build(*read_tile_envelopes(csv_path))
+
+        _LOADED_INDEXES[key] = index
+        return index
+
+
+def _walk_tile_files(base_dirs: list[str]) -> tuple[dict[str, str], dict[str, float]]:
+    """Walk `base_dirs` once and return ({filename: path}, {directory: mtime}).
+
+    When a filename occurs more than once, the lookup order of the former
+    per-request search is kept: earlier base dirs first, and within a base
+    `<base>/gml/` before `<base>/` before any deeper folder.
+    """
+    best: dict[str, tuple[tuple[int, int], str]] = {}
+    dir_mtimes: dict[str, float] = {}
+    for base_idx, base in enumerate(base_dirs):
+        base = os.path.abspath(base)
+        if not os.path.isdir(base):
+            # 記錄不存在的資料夾，之後被建立時也會觸發重建
+            dir_mtimes[base] = -1.0
+            continue
+        preferred = {os.path.join(base, "gml"): 0, base: 1}
+        for root, _, files in os.walk(base):
+            dir_mtimes[root] = os.path.getmtime(root)
+            rank = (base_idx, preferred.get(root, 2))
+            for name in files:
+                current = best.get(name)
+                if current is None or rank < current[0]:
+                    best[name] = (rank, os.path.join(root, name))
+    return {name: path for name, (_, path) in best.items()}, dir_mtimes
+
+
+def _serialize_manifest(paths: dict[str, str], base_dirs: list[str], dir_mtimes: dict[str, float]) -> bytes:
+    """Layout: head, JSON header, padding to 8 bytes, uint64 offsets (n + 1),
+    then the entries `filename\0path` sorted by filename bytes."""
+    entries = sorted(f"{name}\0{path}".encode("utf-8") for name, path in paths.items())
+    offsets = np.zeros(len(entries) + 1, dtype="<u8")
+    np.cumsum([len(e) for e in entries], out=offsets[1:])
+    header = json.dumps({
+        "base_dirs": [os.path.abspath(d) for d in base_dirs],
+        "dirs": dir_mtimes,
+    }).encode("utf-8")
+    header += b" " * (-(_MANIFEST_HEAD.size + len(header)) % 8)
+    return b"".join([
+        _MANIFEST_HEAD.pack(MANIFEST_MAGIC, len(header), len(entries)),
+        header,
+        offsets.tobytes(),
+        *entries,
+    ])
+
+
+class PathManifest:
+    """Read-only filename -> path lookup over a serialized manifest.
+
+    `buf` is normally an mmap of the manifest file; lookups binary-search the
+    sorted entries in place without building a per-process dict. The mmap is
+    closed by `close()` once a newer manifest replaces this one.
+    """
+
+    def __init__(self, buf, file_id: tuple | None = None):
+        magic, header_len, count = _MANIFEST_HEAD.unpack_from(buf, 0)
+        if magic != MANIFEST_MAGIC:
+            raise ValueError("Not a GML path manifest")
+        start = _MANIFEST_HEAD.size
+        header = json.loads(bytes(buf[start:start + header_len]))
+        self.base_dirs = header["base_dirs"]
+        self.dir_mtimes = header["dirs"]
+        self.file_id = file_id
+        self._buf = buf
+        self._count = int(count)
+        self._offsets = np.frombuffer(buf, dtype="<u8", count=self._count + 1, offset=start + header_len)
+        self._entries_start = start + header_len + self._offsets.nbytes
+        self._checked_at = None
+
+    @classmethod
+    def open(cls, path: str) -> "PathManifest":
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buf, file_id=(st.st_ino, st.st_mtime_ns, st.st_size))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, i: int) -> bytes:
+        base = self._entries_start
+        return self._buf[base + int(self._offsets[i]):base + int(self._offsets[i + 1])]
+
+    def get(self, filename: str) -> str | None:
+        key = filename.encode("utf-8") + b"\0"
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count:
+            entry = self._entry(lo)
+            if entry.startswith(key):
+                return entry[len(key):].decode("utf-8")
+        return None
+
+    def matches(self, base_dirs: list[str]) -> bool:
+        return self.base_dirs == [os.path.abspath(d) for d in base_dirs]
+
+    def is_stale(self, max_age: float = 0.0) -> bool:
+        """True when any walked directory was modified, created or removed.
+
+        With `max_age`, the directories are stat'ed at most once per `max_age`
+        seconds; a stale manifest is replaced right away, so in between the
+        answer is False.
+        """
+        now = time.monotonic()
+        if max_age > 0 and self._checked_at is not None and now - self._checked_at < max_age:
+            return False
+        for directory, mtime in self.dir_mtimes.items():
+            try:
+                current = os.path.getmtime(directory)
+            except OSError:
+                current = -1.0
+            if current != mtime:
+                return True
+        self._checked_at = now
+        return False
+
+    def close(self) -> None:
+        # the offsets view must go first: an mmap with exported buffers cannot be closed
+        self._offsets = None
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+
+def _file_id(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def build_path_manifest(base_dirs: list[str] | None = None, manifest_path: str = DEFAULT_MANIFEST_PATH) -> PathManifest:
+    """Walk the dataset folders and write the manifest (atomically).
+
+    If the manifest cannot be written (read-only deployment), the serialized
+    manifest is kept in memory for this process only.
+    """
+    base_dirs = list(base_dirs) if base_dirs is not None else list(DEFAULT_BASE_DIRS)
+    walked_at = time.monotonic()
+    paths, dir_mtimes = _walk_tile_files(base_dirs)
+    data = _serialize_manifest(paths, base_dirs, dir_mtimes)
+    tmp_path = f"{manifest_path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, manifest_path)
+        manifest = PathManifest.open(manifest_path)
+        logger.info("Built path manifest with %d files from %d directories: %s", len(paths), len(dir_mtimes), manifest_path)
+    except OSError as e:
+        logger.warning("Cannot write path manifest %s (%s); using in-memory manifest", manifest_path, e)
+        manifest = PathManifest(data)
+    # the walk itself was the staleness check
+    manifest._checked_at = walked_at
+    return manifest
+
+
+_MANIFEST_LOCK = threading.Lock()
+_LOADED_MANIFESTS: dict[str, PathManifest] = {}
+
+
+def _install_manifest(key: str, manifest: PathManifest) -> PathManifest:
+    """Make `manifest` the loaded one and unmap the one it replaces (caller holds _MANIFEST_LOCK)."""
+    previous = _LOADED_MANIFESTS.get(key)
+    _LOADED_MANIFESTS[key] = manifest
+    if previous is not None and previous is not manifest:
+        previous.close()
+    return manifest
+
+
+def _current_manifest(base_dirs: list[str], manifest_path: str) -> PathManifest:
+    """get_path_manifest without the lock."""
+    key = os.path.abspath(manifest_path)
+    manifest = _LOADED_MANIFESTS.get(key)
+    file_id = _file_id(manifest_path)
+    if file_id is not None and (manifest is None or manifest.file_id != file_id):
+        try:
+            manifest = _install_manifest(key, PathManifest.open(manifest_path))
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load path manifest %s: %s", manifest_path, e)
+            manifest = None
+
+    if manifest is None or not manifest.matches(base_dirs) or manifest.is_stale(MANIFEST_CHECK_INTERVAL):
+        manifest = _install_manifest(key, build_path_manifest(base_dirs, manifest_path))
+    return manifest
+
+
+def get_path_manifest(base_dirs: list[str] | None = None, manifest_path: str = DEFAULT_MANIFEST_PATH) -> PathManifest:
+    """Return the path manifest, rebuilding it only when it is out of date.
+
+    A manifest written by another worker (rebuild or reload) is picked up by
+    comparing the file identity with the mapped one. The returned manifest is
+    closed when a newer one replaces it, so look paths up through
+    `resolve_tile_paths` rather than holding on to it.
+    """
+    base_dirs = list(base_dirs) if base_dirs is not None else list(DEFAULT_BASE_DIRS)
+    with _MANIFEST_LOCK:
+        return _current_manifest(base_dirs, manifest_path)
+
+
+def reload_path_manifest(base_dirs: list[str] | None = None, manifest_path: str = DEFAULT_MANIFEST_PATH) -> PathManifest:
+    """Force a rebuild of the path manifest (e.g. after files were replaced in place)."""
+    base_dirs = list(base_dirs) if base_dirs is not None else list(DEFAULT_BASE_DIRS)
+    with _MANIFEST_LOCK:
+        return _install_manifest(os.path.abspath(manifest_path), build_path_manifest(base_dirs, manifest_path))
+
+
+def resolve_tile_paths(
+    filenames: list[str], base_dirs: list[str] | None = None, manifest_path: str = DEFAULT_MANIFEST_PATH
+) -> list[str | None]:
+    """Resolve tile filenames to absolute paths (None when missing) under the dataset folders.
+
+    The lookups run under the manifest lock, so a concurrent rebuild cannot
+    unmap the manifest while it is being searched.
+    """
+    base_dirs = list(base_dirs) if base_dirs is not None else list(DEFAULT_BASE_DIRS)
+    with _MANIFEST_LOCK:
+        manifest = _current_manifest(base_dirs, manifest_path)
+        return [manifest.get(name) for name in filenames]
+
+
+def resolve_tile_path(filename: str, base_dirs: list[str] | None = None) -> str | None:
+    """Resolve a tile filename to an absolute path under the dataset folders."""
+    return resolve_tile_paths([filename], base_dirs)[0]
+
+
+def find_tile_paths(
+    x_min: float,
+    y_min: float,
+    x_max: float,
+    y_max: float,
+    *,
+    csv_path: str = DEFAULT_CSV_PATH,
+    index_path: str = DEFAULT_INDEX_PATH,
+    base_dirs: list[str] | None = None,
+) -> list[str]:
+    """Return absolute paths of the tiles intersecting an EPSG:3826 bbox.
+
+    Tiles listed in the index but missing on disk are skipped with a warning.
+    """
+    filenames = get_tile_index(csv_path, index_path).query(x_min, y_min, x_max, y_max)
+    paths = []
+    for filename, path in zip(filenames, resolve_tile_paths(filenames, base_dirs)):
+        if path is None:
+            print(f"警告: 找不到原始 GML 檔案 {filename} (已查詢: {base_dirs or DEFAULT_BASE_DIRS})")
+            continue
+        paths.append(path)
+    return paths
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or query the GML tile index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="build the index from the bounding-box CSV")
+    build_parser.add_argument("--csv", default=DEFAULT_CSV_PATH)
+    build_parser.add_argument("--out", default=DEFAULT_INDEX_PATH)
+    build_parser.add_argument("--capacity", type=int, default=DEFAULT_NODE_CAPACITY)
+
+    query_parser = sub.add_parser("query", help="list tiles intersecting an EPSG:3826 bbox")
+    query_parser.add_argument("bbox", nargs=4, type=float, metavar=("X_MIN", "Y_MIN", "X_MAX", "Y_MAX"))
+    query_parser.add_argument("--csv", default=DEFAULT_CSV_PATH)
+    query_parser.add_argument("--index", default=DEFAULT_INDEX_PATH)
+
+    manifest_parser = sub.add_parser("manifest", help="rebuild the filename -> path manifest")
+    manifest_parser.add_argument("--out", default=DEFAULT_MANIFEST_PATH)
+    manifest_parser.add_argument("--base-dir", action="append", dest="base_dirs", help="dataset folder (repeatable)")
+
+    args = parser.parse_args(argv)
+    if args.command == "manifest":
+        manifest = reload_path_manifest(args.base_dirs, args.out)
+        print(f"已建立檔案路徑清單 {args.out}，共 {len(manifest)} 個檔案")
+    elif args.command == "build":
+        index = build_tile_index(args.csv, args.out, capacity=args.capacity)
+        print(f"已建立索引 {args.out}，共 {len(index)} 個 GML 檔案")
+    else:
+        x_min, y_min, x_max, y_max = args.bbox
+        for filename in get_tile_index(args.csv, args.index).query(x_min, y_min, x_max, y_max):
+            print(filename)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    main()
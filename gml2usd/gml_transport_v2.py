@@ -2,8 +2,11 @@ import xml.etree.ElementTree as ET
 import re
 from pathlib import Path
 import os
-from xml.dom import minidom
 import copy
+import shutil
+import tempfile
+import numpy as np
+from gml_coords import element_coords
 
 def read_building_ids(building_ids_file):
     """從文件中讀取建築物 ID 列表"""
@@ -22,53 +25,28 @@ def read_building_ids(building_ids_file):
 def get_lowest_z(building_element, namespaces):
     """獲取建築物所有座標中最低的 z 值"""
     try:
-        # 查找所有 posList 元素
-        poslist_elements = building_element.findall('.//gml:posList', namespaces)
-        if not poslist_elements:
-            poslist_elements = building_element.findall('.//*', namespaces)
-            poslist_elements = [elem for elem in poslist_elements if elem.tag.endswith('posList')]
-        
-        lowest_z = float('inf')  # 初始化為無限大
-        
-        for poslist in poslist_elements:
-            if poslist.text:
-                # 分割座標
-                coords = poslist.text.strip().split()
-                # 確保座標數量是 3 的倍數
-                if len(coords) % 3 == 0:
-                    # 獲取所有 z 座標
-                    z_coords = [float(coords[i]) for i in range(2, len(coords), 3)]
-                    # 更新最低 z 值
-                    if z_coords:
-                        current_min = min(z_coords)
-                        lowest_z = min(lowest_z, current_min)
-        
-        return lowest_z if lowest_z != float('inf') else None
+        # 所有 posList 一次解析成 (N, 3) 陣列（見 gml_coords.py）
+        coords = element_coords(building_element, namespaces)
+        return float(coords[:, 2].min()) if len(coords) else None
         
     except Exception as e:
         print(f"計算最低 z 座標時出錯: {e}")
         return None
 
-def extract_buildings_from_gml(source_gml, building_ids, output_gml):
-    """
-    從源 GML 文件中提取指定建築物 ID 的資訊，並完整複製到輸出 GML 文件
-    同時自動生成底面（floor）信息
-    
-    Args:
-        source_gml (str): 源 GML 文件路徑
-        building_ids (list): 要提取的建築物 ID 列表
-        output_gml (str): 輸出 GML 文件路徑
-    """
-    print(f"從 {source_gml} 提取建築物: {', '.join(building_ids)}")
-    
-    # 解析源 GML 文件
-    try:
-        tree = ET.parse(source_gml)
-        root = tree.getroot()
-    except Exception as e:
-        print(f"解析源 GML 文件時出錯: {e}")
-        return
-    
+# 基本的命名空間；ElementTree 解析後不會保留 xmlns 屬性，因此以此為準
+DEFAULT_NAMESPACES = {
+    'core': "http://www.opengis.net/citygml/2.0",
+    'gml': "http://www.opengis.net/gml",
+    'bldg': "http://www.opengis.net/citygml/building/2.0",
+    'xsi': "http://www.w3.org/2001/XMLSchema-instance",
+    'xlink': "http://www.w3.org/1999/xlink",
+}
+
+# xml: 前綴固定綁定此 URI，不能（也不需要）宣告
+XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+
+def get_namespaces(root):
+    """從源文件根元素取得命名空間，並補上基本的命名空間"""
     # 從源文件提取命名空間
     namespaces = {}
     for prefix, uri in root.attrib.items():
@@ -77,278 +55,556 @@ def extract_buildings_from_gml(source_gml, building_ids, output_gml):
             namespaces[ns_prefix] = uri
     
     # 確保有基本的命名空間
-    if 'core' not in namespaces:
-        namespaces['core'] = "http://www.opengis.net/citygml/2.0"
-    if 'gml' not in namespaces:
-        namespaces['gml'] = "http://www.opengis.net/gml"
-    if 'bldg' not in namespaces:
-        namespaces['bldg'] = "http://www.opengis.net/citygml/building/2.0"
-    if 'xsi' not in namespaces:
-        namespaces['xsi'] = "http://www.w3.org/2001/XMLSchema-instance"
-    if 'xlink' not in namespaces:
-        namespaces['xlink'] = "http://www.w3.org/1999/xlink"
-    
-    # 創建新的 XML 根元素，保留源文件的命名空間
-    new_root = ET.Element("{http://www.opengis.net/citygml/2.0}CityModel")
-    for prefix, uri in namespaces.items():
-        new_root.set(f"xmlns:{prefix}", uri)
-    
-    if 'xsi' in namespaces:
-        new_root.set("xsi:schemaLocation", "http://www.opengis.net/citygml/2.0 http://schemas.opengis.net/citygml/2.0/cityGMLBase.xsd")
-    
-    # 從源文件複製 boundedBy 元素
-    bounded_by = root.find('.//gml:boundedBy', namespaces)
-    if bounded_by is not None:
-        # 使用 ET.tostring 和 ET.fromstring 來完整複製元素
-        bounded_by_str = ET.tostring(bounded_by, encoding='unicode')
-        new_bounded_by = ET.fromstring(bounded_by_str)
-        new_root.append(new_bounded_by)
+    for ns_prefix, uri in DEFAULT_NAMESPACES.items():
+        namespaces.setdefault(ns_prefix, uri)
     
+    return namespaces
+
+def find_member_building(city_object_member, namespaces):
+    """在 cityObjectMember 中查找建築物，回傳 (building, building_id)"""
+    # 在 cityObjectMember 中查找建築物
+    building = None
+    building_id = None
     
-    # 找到所有 cityObjectMember 元素
-    city_object_members = []
+    # 嘗試不同的方式查找建築物
     try:
-        city_object_members = root.findall('.//core:cityObjectMember', namespaces)
+        buildings = city_object_member.findall('.//bldg:Building', namespaces)
+        if buildings:
+            building = buildings[0]
     except:
         pass
     
-    if not city_object_members:
-        try:
-            city_object_members = root.findall('.//*', namespaces)
-            city_object_members = [elem for elem in city_object_members if elem.tag.endswith('cityObjectMember')]
-        except:
-            pass
-    
-    # 檢查所有建築物是否存在
-    missing_buildings = []
-    found_buildings = []
-    
-    for city_object_member in city_object_members:
-        # 在 cityObjectMember 中查找建築物
-        building = None
-        building_id = None
-        
-        # 嘗試不同的方式查找建築物
+    if building is None:
         try:
-            buildings = city_object_member.findall('.//bldg:Building', namespaces)
+            buildings = city_object_member.findall('.//*', namespaces)
+            buildings = [elem for elem in buildings if elem.tag.endswith('Building')]
             if buildings:
                 building = buildings[0]
         except:
             pass
+    
+    if building is not None:
+        # 嘗試從不同的屬性中獲取建築物 ID
+        for id_attr in ['{http://www.opengis.net/gml}id', 'id', 'gml:id']:
+            if id_attr in building.attrib:
+                building_id = building.attrib[id_attr]
+                # 如果 ID 以 "bldg_" 開頭，去掉前綴
+                if building_id.startswith('bldg_'):
+                    building_id = building_id[5:]
+                break
         
-        if building is None:
+        # 如果沒有從屬性中找到 ID，嘗試從子元素中查找
+        if building_id is None:
             try:
-                buildings = city_object_member.findall('.//*', namespaces)
-                buildings = [elem for elem in buildings if elem.tag.endswith('Building')]
-                if buildings:
-                    building = buildings[0]
+                id_elements = building.findall('.//BUILD_ID', namespaces)
+                if id_elements and id_elements[0].text:
+                    building_id = id_elements[0].text
             except:
                 pass
         
-        if building is not None:
-            # 嘗試從不同的屬性中獲取建築物 ID
-            for id_attr in ['{http://www.opengis.net/gml}id', 'id', 'gml:id']:
-                if id_attr in building.attrib:
-                    building_id = building.attrib[id_attr]
-                    # 如果 ID 以 "bldg_" 開頭，去掉前綴
-                    if building_id.startswith('bldg_'):
-                        building_id = building_id[5:]
-                    break
-            
-            # 如果沒有從屬性中找到 ID，嘗試從子元素中查找
-            if building_id is None:
-                try:
-                    id_elements = building.findall('.//BUILD_ID', namespaces)
-                    if id_elements and id_elements[0].text:
-                        building_id = id_elements[0].text
-                except:
-                    pass
-            
-            if building_id is None:
-                try:
-                    id_elements = building.findall('.//gml:name', namespaces)
-                    if id_elements and id_elements[0].text:
-                        building_id = id_elements[0].text
-                except:
-                    pass
-            
-            if building_id is None:
-                try:
-                    id_elements = building.findall('.//*', namespaces)
-                    id_elements = [elem for elem in id_elements if elem.tag.endswith('name') or elem.tag.endswith('BUILD_ID')]
-                    if id_elements and id_elements[0].text:
-                        building_id = id_elements[0].text
-                except:
-                    pass
+        if building_id is None:
+            try:
+                id_elements = building.findall('.//gml:name', namespaces)
+                if id_elements and id_elements[0].text:
+                    building_id = id_elements[0].text
+            except:
+                pass
         
-        # 如果找到了建築物 ID，檢查是否在要提取的列表中
-        if building_id is not None and building_id in building_ids:
-            # 檢查建築物的最低 z 值
-            lowest_z = get_lowest_z(building, namespaces)
-            if lowest_z is None or abs(lowest_z) > 0.001:  # 使用小的閾值來判斷是否為 0
-                print(f"跳過建築物 {building_id}：最低 z 值為 {lowest_z}，不是地面建築")
-                continue
-                
-            print(f"找到建築物: {building_id}")
-            found_buildings.append(building_id)
-            
-            # 使用 ET.tostring 和 ET.fromstring 來完整複製 cityObjectMember 元素
-            city_object_member_str = ET.tostring(city_object_member, encoding='unicode')
-            new_city_object_member = ET.fromstring(city_object_member_str)
-            
-            # 修改建築物 ID，添加 bldg_ 前綴
+        if building_id is None:
             try:
-                # 查找建築物元素
-                building_elems = new_city_object_member.findall('.//*', namespaces)
-                for elem in building_elems:
-                    if elem.tag.endswith('Building'):
-                        # 修改 gml:id 屬性
-                        for attr_name, attr_value in elem.attrib.items():
-                            if attr_name.endswith('id'):
-                                if not attr_value.startswith('bldg_'):
-                                    elem.attrib[attr_name] = f"bldg_{attr_value}"
-                                break
-            except Exception as e:
-                print(f"修改建築物 ID 時出錯: {e}")
-            
-            # 在新的 cityObjectMember 中查找 lod1Solid 元素
-            lod1_solid = None
+                id_elements = building.findall('.//*', namespaces)
+                id_elements = [elem for elem in id_elements if elem.tag.endswith('name') or elem.tag.endswith('BUILD_ID')]
+                if id_elements and id_elements[0].text:
+                    building_id = id_elements[0].text
+            except:
+                pass
+    
+    return building, building_id
+
+def build_output_member(city_object_member, building_id, namespaces, copy_member=True):
+    """複製 cityObjectMember，將建築物 ID 加上 bldg_ 前綴，並依 Roof/S_0 自動生成底面（floor）
+    
+    copy_member=False 時直接修改傳入的元素（串流提取時源元素用完即丟）
+    """
+    if copy_member:
+        # 使用 ET.tostring 和 ET.fromstring 來完整複製 cityObjectMember 元素
+        city_object_member_str = ET.tostring(city_object_member, encoding='unicode')
+        new_city_object_member = ET.fromstring(city_object_member_str)
+    else:
+        new_city_object_member = city_object_member
+    
+    # 修改建築物 ID，添加 bldg_ 前綴
+    try:
+        # 查找建築物元素
+        building_elems = new_city_object_member.findall('.//*', namespaces)
+        for elem in building_elems:
+            if elem.tag.endswith('Building'):
+                # 修改 gml:id 屬性
+                for attr_name, attr_value in elem.attrib.items():
+                    if attr_name.endswith('id'):
+                        if not attr_value.startswith('bldg_'):
+                            elem.attrib[attr_name] = f"bldg_{attr_value}"
+                        break
+    except Exception as e:
+        print(f"修改建築物 ID 時出錯: {e}")
+    
+    # 在新的 cityObjectMember 中查找 lod1Solid 元素
+    lod1_solid = None
+    try:
+        lod1_solids = new_city_object_member.findall('.//bldg:lod1Solid', namespaces)
+        if lod1_solids:
+            lod1_solid = lod1_solids[0]
+    except:
+        pass
+    
+    if lod1_solid is None:
+        try:
+            lod1_solids = new_city_object_member.findall('.//*', namespaces)
+            lod1_solids = [elem for elem in lod1_solids if elem.tag.endswith('lod1Solid')]
+            if lod1_solids:
+                lod1_solid = lod1_solids[0]
+        except:
+            pass
+    
+    if lod1_solid is not None:
+        # 在 lod1Solid 中查找 CompositeSurface 元素
+        composite_surface = None
+        try:
+            composite_surfaces = lod1_solid.findall('.//gml:CompositeSurface', namespaces)
+            if composite_surfaces:
+                composite_surface = composite_surfaces[0]
+        except:
+            pass
+        
+        if composite_surface is None:
             try:
-                lod1_solids = new_city_object_member.findall('.//bldg:lod1Solid', namespaces)
-                if lod1_solids:
-                    lod1_solid = lod1_solids[0]
+                composite_surfaces = lod1_solid.findall('.//*', namespaces)
+                composite_surfaces = [elem for elem in composite_surfaces if elem.tag.endswith('CompositeSurface')]
+                if composite_surfaces:
+                    composite_surface = composite_surfaces[0]
             except:
                 pass
+        
+        if composite_surface is not None:
+            roof_element = None
+            matched_type = None  # 用來記錄是匹配到 Roof 還是 S_0
+
+            try:
+                target_ids = {
+                    f"ID_{building_id}_Roof": "Roof",
+                    f"ID_{building_id}_S_0": "S_0"
+                }
+
+                for elem in composite_surface.findall('.//*', namespaces):
+                    for attr_name, attr_value in elem.attrib.items():
+                        if attr_value in target_ids and elem.tag.endswith('CompositeSurface'):
+                            roof_element = elem
+                            matched_type = target_ids[attr_value]  # 儲存是哪一個類型
+                            break
+                    if roof_element is not None:
+                        break
+
+            except Exception as e:
+                print(f"[WARN] 查找過程出錯: {e}")
+
             
-            if lod1_solid is None:
-                try:
-                    lod1_solids = new_city_object_member.findall('.//*', namespaces)
-                    lod1_solids = [elem for elem in lod1_solids if elem.tag.endswith('lod1Solid')]
-                    if lod1_solids:
-                        lod1_solid = lod1_solids[0]
-                except:
-                    pass
-            
-            if lod1_solid is not None:
-                # 在 lod1Solid 中查找 CompositeSurface 元素
-                composite_surface = None
+            # 如果找到了 Roof 元素，創建 Floor 元素
+            if roof_element is not None:
+                if matched_type == "Roof":
+                    print("找到 Roof 元素，創建 Floor 元素")
+                elif matched_type == "S_0":
+                    print(" 找到 S_0 元素，創建 Floor 元素")
+                
+                # 創建 Floor 元素
+                floor_element = copy.deepcopy(roof_element)
+                
+                # 修改 ID
+                for attr_name, attr_value in floor_element.attrib.items():
+                    if attr_value == f"ID_{building_id}_Roof":
+                        floor_element.attrib[attr_name] = f"ID_{building_id}_floor"
+                        break
+                
+                # 修改所有 posList 元素的 z 座標為 0
                 try:
-                    composite_surfaces = lod1_solid.findall('.//gml:CompositeSurface', namespaces)
-                    if composite_surfaces:
-                        composite_surface = composite_surfaces[0]
+                    poslist_elements = floor_element.findall('.//gml:posList', namespaces)
+                    if not poslist_elements:
+                        poslist_elements = floor_element.findall('.//*', namespaces)
+                        poslist_elements = [elem for elem in poslist_elements if elem.tag.endswith('posList')]
+                    
+                    for poslist in poslist_elements:
+                        if poslist.text:
+                            # 分割座標
+                            coords = poslist.text.strip().split()
+                            # 確保座標數量是 3 的倍數
+                            if len(coords) % 3 == 0:
+                                # 修改 z 座標為 0
+                                for i in range(2, len(coords), 3):
+                                    coords[i] = "0.000000"
+                                # 更新 posList 文本
+                                poslist.text = "\n                          " + " ".join(coords) + "\n                          "
                 except:
                     pass
                 
-                if composite_surface is None:
-                    try:
-                        composite_surfaces = lod1_solid.findall('.//*', namespaces)
-                        composite_surfaces = [elem for elem in composite_surfaces if elem.tag.endswith('CompositeSurface')]
-                        if composite_surfaces:
-                            composite_surface = composite_surfaces[0]
-                    except:
-                        pass
-                
-                if composite_surface is not None:
-                    roof_element = None
-                    matched_type = None  # 用來記錄是匹配到 Roof 還是 S_0
-
-                    try:
-                        target_ids = {
-                            f"ID_{building_id}_Roof": "Roof",
-                            f"ID_{building_id}_S_0": "S_0"
-                        }
-
-                        for elem in composite_surface.findall('.//*', namespaces):
-                            for attr_name, attr_value in elem.attrib.items():
-                                if attr_value in target_ids and elem.tag.endswith('CompositeSurface'):
-                                    roof_element = elem
-                                    matched_type = target_ids[attr_value]  # 儲存是哪一個類型
-                                    break
-                            if roof_element is not None:
-                                break
-
-                    except Exception as e:
-                        print(f"[WARN] 查找過程出錯: {e}")
+                # 將 Floor 元素添加到 CompositeSurface 中
+                try:
+                    # 創建新的 surfaceMember 元素
+                    new_surface_member = ET.Element("{http://www.opengis.net/gml}surfaceMember")
+                    # 添加 Floor 元素到新的 surfaceMember 元素
+                    new_surface_member.append(floor_element)
+                    # 添加新的 surfaceMember 元素到 CompositeSurface
+                    composite_surface.append(new_surface_member)
+                    print("成功添加 Floor 元素")
+                except Exception as e:
+                    print(f"添加 Floor 元素時出錯: {e}")
+    
+    return new_city_object_member
 
-                    
-                    # 如果找到了 Roof 元素，創建 Floor 元素
-                    if roof_element is not None:
-                        if matched_type == "Roof":
-                            print("找到 Roof 元素，創建 Floor 元素")
-                        elif matched_type == "S_0":
-                            print(" 找到 S_0 元素，創建 Floor 元素")
-                        
-                        # 創建 Floor 元素
-                        floor_element = copy.deepcopy(roof_element)
-                        
-                        # 修改 ID
-                        for attr_name, attr_value in floor_element.attrib.items():
-                            if attr_value == f"ID_{building_id}_Roof":
-                                floor_element.attrib[attr_name] = f"ID_{building_id}_floor"
-                                break
-                        
-                        # 修改所有 posList 元素的 z 座標為 0
-                        try:
-                            poslist_elements = floor_element.findall('.//gml:posList', namespaces)
-                            if not poslist_elements:
-                                poslist_elements = floor_element.findall('.//*', namespaces)
-                                poslist_elements = [elem for elem in poslist_elements if elem.tag.endswith('posList')]
-                            
-                            for poslist in poslist_elements:
-                                if poslist.text:
-                                    # 分割座標
-                                    coords = poslist.text.strip().split()
-                                    # 確保座標數量是 3 的倍數
-                                    if len(coords) % 3 == 0:
-                                        # 修改 z 座標為 0
-                                        for i in range(2, len(coords), 3):
-                                            coords[i] = "0.000000"
-                                        # 更新 posList 文本
-                                        poslist.text = "\n                          " + " ".join(coords) + "\n                          "
-                        except:
-                            pass
-                        
-                        # 將 Floor 元素添加到 CompositeSurface 中
-                        try:
-                            # 創建新的 surfaceMember 元素
-                            new_surface_member = ET.Element("{http://www.opengis.net/gml}surfaceMember")
-                            # 添加 Floor 元素到新的 surfaceMember 元素
-                            new_surface_member.append(floor_element)
-                            # 添加新的 surfaceMember 元素到 CompositeSurface
-                            composite_surface.append(new_surface_member)
-                            print("成功添加 Floor 元素")
-                        except Exception as e:
-                            print(f"添加 Floor 元素時出錯: {e}")
-            
-            # 將修改後的 cityObjectMember 添加到新的根元素
-            new_root.append(new_city_object_member)
+def select_member(city_object_member, building_ids, namespaces, copy_member=True):
+    """
+    若 cityObjectMember 是要提取的地面建築物，回傳 (building_id, 加上 floor 的新 cityObjectMember)，否則回傳 None
+    """
+    # 在 cityObjectMember 中查找建築物
+    building, building_id = find_member_building(city_object_member, namespaces)
     
-    # 檢查是否有建築物未找到
-    for building_id in building_ids:
-        if building_id not in found_buildings:
-            missing_buildings.append(building_id)
+    # 如果找到了建築物 ID，檢查是否在要提取的列表中
+    if building_id is None or building_id not in building_ids:
+        return None
+    
+    # 檢查建築物的最低 z 值
+    lowest_z = get_lowest_z(building, namespaces)
+    if lowest_z is None or abs(lowest_z) > 0.001:  # 使用小的閾值來判斷是否為 0
+        print(f"跳過建築物 {building_id}：最低 z 值為 {lowest_z}，不是地面建築")
+        return None
     
+    print(f"找到建築物: {building_id}")
+    return building_id, build_output_member(city_object_member, building_id, namespaces, copy_member)
+
+def report_missing_buildings(building_ids, found_buildings):
+    """列出源文件中未找到的建築物；一個都沒找到時回傳 False"""
+    found = set(found_buildings)
+    missing_buildings = [building_id for building_id in building_ids if building_id not in found]
     if missing_buildings:
         print(f"以下建築物在源文件中不存在: {', '.join(missing_buildings)}")
         if not found_buildings:
             print("沒有找到任何建築物，停止處理")
-            return
+            return False
+    return True
+
+def extract_buildings_from_members(city_object_members, building_ids, output_gml, namespaces=None, bounded_by=None, compact=False):
+    """
+    從一組 cityObjectMember 元素中提取指定建築物 ID，並寫入輸出 GML 文件
+    
+    Args:
+        city_object_members (iterable): 源文件中的 cityObjectMember 元素
+        building_ids (list): 要提取的建築物 ID 列表
+        output_gml (str): 輸出 GML 文件路徑
+        namespaces (dict): 命名空間（預設為 DEFAULT_NAMESPACES）
+        bounded_by (Element): 要複製到輸出文件的 boundedBy 元素
+        compact (bool): 不縮排輸出（中間檔用）
+    """
+    if namespaces is None:
+        namespaces = dict(DEFAULT_NAMESPACES)
+    
+    # 符合的成員直接寫入輸出文件，不在記憶體中組成整棵輸出樹
+    writer = CityGMLWriter(output_gml, namespaces, bounded_by, compact=compact)
+    try:
+        found_buildings = write_building_members(city_object_members, building_ids, writer, namespaces, bounded_by)
+    finally:
+        writer.close()
     
-    # 使用 minidom 美化 XML 輸出
-    rough_string = ET.tostring(new_root, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    pretty_xml = reparsed.toprettyxml(indent="  ")
+    # 檢查是否有建築物未找到
+    if not report_missing_buildings(building_ids, found_buildings):
+        return
+    
+    print(f"已將轉換後的文件保存到: {output_gml}")
+
+def _escape_text(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def _escape_attrib(value):
+    return (_escape_text(value).replace('"', "&quot;")
+            .replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#09;"))
+
+def write_pretty_element(out, elem, uri_prefixes, level=0, indent="  ", compact=False):
+    """
+    將元素以縮排格式寫入輸出串流（格式與原本 minidom 美化並移除空行後相同）
+    
+    uri_prefixes 為 {命名空間 URI: 前綴}；遇到未宣告的命名空間時，會在該元素上加上 xmlns 宣告，
+    產生的 nsN 前綴不會與已使用的前綴重複。XML 命名空間（xml:lang 等）一律寫成 xml: 前綴。
+    compact=True 時不加縮排與換行（給只由程式讀取的中間檔使用）。
+    """
+    local_prefixes = None
+    declarations = []
+
+    def qname(tag):
+        nonlocal local_prefixes
+        if not tag.startswith('{'):
+            return tag
+        uri, local = tag[1:].split('}', 1)
+        if uri == XML_NAMESPACE:
+            return f"xml:{local}"
+        prefixes = local_prefixes if local_prefixes is not None else uri_prefixes
+        prefix = prefixes.get(uri)
+        if prefix is None:
+            if local_prefixes is None:
+                local_prefixes = dict(uri_prefixes)
+            used = set(local_prefixes.values())
+            n = len(local_prefixes)
+            while f"ns{n}" in used:
+                n += 1
+            prefix = f"ns{n}"
+            local_prefixes[uri] = prefix
+            declarations.append(f' xmlns:{prefix}="{_escape_attrib(uri)}"')
+        return f"{prefix}:{local}"
+
+    pad = "" if compact else indent * level
+    inner = "" if compact else pad + indent
+    nl = "" if compact else "\n"
+    tag = qname(elem.tag)
+    attrs = "".join(f' {qname(name)}="{_escape_attrib(value)}"' for name, value in elem.attrib.items())
+    start = f"{pad}<{tag}{''.join(declarations)}{attrs}"
+    child_prefixes = local_prefixes if local_prefixes is not None else uri_prefixes
+
+    if len(elem) == 0:
+        if elem.text:
+            out.write(f"{start}>{_escape_text(elem.text)}</{tag}>{nl}")
+        else:
+            out.write(f"{start}/>{nl}")
+        return
+
+    out.write(f"{start}>{nl}")
+    if elem.text and elem.text.strip():
+        out.write(f"{inner}{_escape_text(elem.text)}{nl}")
+    for child in elem:
+        write_pretty_element(out, child, child_prefixes, level + 1, indent, compact)
+        if child.tail and child.tail.strip():
+            out.write(f"{inner}{_escape_text(child.tail)}{nl}")
+    out.write(f"{pad}</{tag}>{nl}")
+
+class CityGMLWriter:
+    """
+    以串流方式寫出 CityGML，不需在記憶體中保留整個輸出樹
     
-    # 移除空行
-    cleaned_lines = [line for line in pretty_xml.splitlines() if line.strip()]
-    cleaned_xml = '\n'.join(cleaned_lines)
+    預設在第一次寫入成員時輸出根元素與 boundedBy，之後每個 cityObjectMember 直接寫入文件。
+    update_envelope=True 時（合併多個源文件），成員先寫入暫存檔並累計所有 posList 的最小/最大座標，
+    close() 時才一次寫出根元素、更新後的 boundedBy 與所有成員。
+    namespaces / bounded_by 未指定時，採用第一個寫入成員所屬源文件的設定。
+    compact=True 時不縮排也不換行，輸出較小、寫入較快，適合只交給轉換程式讀取的中間檔。
+    """
+
+    def __init__(self, output_gml, namespaces=None, bounded_by=None, update_envelope=False, compact=False):
+        self.output_gml = output_gml
+        self.namespaces = namespaces
+        self.bounded_by = bounded_by
+        self.update_envelope = update_envelope
+        self.compact = compact
+        self._nl = "" if compact else "\n"
+        self.member_count = 0
+        self._file = None
+        self._root_tag = None
+        self._uri_prefixes = None
+        self._spool = None
+        self._min = np.full(3, np.inf)
+        self._max = np.full(3, -np.inf)
+
+    def _start(self, namespaces, bounded_by):
+        if self.namespaces is None:
+            self.namespaces = namespaces if namespaces is not None else dict(DEFAULT_NAMESPACES)
+        if self.bounded_by is None and bounded_by is not None:
+            self.bounded_by = copy.deepcopy(bounded_by) if self.update_envelope else bounded_by
+        # 命名空間 URI -> 前綴（同一 URI 有多個前綴時取第一個）
+        self._uri_prefixes = {}
+        for prefix, uri in self.namespaces.items():
+            self._uri_prefixes.setdefault(uri, prefix)
+        self._root_tag = f"{self._uri_prefixes.get(DEFAULT_NAMESPACES['core'], 'core')}:CityModel"
+
+        if self.update_envelope:
+            self._spool = tempfile.TemporaryFile('w+', encoding='utf-8')
+        else:
+            self._file = open(self.output_gml, 'w', encoding='utf-8')
+            self._write_header(self._file)
+
+    def _write_header(self, out):
+        attrs = "".join(f' xmlns:{prefix}="{_escape_attrib(uri)}"' for prefix, uri in self.namespaces.items())
+        if 'xsi' in self.namespaces:
+            attrs += ' xsi:schemaLocation="http://www.opengis.net/citygml/2.0 http://schemas.opengis.net/citygml/2.0/cityGMLBase.xsd"'
+        out.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        out.write(f"<{self._root_tag}{attrs}>{self._nl}")
+        if self.bounded_by is not None:
+            write_pretty_element(out, self.bounded_by, self._uri_prefixes, level=1, compact=self.compact)
+
+    def _extend_envelope(self, city_object_member):
+        """以成員中所有 posList 更新累計的邊界（與原本 update_bounded_by 的計算相同）"""
+        coords = element_coords(city_object_member)
+        if len(coords):
+            np.minimum(self._min, coords.min(axis=0), out=self._min)
+            np.maximum(self._max, coords.max(axis=0), out=self._max)
+
+    def _apply_envelope(self):
+        if self.bounded_by is None or np.isinf(self._min[0]):
+            return
+        lower_corner = upper_corner = None
+        for elem in self.bounded_by.iter():
+            if elem.tag.endswith('lowerCorner') and lower_corner is None:
+                lower_corner = elem
+            elif elem.tag.endswith('upperCorner') and upper_corner is None:
+                upper_corner = elem
+        if lower_corner is not None and upper_corner is not None:
+            lower_corner.text = "{:.3f} {:.3f} {:.3f}".format(*self._min)
+            upper_corner.text = "{:.3f} {:.3f} {:.3f}".format(*self._max)
+
+    def write_member(self, city_object_member, namespaces=None, bounded_by=None):
+        if self._root_tag is None:
+            self._start(namespaces, bounded_by)
+        if self.update_envelope:
+            self._extend_envelope(city_object_member)
+        write_pretty_element(self._spool or self._file, city_object_member, self._uri_prefixes, level=1, compact=self.compact)
+        self.member_count += 1
+
+    def close(self):
+        """寫出結尾；沒有寫入任何成員時不會建立輸出文件"""
+        if self._spool is not None:
+            self._apply_envelope()
+            self._spool.seek(0)
+            with open(self.output_gml, 'w', encoding='utf-8') as out:
+                self._write_header(out)
+                shutil.copyfileobj(self._spool, out)
+                out.write(f"</{self._root_tag}>\n")
+            self._spool.close()
+            self._spool = None
+        if self._file is not None:
+            self._file.write(f"</{self._root_tag}>\n")
+            self._file.close()
+            self._file = None
+
+def iter_city_object_members(source_gml):
+    """
+    以 iterparse 逐一產生源文件中的 cityObjectMember
     
-    # 寫入輸出文件
-    with open(output_gml, 'w', encoding='utf-8') as f:
-        f.write(cleaned_xml)
+    產生 (city_object_member, namespaces, bounded_by)。呼叫端處理完成後，該成員會被清除並從父元素移除，
+    因此記憶體用量只與單一成員大小有關，而不是整個源文件
+    """
+    namespaces = None
+    bounded_by = None
+    stack = []
+    for event, elem in ET.iterparse(source_gml, events=('start', 'end')):
+        if event == 'start':
+            if namespaces is None:
+                # 與 ET.parse 的根元素相同：沒有 xmlns 屬性，因此使用基本的命名空間
+                namespaces = get_namespaces(elem)
+            elif bounded_by is None and elem.tag == f"{{{DEFAULT_NAMESPACES['gml']}}}boundedBy":
+                # 對應 root.find('.//gml:boundedBy')：文件中第一個 boundedBy
+                bounded_by = elem
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if elem.tag.endswith('cityObjectMember') and stack:
+            yield elem, namespaces, bounded_by
+            elem.clear()
+            stack[-1].remove(elem)
+
+def write_building_members(city_object_members, building_ids, writer, namespaces=None, bounded_by=None, copy_member=True):
+    """
+    將一組 cityObjectMember 中符合 ID 的地面建築物寫入 writer，回傳找到的建築物 ID 列表
+    """
+    if namespaces is None:
+        namespaces = dict(DEFAULT_NAMESPACES)
+    wanted_ids = set(building_ids)
+    found_buildings = []
+    for city_object_member in city_object_members:
+        selected = select_member(city_object_member, wanted_ids, namespaces, copy_member)
+        if selected is not None:
+            found_buildings.append(selected[0])
+            writer.write_member(selected[1], namespaces, bounded_by)
+    return found_buildings
+
+def write_buildings_from_gml(source_gml, building_ids, writer):
+    """
+    以 iterparse 串流方式讀取源 GML 文件，將符合 ID 的地面建築物直接寫入 writer，回傳找到的建築物 ID 列表
+    """
+    wanted_ids = set(building_ids)
+    found_buildings = []
+    for city_object_member, namespaces, bounded_by in iter_city_object_members(source_gml):
+        # 源成員處理完就會被丟棄，因此直接就地修改，不必先複製
+        selected = select_member(city_object_member, wanted_ids, namespaces, copy_member=False)
+        if selected is not None:
+            found_buildings.append(selected[0])
+            writer.write_member(selected[1], namespaces, bounded_by)
+    return found_buildings
+
+def extract_buildings_streaming(source_gml, building_ids, output_gml, compact=False):
+    """
+    以 iterparse 串流方式從源 GML 文件提取指定建築物，符合的成員直接寫入輸出文件
     
+    Args:
+        source_gml (str): 源 GML 文件路徑
+        building_ids (list): 要提取的建築物 ID 列表
+        output_gml (str): 輸出 GML 文件路徑
+        compact (bool): 不縮排輸出（中間檔用）
+    """
+    writer = CityGMLWriter(output_gml, compact=compact)
+    try:
+        found_buildings = write_buildings_from_gml(source_gml, building_ids, writer)
+    except Exception as e:
+        print(f"解析源 GML 文件時出錯: {e}")
+        return
+    finally:
+        writer.close()
+
+    if not report_missing_buildings(building_ids, found_buildings):
+        return
+
     print(f"已將轉換後的文件保存到: {output_gml}")
 
+def extract_buildings_from_gml(source_gml, building_ids, output_gml, streaming=True, compact=False):
+    """
+    從源 GML 文件中提取指定建築物 ID 的資訊，並完整複製到輸出 GML 文件
+    同時自動生成底面（floor）信息
+    
+    Args:
+        source_gml (str): 源 GML 文件路徑
+        building_ids (list): 要提取的建築物 ID 列表
+        output_gml (str): 輸出 GML 文件路徑
+        streaming (bool): 使用 iterparse 串流提取（預設）；False 時整檔解析
+        compact (bool): 不縮排輸出（中間檔用）
+    """
+    print(f"從 {source_gml} 提取建築物: {', '.join(building_ids)}")
+    
+    if streaming:
+        extract_buildings_streaming(source_gml, building_ids, output_gml, compact)
+        return
+    
+    # 解析源 GML 文件
+    try:
+        tree = ET.parse(source_gml)
+        root = tree.getroot()
+    except Exception as e:
+        print(f"解析源 GML 文件時出錯: {e}")
+        return
+    
+    # 從源文件提取命名空間
+    namespaces = get_namespaces(root)
+    
+    # 源文件的 boundedBy 元素
+    bounded_by = root.find('.//gml:boundedBy', namespaces)
+    
+    # 找到所有 cityObjectMember 元素
+    city_object_members = []
+    try:
+        city_object_members = root.findall('.//core:cityObjectMember', namespaces)
+    except:
+        pass
+    
+    if not city_object_members:
+        try:
+            city_object_members = root.findall('.//*', namespaces)
+            city_object_members = [elem for elem in city_object_members if elem.tag.endswith('cityObjectMember')]
+        except:
+            pass
+    
+    extract_buildings_from_members(city_object_members, building_ids, output_gml, namespaces, bounded_by, compact)
+
 if __name__ == "__main__":
     import sys
     
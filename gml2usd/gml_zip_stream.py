@@ -0,0 +1,145 @@
+"""Zip bundles produced while they are sent.
+
+`ZipStream` yields the bytes of a zip archive as it reads the member files, so
+a bundle response starts right away and is never assembled on disk or in
+memory first. zipfile writes to an unseekable sink, which makes it emit data
+descriptors after each member instead of seeking back to patch the local
+headers; any unzip tool reads such archives through the central directory.
+
+Members that are already compressed (GLB, usdc crates, images, nested zips)
+are STORED, the rest DEFLATEd. `write_zip` writes the same archive to a file
+for callers that need one on disk (async jobs).
+
+A `ZipStream` can also `tee` its bytes into a file; `on_complete` callbacks
+run once the whole archive has been produced (used to put streamed bundles
+into the result cache), and `cleanup` paths are removed when it is closed.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import zipfile
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+CHUNK_SIZE = 1024 * 1024
+
+# already compressed formats; deflating them costs CPU for (almost) nothing
+STORED_SUFFIXES = {".glb", ".usdc", ".usdz", ".zip", ".png", ".jpg", ".jpeg", ".ktx2", ".webp", ".gz"}
+_USDC_MAGIC = b"PXR-USDC"
+
+
+def member_compression(path: str) -> int:
+    """ZIP_STORED for compressed formats (a `.usd` counts when it is a crate file), else ZIP_DEFLATED."""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in STORED_SUFFIXES:
+        return zipfile.ZIP_STORED
+    if suffix == ".usd":
+        with open(path, "rb") as f:
+            if f.read(len(_USDC_MAGIC)) == _USDC_MAGIC:
+                return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class _Sink:
+    """Unseekable file object collecting what zipfile writes until it is taken."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(files: list[tuple[str, str]], *, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a zip archive of `files` ((arcname, filepath) pairs) piece by piece."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for arcname, filepath in files:
+            info = zipfile.ZipInfo.from_file(filepath, arcname=arcname)
+            info.compress_type = member_compression(filepath)
+            with open(filepath, "rb") as src, zf.open(info, "w") as dest:
+                while True:
+                    block = src.read(chunk_size)
+                    if not block:
+                        break
+                    dest.write(block)
+                    data = sink.take()
+                    if data:
+                        yield data
+            data = sink.take()
+            if data:
+                yield data
+    # central directory, written when the ZipFile closes
+    data = sink.take()
+    if data:
+        yield data
+
+
+def write_zip(zip_path: str, files: list[tuple[str, str]]) -> str:
+    """Write the archive `iter_zip` would stream to `zip_path`; returns the path."""
+    os.makedirs(os.path.dirname(zip_path) or ".", exist_ok=True)
+    with open(zip_path, "wb") as f:
+        for data in iter_zip(files):
+            f.write(data)
+    return zip_path
+
+
+class ZipStream:
+    """A zip bundle as a WSGI response iterable (see _send_artifact in gml_api_ssh.py)."""
+
+    def __init__(self, files: list[tuple[str, str]], *, cleanup: list[str] | None = None):
+        self.files = files
+        self.cleanup = list(cleanup or [])
+        self.tee_path = None
+        self._callbacks: list[Callable[[str], None]] = []
+
+    def tee(self, path: str) -> str:
+        """Also write the streamed bytes to `path`; it is removed on close like the cleanup paths."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.tee_path = path
+        self.cleanup.append(path)
+        return path
+
+    def on_complete(self, callback: Callable[[str], None]) -> None:
+        """Call `callback(tee_path)` after the last byte has been produced."""
+        self._callbacks.append(callback)
+
+    def __iter__(self) -> Iterator[bytes]:
+        tee = open(self.tee_path, "wb") if self.tee_path else None
+        try:
+            for data in iter_zip(self.files):
+                if tee is not None:
+                    tee.write(data)
+                yield data
+        finally:
+            if tee is not None:
+                tee.close()
+        for callback in self._callbacks:
+            try:
+                callback(self.tee_path)
+            except Exception as e:
+                logger.warning(f"ZipStream completion callback failed: {e}")
+
+    def close(self) -> None:
+        for path in self.cleanup:
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            except Exception as e:
+                logger.warning(f"Cleanup failed: {e}")
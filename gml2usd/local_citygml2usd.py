@@ -3,6 +3,8 @@ import subprocess
 from typing import Tuple
 import logging
 
+from converter_pool import POOLED_SCRIPTS, SCRIPT_DIR, ConverterTimeout, get_converter_pool
+
 
 class ConversionError(RuntimeError):
     pass
@@ -19,9 +21,15 @@ def convert_citygml_to_usd(
     rough: bool = True,
     disable_interiors: bool = False,
     script_name: str = "citygml2aodt.py",
+    gltf_path: str = None,
+    tiles_dir: str = None,
 ) -> Tuple[str, str]:
     """Convert a CityGML file to USD locally inside this container.
 
+    If gltf_path is given, the building meshes are also written there as glTF
+    in the same run (aodt_pipeline scripts only). tiles_dir likewise writes a
+    3D Tiles tileset (tileset.json + per-tile GLB LODs) into that directory.
+
     Returns (stdout, stderr). Raises ConversionError on failure.
     """
 
@@ -30,34 +38,49 @@ def convert_citygml_to_usd(
 
     os.makedirs(os.path.dirname(usd_path) or ".", exist_ok=True)
 
-    cmd = [
-        "python3",
-        f"/opt/aodt_ui_gis/{script_name}",
-        gml_path,
+    argv = [
+        os.path.abspath(gml_path),
         "--epsg_in",
         str(epsg_in),
         "--epsg_out",
         str(epsg_out),
         "-o",
-        usd_path,
+        os.path.abspath(usd_path),
         "--cm",
     ]
 
     if rough:
-        cmd.append("--rough")
+        argv.append("--rough")
     if disable_interiors:
-        cmd.append("--disable_interiors")
-
-    logger.info("Running converter: %s", " ".join(cmd))
-
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    stdout = proc.stdout or ""
-    stderr = proc.stderr or ""
-
-    if proc.returncode != 0:
+        argv.append("--disable_interiors")
+    if gltf_path:
+        argv.extend(["--gltf", os.path.abspath(gltf_path)])
+    if tiles_dir:
+        argv.extend(["--tiles", os.path.abspath(tiles_dir)])
+
+    # Prefer a warm worker (USD stack already imported); other scripts keep the subprocess path.
+    pool = get_converter_pool() if script_name in POOLED_SCRIPTS else None
+    if pool is not None:
+        logger.info("Running converter in pool: %s %s", script_name, " ".join(argv))
+        try:
+            returncode, stdout, stderr = pool.run(script_name, argv)
+        except ConverterTimeout as e:
+            raise ConversionError(f"citygml2aodt timed out: {e}") from e
+        except RuntimeError as e:
+            raise ConversionError(f"converter pool failed: {e}") from e
+    else:
+        cmd = ["python3", os.path.join(SCRIPT_DIR, script_name), *argv]
+        logger.info("Running converter: %s", " ".join(cmd))
+
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        returncode = proc.returncode
+        stdout = proc.stdout or ""
+        stderr = proc.stderr or ""
+
+    if returncode != 0:
         raise ConversionError(
             "citygml2aodt failed "
-            f"(rc={proc.returncode})\nSTDOUT:\n{stdout}\nSTDERR:\n{stderr}"
+            f"(rc={returncode})\nSTDOUT:\n{stdout}\nSTDERR:\n{stderr}"
         )
 
     if not os.path.exists(usd_path):
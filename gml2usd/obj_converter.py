@@ -2,8 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import xml.etree.ElementTree as ET
-import xml.dom.minidom as minidom
 from pyproj import Transformer
+from gml_transport_v2 import write_pretty_element
 import os
 import logging
 
@@ -104,8 +104,65 @@ class OBJToGMLConverter:
         
         return (min_x, min_y, min_z, max_x, max_y, max_z)
 
-    def create_gml(self, output_file_path, epsg_code, offset_x, offset_y):
-        """创建GML文件"""
+    def create_member(self, obj, offset_x, offset_y, build_h):
+        """建立單一物件的 cityObjectMember 元素"""
+        city_object_member = ET.Element('ns0:cityObjectMember')
+        building = ET.SubElement(city_object_member, 'ns2:Building')
+        building.set('ns1:id', obj['name'])
+        
+        name_elem = ET.SubElement(building, 'ns1:name')
+        name_elem.text = obj['name']
+        
+        # Using custom tags as per original script, though mostly not standard CityGML without proper xsd
+        build_id = ET.SubElement(building, 'BUILD_ID')
+        build_id.text = obj['name']
+        
+        build_h_elem = ET.SubElement(building, 'BUILD_H')
+        build_h_elem.text = f"{build_h:.2f}"
+        
+        model_lod = ET.SubElement(building, 'MODEL_LOD')
+        model_lod.text = "2"
+        
+        lod1_solid = ET.SubElement(building, 'ns2:lod1Solid')
+        solid = ET.SubElement(lod1_solid, 'ns1:Solid')
+        exterior = ET.SubElement(solid, 'ns1:exterior')
+        composite_surface = ET.SubElement(exterior, 'ns1:CompositeSurface')
+        
+        for face_idx, face in enumerate(obj['faces']):
+            surface_member = ET.SubElement(composite_surface, 'ns1:surfaceMember')
+            comp_surface = ET.SubElement(surface_member, 'ns1:CompositeSurface')
+            comp_surface.set('ns1:id', f"ID_{obj['name']}_face_{face_idx}")
+            
+            surface_member_inner = ET.SubElement(comp_surface, 'ns1:surfaceMember')
+            polygon = ET.SubElement(surface_member_inner, 'ns1:Polygon')
+            exterior_ring = ET.SubElement(polygon, 'ns1:exterior')
+            linear_ring = ET.SubElement(exterior_ring, 'ns1:LinearRing')
+            pos_list = ET.SubElement(linear_ring, 'ns1:posList')
+            pos_list.set('srsDimension', '3')
+            
+            coords = []
+            for vertex_idx in face:
+                if vertex_idx < len(self.vertices):
+                    x, y, z = self.vertices[vertex_idx]
+                    adj_x = x + offset_x
+                    adj_y = y + offset_y
+                    coords.append(f"{adj_x:.6f} {adj_y:.6f} {z:.6f}")
+            
+            # Close polygon
+            if coords and len(face) > 2:
+                first_vertex_idx = face[0]
+                if first_vertex_idx < len(self.vertices):
+                    x, y, z = self.vertices[first_vertex_idx]
+                    adj_x = x + offset_x
+                    adj_y = y + offset_y
+                    coords.append(f"{adj_x:.6f} {adj_y:.6f} {z:.6f}")
+            
+            pos_list.text = ' '.join(coords)
+        
+        return city_object_member
+
+    def create_gml(self, output_file_path, epsg_code, offset_x, offset_y, compact=False):
+        """创建GML文件；每個物件建立後直接寫入文件，compact=True 時不縮排"""
         logger.info(f"正在创建GML文件: {output_file_path}, Offset: ({offset_x}, {offset_y})")
         
         min_x, min_y, min_z, max_x, max_y, max_z = self.calculate_bounds()
@@ -115,16 +172,17 @@ class OBJToGMLConverter:
         adjusted_min_y = min_y + offset_y
         adjusted_max_y = max_y + offset_y
         
-        # 创建根元素
-        root = ET.Element('ns0:CityModel')
-        root.set('xmlns:ns0', 'http://www.opengis.net/citygml/2.0')
-        root.set('xmlns:ns1', 'http://www.opengis.net/gml')
-        root.set('xmlns:ns2', 'http://www.opengis.net/citygml/building/2.0')
-        root.set('xmlns:core', 'http://www.opengis.net/citygml/2.0')
-        root.set('xmlns:gml', 'http://www.opengis.net/gml')
-        root.set('xmlns:bldg', 'http://www.opengis.net/citygml/building/2.0')
+        # 根元素的命名空間宣告
+        root_attrs = [
+            ('xmlns:ns0', 'http://www.opengis.net/citygml/2.0'),
+            ('xmlns:ns1', 'http://www.opengis.net/gml'),
+            ('xmlns:ns2', 'http://www.opengis.net/citygml/building/2.0'),
+            ('xmlns:core', 'http://www.opengis.net/citygml/2.0'),
+            ('xmlns:gml', 'http://www.opengis.net/gml'),
+            ('xmlns:bldg', 'http://www.opengis.net/citygml/building/2.0'),
+        ]
         
-        bounded_by = ET.SubElement(root, 'ns1:boundedBy')
+        bounded_by = ET.Element('ns1:boundedBy')
         envelope = ET.SubElement(bounded_by, 'ns1:Envelope')
         envelope.set('srsDimension', '3')
         envelope.set('srsName', f'urn:ogc:def:crs:EPSG::{epsg_code}')
@@ -135,76 +193,22 @@ class OBJToGMLConverter:
         upper_corner = ET.SubElement(envelope, 'ns1:upperCorner')
         upper_corner.text = f"{adjusted_max_x:.3f} {adjusted_max_y:.3f} {max_z:.3f}"
         
-        for obj_idx, obj in enumerate(self.objects):
-            city_object_member = ET.SubElement(root, 'ns0:cityObjectMember')
-            building = ET.SubElement(city_object_member, 'ns2:Building')
-            building.set('ns1:id', obj['name'])
-            
-            name_elem = ET.SubElement(building, 'ns1:name')
-            name_elem.text = obj['name']
-            
-            # Using custom tags as per original script, though mostly not standard CityGML without proper xsd
-            build_id = ET.SubElement(building, 'BUILD_ID')
-            build_id.text = obj['name']
-            
-            build_h = ET.SubElement(building, 'BUILD_H')
-            build_h.text = f"{max_z - min_z:.2f}"
-            
-            model_lod = ET.SubElement(building, 'MODEL_LOD')
-            model_lod.text = "2"
-            
-            lod1_solid = ET.SubElement(building, 'ns2:lod1Solid')
-            solid = ET.SubElement(lod1_solid, 'ns1:Solid')
-            exterior = ET.SubElement(solid, 'ns1:exterior')
-            composite_surface = ET.SubElement(exterior, 'ns1:CompositeSurface')
-            
-            for face_idx, face in enumerate(obj['faces']):
-                surface_member = ET.SubElement(composite_surface, 'ns1:surfaceMember')
-                comp_surface = ET.SubElement(surface_member, 'ns1:CompositeSurface')
-                comp_surface.set('ns1:id', f"ID_{obj['name']}_face_{face_idx}")
-                
-                surface_member_inner = ET.SubElement(comp_surface, 'ns1:surfaceMember')
-                polygon = ET.SubElement(surface_member_inner, 'ns1:Polygon')
-                exterior_ring = ET.SubElement(polygon, 'ns1:exterior')
-                linear_ring = ET.SubElement(exterior_ring, 'ns1:LinearRing')
-                pos_list = ET.SubElement(linear_ring, 'ns1:posList')
-                pos_list.set('srsDimension', '3')
-                
-                coords = []
-                for vertex_idx in face:
-                    if vertex_idx < len(self.vertices):
-                        x, y, z = self.vertices[vertex_idx]
-                        adj_x = x + offset_x
-                        adj_y = y + offset_y
-                        coords.append(f"{adj_x:.6f} {adj_y:.6f} {z:.6f}")
-                
-                # Close polygon
-                if coords and len(face) > 2:
-                    first_vertex_idx = face[0]
-                    if first_vertex_idx < len(self.vertices):
-                        x, y, z = self.vertices[first_vertex_idx]
-                        adj_x = x + offset_x
-                        adj_y = y + offset_y
-                        coords.append(f"{adj_x:.6f} {adj_y:.6f} {z:.6f}")
-                
-                pos_list.text = ' '.join(coords)
-        
-        rough_string = ET.tostring(root, 'utf-8')
-        reparsed = minidom.parseString(rough_string)
-        pretty_xml = reparsed.toprettyxml(indent="  ")
-        
-        lines = [line for line in pretty_xml.split('\n') if line.strip()]
-        pretty_xml = '\n'.join(lines)
-        
+        nl = "" if compact else "\n"
         with open(output_file_path, 'w', encoding='utf-8') as f:
-            f.write(pretty_xml)
+            f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+            f.write("<ns0:CityModel" + "".join(f' {name}="{uri}"' for name, uri in root_attrs) + ">" + nl)
+            write_pretty_element(f, bounded_by, {}, level=1, compact=compact)
+            for obj in self.objects:
+                write_pretty_element(f, self.create_member(obj, offset_x, offset_y, max_z - min_z), {}, level=1, compact=compact)
+            f.write("</ns0:CityModel>\n")
         
         logger.info(f"GML文件已成功创建: {output_file_path}")
 
-    def process(self, obj_path, gml_path, lat, lon, epsg_code="3826"):
+    def process(self, obj_path, gml_path, lat, lon, epsg_code="3826", compact=False):
         """主入口
         lat, lon: WGS84 座標, 將作為模型原點(0,0,0)的地理位置
         epsg_code: 目標投影座標系 (預設 3826 TWD97)
+        compact: 輸出不縮排的 GML（只交給轉換程式讀取時使用）
         """
         # 1. 計算 Offset (Lat/Lon -> EPSG)
         try:
@@ -217,7 +221,7 @@ class OBJToGMLConverter:
             self.parse_obj(obj_path)
             
             # 3. 生成
-            self.create_gml(gml_path, epsg_code, offset_x, offset_y)
+            self.create_gml(gml_path, epsg_code, offset_x, offset_y, compact)
             return True
         except Exception as e:
             logger.error(f"Process Error: {e}")
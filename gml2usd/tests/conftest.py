@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The service modules live flat in gml2usd/ and the converter modules in
+# aodt_ui_gis/ (both run with their directory on sys.path, as in the image).
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "aodt_ui_gis")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,33 @@
+import pytest
+
+from converter_pool import ConverterPool, ConverterTimeout
+
+
+@pytest.fixture
+def pool(tmp_path):
+    (tmp_path / "echo_script.py").write_text(
+        "import sys\n"
+        "def main(argv):\n"
+        "    print(' '.join(argv))\n"
+        "    if argv and argv[0] == 'fail':\n"
+        "        sys.exit(3)\n"
+    )
+    pool = ConverterPool(1, script_dir=str(tmp_path), preload=(), acquire_timeout=0.5)
+    yield pool
+    pool.close()
+
+
+def test_run_returns_output_and_exit_code(pool):
+    assert pool.run("echo_script.py", ["a", "b"]) == (0, "a b\n", "")
+    returncode, stdout, _ = pool.run("echo_script.py", ["fail"])
+    assert (returncode, stdout) == (3, "fail\n")
+
+
+def test_run_times_out_when_no_worker_is_idle(pool):
+    busy = pool._idle.get()
+    try:
+        with pytest.raises(ConverterTimeout):
+            pool.run("echo_script.py", [])
+    finally:
+        pool._idle.put(busy)
+    assert pool.run("echo_script.py", ["again"])[1] == "again\n"
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from footprint import extract_footprint
+
+
+def _loop_footprint(vertices, indices, z_threshold):
+    """The per-triangle loop the converters used before footprint.py."""
+    out = []
+    for i in range(0, len(indices), 3):
+        triangle = vertices[indices[i:i + 3]]
+        if np.all(triangle[:, 2] <= z_threshold):
+            out.append(triangle)
+    if len(out) == 0:
+        return vertices[:0]
+    return np.concatenate(out, axis=0)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_triangle_loop(seed):
+    rng = np.random.default_rng(seed)
+    vertices = rng.uniform(0, 10, size=(200, 3))
+    vertices[rng.random(200) < 0.5, 2] = 0.0
+    indices = rng.integers(0, 200, size=3 * 500)
+    expected = _loop_footprint(vertices, indices, 0.1)
+    result = extract_footprint(vertices, indices, 0.1)
+    assert result.dtype == expected.dtype and result.shape == expected.shape
+    assert np.array_equal(result, expected)
+
+
+def test_accepts_triangle_shaped_indices():
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 5]], dtype=np.float64)
+    indices = np.array([[0, 1, 2], [0, 1, 3]])
+    assert np.array_equal(extract_footprint(vertices, indices, 0.0), vertices[[0, 1, 2]])
+
+
+def test_empty_footprint_keeps_shape_and_dtype():
+    vertices = np.array([[0, 0, 1], [1, 0, 1], [0, 1, 1]], dtype=np.float32)
+    result = extract_footprint(vertices, [0, 1, 2], 0.5)
+    assert result.shape == (0, 3) and result.dtype == np.float32
@@ -0,0 +1,206 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from gltf_compress import (
+    EXT_MESHOPT_COMPRESSION,
+    KHR_MESH_QUANTIZATION,
+    _read_accessor,
+    compress_glb_file,
+    compress_gltf,
+)
+
+
+def _document(meshes):
+    """A glTF document with one plain node per (positions, indices) mesh."""
+    chunks, views, accessors, gltf_meshes = [], [], [], []
+    offset = 0
+    for positions, indices in meshes:
+        for array, target, kind in (
+            (positions.astype(np.float32), 34962, "VEC3"),
+            (indices.astype(np.uint32), 34963, "SCALAR"),
+        ):
+            data = array.tobytes()
+            views.append({"buffer": 0, "byteOffset": offset, "byteLength": len(data), "target": target})
+            accessor = {
+                "bufferView": len(views) - 1,
+                "componentType": 5126 if array.dtype == np.float32 else 5125,
+                "count": len(array),
+                "type": kind,
+            }
+            if kind == "VEC3":
+                accessor.update(min=array.min(axis=0).tolist(), max=array.max(axis=0).tolist())
+            accessors.append(accessor)
+            chunks.append(data)
+            offset += len(data)
+        gltf_meshes.append({"primitives": [{"attributes": {"POSITION": len(accessors) - 2}, "indices": len(accessors) - 1}]})
+    data = b"".join(chunks)
+    doc = {
+        "asset": {"version": "2.0"},
+        "scene": 0,
+        "scenes": [{"nodes": list(range(len(meshes)))}],
+        "nodes": [{"mesh": m} for m in range(len(meshes))],
+        "meshes": gltf_meshes,
+        "accessors": accessors,
+        "bufferViews": views,
+        "buffers": [{"byteLength": len(data)}],
+    }
+    return doc, data
+
+
+def _grid(rng, n=12, extent=250.0):
+    """A bumpy n x n height field: shared vertices, so the index data matters."""
+    x, y = np.meshgrid(np.linspace(0, extent, n), np.linspace(0, extent / 2, n))
+    positions = np.stack([x.ravel(), y.ravel(), rng.uniform(0, 30, n * n)], axis=1) + 1000.0
+    quads = np.arange(n * n).reshape(n, n)[:-1, :-1].ravel()
+    indices = np.stack([quads, quads + 1, quads + n, quads + 1, quads + n + 1, quads + n], axis=1)
+    return positions, indices.ravel()
+
+
+def _decode_meshopt(doc, data):
+    """Buffers with every EXT_meshopt_compression view decoded into the fallback buffer."""
+    meshoptimizer = pytest.importorskip("meshoptimizer")
+    if len(doc["buffers"]) == 1:
+        return [data]
+    fallback = bytearray(doc["buffers"][1]["byteLength"])
+    for view in doc["bufferViews"]:
+        ext = view.get("extensions", {}).get(EXT_MESHOPT_COMPRESSION)
+        if ext is None:
+            continue
+        source = data[ext["byteOffset"]:ext["byteOffset"] + ext["byteLength"]]
+        if ext["mode"] == "ATTRIBUTES":
+            decoded = np.asarray(meshoptimizer.decode_vertex_buffer(ext["count"], ext["byteStride"], source))
+        else:
+            decoded = np.asarray(meshoptimizer.decode_index_buffer(ext["count"], ext["byteStride"], source))
+        raw = decoded.view(np.uint8).ravel()[:ext["count"] * ext["byteStride"]].tobytes()
+        assert len(raw) == view["byteLength"]
+        fallback[view["byteOffset"]:view["byteOffset"] + len(raw)] = raw
+    return [data, bytes(fallback)]
+
+
+def _triangles(doc, buffers, node):
+    """World-space triangles of a (leaf) node, each rotated to start at its smallest vertex."""
+    primitive = doc["meshes"][node["mesh"]]["primitives"][0]
+    positions = _read_accessor(doc, buffers, primitive["attributes"]["POSITION"])[:, :3].astype(np.float64)
+    positions = positions * node.get("scale", [1.0] * 3) + node.get("translation", [0.0] * 3)
+    triangles = positions[_read_accessor(doc, buffers, primitive["indices"]).ravel()].reshape(-1, 3, 3)
+    # keep the winding, but make triangle order and starting vertex irrelevant
+    first = np.array([min(range(3), key=lambda k: tuple(t[k])) for t in triangles], dtype=int)
+    triangles = np.stack([np.roll(t, -k, axis=0) for t, k in zip(triangles, first)])
+    order = np.lexsort(triangles.reshape(len(triangles), -1).T[::-1])
+    return triangles[order]
+
+
+def _max_error(original, original_data, doc, buffers):
+    errors = []
+    for before, after in zip(original["nodes"], doc["nodes"]):
+        expected = _triangles(original, [original_data], before)
+        result = _triangles(doc, buffers, after)
+        assert result.shape == expected.shape
+        errors.append(np.abs(result - expected).max())
+    return max(errors)
+
+
+def _tolerance(meshes):
+    # half an int16 step of the largest mesh, with some slack for float rounding
+    return max(np.ptp(p, axis=0).max() / 2 / 32767 for p, _ in meshes) * 0.5 + 1e-6
+
+
+def _write_glb(path, doc, data):
+    doc_bytes = json.dumps(doc).encode("utf-8")
+    doc_bytes += b" " * (-len(doc_bytes) % 4)
+    data += b"\0" * (-len(data) % 4)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<III", 0x46546C67, 2, 28 + len(doc_bytes) + len(data)))
+        f.write(struct.pack("<II", len(doc_bytes), 0x4E4F534A) + doc_bytes)
+        f.write(struct.pack("<II", len(data), 0x004E4942) + data)
+
+
+def _read_glb(path):
+    raw = path.read_bytes()
+    json_length = struct.unpack_from("<I", raw, 12)[0]
+    doc = json.loads(raw[20:20 + json_length])
+    return doc, raw[28 + json_length:]
+
+
+def test_glb_file_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    meshes = [_grid(rng)]
+    original, data = _document(meshes)
+    path = tmp_path / "tile.glb"
+    _write_glb(path, original, data)
+    before = path.read_bytes()
+
+    assert compress_glb_file(str(path), "none") == str(path)
+    assert path.read_bytes() == before
+
+    compress_glb_file(str(path), "quantize")
+    doc, out = _read_glb(path)
+    assert len(path.read_bytes()) < len(before)
+    assert _max_error(original, data, doc, [out]) <= _tolerance(meshes)
+
+
+def test_quantize_round_trip():
+    rng = np.random.default_rng(1)
+    meshes = [_grid(rng), _grid(rng, n=5, extent=3.0)]
+    original, data = _document(meshes)
+    doc, out = compress_gltf(original, [data], "quantize")
+
+    assert doc["extensionsRequired"] == [KHR_MESH_QUANTIZATION]
+    assert len(out) < len(data)
+    for n, mesh in enumerate(doc["meshes"]):
+        primitive = mesh["primitives"][0]
+        assert doc["accessors"][primitive["attributes"]["POSITION"]]["componentType"] == 5122
+        assert doc["accessors"][primitive["indices"]]["componentType"] == 5123
+        assert "scale" in doc["nodes"][n] and "translation" in doc["nodes"][n]
+    assert _max_error(original, data, doc, [out]) <= _tolerance(meshes)
+    # the input document is left alone
+    assert original["accessors"][0]["componentType"] == 5126
+
+
+def test_quantize_keeps_index_order():
+    rng = np.random.default_rng(2)
+    positions, indices = _grid(rng)
+    original, data = _document([(positions, indices)])
+    doc, out = compress_gltf(original, [data], "quantize")
+    primitive = doc["meshes"][0]["primitives"][0]
+    assert np.array_equal(_read_accessor(doc, [out], primitive["indices"]).ravel(), indices)
+
+
+def test_quantize_moves_transform_to_child_node():
+    rng = np.random.default_rng(3)
+    meshes = [_grid(rng)]
+    original, data = _document(meshes)
+    original["nodes"][0]["translation"] = [5.0, 0.0, 0.0]
+    doc, _ = compress_gltf(original, [data], "quantize")
+    parent = doc["nodes"][0]
+    assert parent["translation"] == [5.0, 0.0, 0.0] and "mesh" not in parent
+    child = doc["nodes"][parent["children"][0]]
+    assert child["mesh"] == 0 and "scale" in child
+
+
+def test_meshopt_decodes_to_quantized_mesh():
+    pytest.importorskip("meshoptimizer")
+    rng = np.random.default_rng(4)
+    meshes = [_grid(rng), _grid(rng, n=7, extent=40.0)]
+    original, data = _document(meshes)
+    quantized, quantized_data = compress_gltf(original, [data], "quantize")
+    doc, out = compress_gltf(original, [data], "meshopt")
+
+    assert set(doc["extensionsRequired"]) == {EXT_MESHOPT_COMPRESSION, KHR_MESH_QUANTIZATION}
+    assert doc["buffers"][1]["extensions"][EXT_MESHOPT_COMPRESSION] == {"fallback": True}
+    assert len(out) < len(quantized_data)
+
+    buffers = _decode_meshopt(doc, out)
+    # vertex/triangle order changes, the triangles themselves do not
+    for before, after in zip(quantized["nodes"], doc["nodes"]):
+        assert np.array_equal(_triangles(quantized, [quantized_data], before), _triangles(doc, buffers, after))
+    assert _max_error(original, data, doc, buffers) <= _tolerance(meshes)
+
+
+def test_unknown_mode_is_rejected():
+    original, data = _document([_grid(np.random.default_rng(5))])
+    with pytest.raises(ValueError):
+        compress_gltf(original, [data], "draco")
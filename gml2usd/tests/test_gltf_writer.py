@@ -0,0 +1,73 @@
+import json
+import struct
+
+import numpy as np
+
+from gltf_compress import _read_accessor
+from gltf_writer import GltfWriter
+
+_VERTICES = np.array([[5, -7, 0], [15, -7, 0], [5, 13, 0], [5, -7, 30]], dtype=np.float64)
+_INDICES = np.array([0, 2, 1, 0, 1, 3], dtype=np.uint32)
+
+
+def _load(paths):
+    doc = json.loads(open(paths[0], encoding="utf-8").read())
+    return doc, [open(paths[1], "rb").read()]
+
+
+def _positions(doc, buffers, mesh=0):
+    primitive = doc["meshes"][mesh]["primitives"][0]
+    positions = _read_accessor(doc, buffers, primitive["attributes"]["POSITION"])
+    return positions, _read_accessor(doc, buffers, primitive["indices"]).ravel()
+
+
+def test_stage_units_and_axes_by_default(tmp_path):
+    # same values as the USD meshes of a --cm stage (and usd2gltf's export of them): centimetres, Z-up
+    writer = GltfWriter(str(tmp_path / "scene.gltf"), scale=100)
+    writer.add_mesh("exterior", "bldg_a", _VERTICES, _INDICES)
+    writer.add_mesh("interior", "bldg_a", _VERTICES * 0.5, _INDICES)
+    paths = writer.write()
+    assert paths == [str(tmp_path / "scene.gltf"), str(tmp_path / "scene.bin")]
+
+    doc, buffers = _load(paths)
+    assert doc["nodes"][0] == {"name": "World", "children": [1]}
+    assert [doc["nodes"][i]["name"] for i in doc["nodes"][1]["children"]] == ["exterior", "interior"]
+    positions, indices = _positions(doc, buffers)
+    assert np.array_equal(positions, (_VERTICES * 100).astype(np.float32))
+    assert np.array_equal(indices, _INDICES)
+    assert doc["accessors"][0]["max"] == [1500.0, 1300.0, 3000.0]
+    assert doc["buffers"][0]["uri"] == "scene.bin"
+
+
+def test_y_up_writes_metres(tmp_path):
+    writer = GltfWriter(str(tmp_path / "scene.gltf"), scale=100, y_up=True)
+    writer.add_mesh("exterior", "bldg_a", _VERTICES, _INDICES)
+    doc, buffers = _load(writer.write())
+    matrix = np.array(doc["nodes"][0]["matrix"], dtype=np.float64).reshape(4, 4).T
+    positions, _ = _positions(doc, buffers)
+    assert np.array_equal(positions, _VERTICES.astype(np.float32))
+    # Z-up (x, y, z) lands on Y-up (x, z, -y)
+    assert np.allclose(matrix[:3, :3] @ _VERTICES[3], [5, 30, 7])
+
+
+def test_glb(tmp_path):
+    writer = GltfWriter(str(tmp_path / "tile.glb"), y_up=True)
+    writer.add_mesh("buildings", "bldg_a", _VERTICES, _INDICES)
+    writer.add_mesh("buildings", "degenerate", _VERTICES, _INDICES[:2])
+    assert writer.write() == [str(tmp_path / "tile.glb")]
+
+    raw = (tmp_path / "tile.glb").read_bytes()
+    magic, version, length = struct.unpack_from("<III", raw, 0)
+    assert (magic, version, length) == (0x46546C67, 2, len(raw))
+    json_length = struct.unpack_from("<I", raw, 12)[0]
+    doc = json.loads(raw[20:20 + json_length])
+    assert len(doc["meshes"]) == 1
+    positions, indices = _positions(doc, [raw[28 + json_length:]])
+    assert np.array_equal(positions, _VERTICES.astype(np.float32))
+    assert np.array_equal(indices, _INDICES)
+
+
+def test_no_meshes(tmp_path):
+    doc, _ = _load(GltfWriter(str(tmp_path / "empty.gltf")).write())
+    assert "buffers" not in doc and "meshes" not in doc
+    assert doc["nodes"][1] == {"name": "buildings", "children": []}
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+from gml_building_index import BuildingIndex, build_building_index, scan_tile
+
+HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<core:CityModel xmlns:core="http://www.opengis.net/citygml/2.0" xmlns:gml="http://www.opengis.net/gml" '
+    'xmlns:bldg="http://www.opengis.net/citygml/building/2.0">\n'
+    "  <gml:boundedBy><gml:Envelope><gml:lowerCorner>0 0 0</gml:lowerCorner>"
+    "<gml:upperCorner>100 100 30</gml:upperCorner></gml:Envelope></gml:boundedBy>\n"
+)
+
+
+def _building(building_id, x, y, z=0.0, size=10.0, height=20.0):
+    ring = [(x, y, z), (x + size, y, z), (x + size, y + size, z + height), (x, y, z)]
+    pos = " ".join(f"{a} {b} {c}" for a, b, c in ring)
+    return (
+        f'  <core:cityObjectMember><bldg:Building gml:id="bldg_{building_id}"><bldg:lod1Solid><gml:Solid><gml:exterior>'
+        f"<gml:Polygon><gml:exterior><gml:LinearRing><gml:posList>{pos}</gml:posList></gml:LinearRing></gml:exterior>"
+        f"</gml:Polygon></gml:exterior></gml:Solid></bldg:lod1Solid></bldg:Building></core:cityObjectMember>\n"
+    )
+
+
+def _write_tile(path, members):
+    path.write_text(HEADER + "".join(members) + "</core:CityModel>\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def tile(tmp_path):
+    return _write_tile(tmp_path / "tile_a.gml", [
+        _building("A", 0, 0, z=1.5),
+        "  <core:cityObjectMember/>\n",
+        "  <core:cityObjectMember><bldg:Building><gml:name>empty</gml:name></bldg:Building></core:cityObjectMember>\n",
+        _building("B", 50, 50),
+        _building("C", 80, 10, z=-2.0),
+    ])
+
+
+def test_scan_tile_rows(tile):
+    info, rows = scan_tile(tile)
+    assert info["filename"] == "tile_a.gml"
+    assert [r[0] for r in rows] == ["A", "B", "C"]
+    assert rows[0][1] == (0.0, 0.0, 10.0, 10.0)
+    assert [r[2] for r in rows] == [1.5, 0.0, -2.0]
+
+    data = open(tile, "rb").read()
+    for _, _, _, offset, length in rows:
+        member = data[offset:offset + length]
+        assert member.startswith(b"<core:cityObjectMember>") and member.endswith(b"</core:cityObjectMember>")
+
+
+def test_build_select_and_read_members(tile, tmp_path):
+    index_dir = str(tmp_path / "index")
+    index = build_building_index([tile], index_dir)
+    assert len(index) == 3
+
+    entry = index.lookup(tile)
+    rows = index.select(entry, 45, 0, 100, 100)
+    assert index.ids[rows].tolist() == ["B", "C"]
+    assert index.ids[index.rows_for_ids(entry, {"C", "A"})].tolist() == ["A", "C"]
+
+    members, bounded_by, root = index.read_members(tile, entry, rows)
+    assert bounded_by is not None and bounded_by.tag.endswith("boundedBy")
+    assert [m[0].get("{http://www.opengis.net/gml}id") for m in members] == ["bldg_B", "bldg_C"]
+    assert root.tag == "{http://www.opengis.net/citygml/2.0}CityModel" and len(root) == 0
+
+
+def test_changed_tile_is_not_indexed_and_unchanged_tiles_are_reused(tile, tmp_path):
+    index_dir = str(tmp_path / "index")
+    other = _write_tile(tmp_path / "tile_b.gml", [_building("D", 200, 200)])
+    build_building_index([tile, other], index_dir)
+
+    st = os.stat(other)
+    os.utime(other, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert BuildingIndex.load(index_dir).lookup(other) is None
+
+    reused = {}
+    index = build_building_index([tile, other], index_dir, progress=lambda n, total, path, rows, r: reused.update({path: r}))
+    assert reused == {tile: True, other: False}
+    assert index.ids.tolist() == ["A", "B", "C", "D"]
+    assert np.array_equal(index.bbox[3], [200, 200, 210, 210])
@@ -0,0 +1,70 @@
+import warnings
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+from gml_coords import element_coords, parse_poslists
+
+
+def _reference(texts):
+    """The per-value float() loop parse_poslists replaced."""
+    coords = []
+    for text in texts:
+        if not text:
+            continue
+        values = [float(v) for v in text.split()]
+        if len(values) % 3 == 0:
+            coords.extend(values[i:i + 3] for i in range(0, len(values), 3))
+    return np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+
+
+@pytest.mark.parametrize("texts", [
+    [],
+    [None, "", "  \n "],
+    ["1 2 3"],
+    ["1 2 3 4 5 6", "7\n8\t9", " 1e3 -2 +3.5 "],
+    ["1 2 3", "4 5", "6 7 8"],       # a list of 2 values is skipped
+    ["1 2 3 4", "5 6 7"],
+    ["1 nan 3", "4 5 6"],            # NaN in the data falls back to per-list parsing
+])
+def test_matches_float_loop(texts):
+    assert np.array_equal(parse_poslists(texts), _reference(texts), equal_nan=True)
+
+
+@pytest.mark.parametrize("texts", [["1 2 x"], ["1 2 3", "4,5,6"], ["1 2 3", "4 5 6 oops"]])
+def test_malformed_values_raise(texts):
+    with pytest.raises(ValueError):
+        parse_poslists(texts)
+
+
+def test_malformed_values_raise_when_numpy_only_warns(monkeypatch):
+    """numpy < 2.3 truncates at the first bad token with a DeprecationWarning instead of raising."""
+    real = np.fromstring
+
+    def truncating(text, dtype=float, sep=""):
+        good = []
+        for token in text.split():
+            try:
+                good.append(float(token))
+            except ValueError:
+                warnings.warn("string or file could not be read to its end due to unmatched data", DeprecationWarning)
+                break
+        return real(" ".join(map(repr, good)), dtype=dtype, sep=sep) if good else np.zeros(0, dtype=dtype)
+
+    monkeypatch.setattr(np, "fromstring", truncating)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        with pytest.raises(ValueError):
+            parse_poslists(["1 2 3 4 5 x"])
+        with pytest.raises(ValueError):
+            parse_poslists(["1 2 3", "4 5 x"])
+        assert parse_poslists(["1 2 3", "4 5 6"]).tolist() == [[1, 2, 3], [4, 5, 6]]
+
+
+def test_element_coords():
+    root = ET.fromstring(
+        '<r xmlns:gml="http://www.opengis.net/gml"><gml:posList>0 0 1 2 2 3</gml:posList>'
+        "<a><gml:posList>5 5 5</gml:posList></a></r>"
+    )
+    assert element_coords(root).tolist() == [[0, 0, 1], [2, 2, 3], [5, 5, 5]]
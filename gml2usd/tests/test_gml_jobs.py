@@ -0,0 +1,91 @@
+import os
+import threading
+
+import pytest
+
+from gml_jobs import DONE, FAILED, JobQueue, JobStore
+
+
+def _wait(queue):
+    done = threading.Event()
+    threading.Thread(target=lambda: (queue._queue.join(), done.set()), daemon=True).start()
+    assert done.wait(10), "jobs did not finish"
+
+
+@pytest.fixture
+def work_dir(tmp_path):
+    path = tmp_path / "work"
+    path.mkdir()
+    return path
+
+
+def _pipeline(work_dir, barrier=None):
+    """Writes its intermediates the way _run_gml_pipeline names them: gml_name + unique_suffix."""
+
+    def run(params, progress, unique_suffix):
+        progress("generate_gml")
+        base = params["gml_name"].split(".gml")[0]
+        gml_path = work_dir / f"{base}{unique_suffix}.gml"
+        gml_path.write_text(params["payload"])
+        if barrier is not None:
+            barrier.wait(5)  # both jobs have written their intermediates
+        progress("convert_usd")
+        usd_path = work_dir / f"{base}{unique_suffix}.usd"
+        usd_path.write_text(gml_path.read_text())
+        progress("export")
+        return str(usd_path), "application/octet-stream", f"{base}.usd", [str(usd_path), str(gml_path)]
+
+    return run
+
+
+def test_concurrent_jobs_with_same_name(tmp_path, work_dir):
+    barrier = threading.Barrier(2)
+    queue = JobQueue(
+        {"gml": (_pipeline(work_dir, barrier), ("generate_gml", "convert_usd", "export"))},
+        store=JobStore(str(tmp_path / "jobs")),
+        workers=2,
+    )
+    jobs = [queue.submit("gml", {"gml_name": "map_aodt_0.gml", "payload": payload}) for payload in ("first", "second")]
+    _wait(queue)
+
+    for job, payload in zip(jobs, ("first", "second")):
+        job = queue.store.get(job["job_id"])
+        assert job["state"] == DONE
+        assert [s["state"] for s in job["stages"]] == ["done"] * 3
+        assert job["result"]["download_name"] == "map_aodt_0.usd"
+        assert os.path.dirname(job["result"]["path"]) == queue.store.job_dir(job["job_id"])
+        with open(job["result"]["path"], encoding="utf-8") as f:
+            assert f.read() == payload
+    # intermediates were named after the job ids and removed afterwards
+    assert os.listdir(work_dir) == []
+
+
+def test_runner_gets_job_suffix(tmp_path):
+    suffixes = []
+
+    def run(params, progress, unique_suffix):
+        suffixes.append(unique_suffix)
+        path = tmp_path / f"out{unique_suffix}"
+        path.write_text("x")
+        return str(path), "text/plain", None, [str(path)]
+
+    queue = JobQueue({"gml": (run, ("export",))}, store=JobStore(str(tmp_path / "jobs")))
+    job = queue.submit("gml", {})
+    _wait(queue)
+    assert suffixes == [f"_{job['job_id']}"]
+    result = queue.store.get(job["job_id"])["result"]
+    assert result["download_name"] == f"out_{job['job_id']}"
+
+
+def test_failed_job_records_error(tmp_path):
+    def run(params, progress, unique_suffix):
+        progress("generate_gml")
+        raise RuntimeError("no buildings")
+
+    queue = JobQueue({"gml": (run, ("generate_gml", "export"))}, store=JobStore(str(tmp_path / "jobs")))
+    job = queue.submit("gml", {})
+    _wait(queue)
+    job = queue.store.get(job["job_id"])
+    assert job["state"] == FAILED
+    assert job["error"]["message"] == "no buildings"
+    assert [s["state"] for s in job["stages"]] == [FAILED, "skipped"]
@@ -0,0 +1,51 @@
+import os
+
+from gml_result_cache import ResultCache, file_versions, make_cache_key
+
+
+def _artifact(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=10_000)
+    source = _artifact(tmp_path, "a.zip", 100)
+    entry = cache.put("k1", source, "application/zip", "bundle.zip")
+    assert entry["size"] == 100 and os.path.basename(entry["path"]) == "bundle.zip"
+    assert cache.get("k1") == entry
+    assert cache.get("missing") is None
+
+
+def test_artifact_larger_than_the_cache_is_not_stored(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1000)
+    assert cache.put("big", _artifact(tmp_path, "big.zip", 1001), "application/zip", "big.zip") is None
+    assert cache.get("big") is None
+    assert not os.path.exists(os.path.join(cache.root, "big"))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=2500)
+    for key in ("a", "b"):
+        cache.put(key, _artifact(tmp_path, f"{key}.zip", 1000), "application/zip", f"{key}.zip")
+        # meta.json mtimes are the access times; keep them apart on coarse filesystems
+        meta = os.path.join(cache.root, key, "meta.json")
+        os.utime(meta, (os.path.getmtime(meta) - (10 if key == "a" else 5),) * 2)
+    cache.get("a")  # a is now the most recently used
+
+    entry = cache.put("c", _artifact(tmp_path, "c.zip", 1000), "application/zip", "c.zip")
+    assert entry is not None
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_cache_key_and_versions(tmp_path):
+    assert make_cache_key({"a": 1, "b": 2}) == make_cache_key({"b": 2, "a": 1})
+    assert make_cache_key({"a": 1}) != make_cache_key({"a": 2})
+
+    path = _artifact(tmp_path, "script.py", 10)
+    before = file_versions([path, str(tmp_path / "missing.py")])
+    assert [name for name, _, _ in before] == ["script.py"]
+    os.utime(path, ns=(0, 10**9))
+    assert file_versions([path]) != before
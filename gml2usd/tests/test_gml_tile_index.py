@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+
+import gml_tile_index
+from gml_tile_index import TileIndex, build_tile_index, get_tile_index, read_tile_envelopes
+
+
+def _random_boxes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lower = rng.uniform(0, 10000, size=(n, 2))
+    size = rng.uniform(1, 500, size=(n, 2))
+    return np.column_stack([lower, lower + size])
+
+
+def _brute_force(filenames, boxes, x_min, y_min, x_max, y_max):
+    hit = (boxes[:, 2] >= x_min) & (boxes[:, 0] <= x_max) & (boxes[:, 3] >= y_min) & (boxes[:, 1] <= y_max)
+    return [filenames[i] for i in np.flatnonzero(hit)]
+
+
+@pytest.mark.parametrize("n", [0, 1, 15, 16, 17, 1000])
+def test_query_matches_brute_force(n):
+    boxes = _random_boxes(n)
+    filenames = [f"tile_{i}.gml" for i in range(n)]
+    index = TileIndex.build(filenames, boxes, capacity=16)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        x, y = rng.uniform(-500, 10500, size=2)
+        w, h = rng.uniform(0, 2000, size=2)
+        assert index.query(x, y, x + w, y + h) == _brute_force(filenames, boxes, x, y, x + w, y + h)
+
+
+def test_save_load_round_trip(tmp_path):
+    boxes = _random_boxes(300)
+    filenames = [f"tile_{i}.gml" for i in range(300)]
+    index = TileIndex.build(filenames, boxes)
+    path = str(tmp_path / "index.npz")
+    index.save(path, source_mtime=12.5)
+
+    loaded, source_mtime = TileIndex.load(path)
+    assert source_mtime == 12.5
+    assert loaded.filenames == filenames
+    assert loaded.query(0, 0, 5000, 5000) == index.query(0, 0, 5000, 5000)
+
+
+def _write_csv(path, rows):
+    lines = ["Filename,LowerCorner,UpperCorner"] + [f"{name},{lower},{upper}" for name, lower, upper in rows]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_read_tile_envelopes_skips_invalid_rows(tmp_path):
+    csv_path = tmp_path / "boxes.csv"
+    _write_csv(csv_path, [("a.gml", "0 0", "10 10"), ("b.gml", "bad", "1 1"), (" ", "0 0", "1 1"), ("c.gml", "5 5 0", "20 30 9")])
+    filenames, boxes = read_tile_envelopes(str(csv_path))
+    assert filenames == ["a.gml", "c.gml"]
+    assert boxes.tolist() == [[0, 0, 10, 10], [5, 5, 20, 30]]
+
+
+def test_get_tile_index_rebuilds_when_csv_is_newer(tmp_path):
+    csv_path = tmp_path / "boxes.csv"
+    index_path = str(tmp_path / "index.npz")
+    _write_csv(csv_path, [("a.gml", "0 0", "10 10")])
+    build_tile_index(str(csv_path), index_path)
+    _write_csv(csv_path, [("a.gml", "0 0", "10 10"), ("b.gml", "20 20", "30 30")])
+    os.utime(csv_path, (os.path.getmtime(index_path) + 10,) * 2)
+
+    assert get_tile_index(str(csv_path), index_path).query(0, 0, 100, 100) == ["a.gml", "b.gml"]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    for path in (first / "gml" / "a.gml", first / "a.gml", first / "sub" / "b.gml", second / "b.gml", second / "c.gml"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x")
+    return [str(first), str(second)], str(tmp_path / "manifest.bin")
+
+
+def test_manifest_lookup_order(dataset):
+    base_dirs, manifest_path = dataset
+    paths = gml_tile_index.resolve_tile_paths(["a.gml", "b.gml", "c.gml", "d.gml"], base_dirs, manifest_path)
+    assert paths == [
+        os.path.join(base_dirs[0], "gml", "a.gml"),
+        os.path.join(base_dirs[0], "sub", "b.gml"),
+        os.path.join(base_dirs[1], "c.gml"),
+        None,
+    ]
+
+
+def test_manifest_staleness_is_checked_once_per_interval(dataset, monkeypatch):
+    base_dirs, manifest_path = dataset
+    monkeypatch.setattr(gml_tile_index, "MANIFEST_CHECK_INTERVAL", 3600.0)
+    assert gml_tile_index.resolve_tile_paths(["e.gml"], base_dirs, manifest_path) == [None]
+
+    new_file = os.path.join(base_dirs[1], "e.gml")
+    open(new_file, "w").close()
+    os.utime(base_dirs[1], (0, 12345))
+    # within the interval the directories are not stat'ed again
+    assert gml_tile_index.resolve_tile_paths(["e.gml"], base_dirs, manifest_path) == [None]
+
+    monkeypatch.setattr(gml_tile_index, "MANIFEST_CHECK_INTERVAL", 0.0)
+    assert gml_tile_index.resolve_tile_paths(["e.gml"], base_dirs, manifest_path) == [new_file]
+
+
+def test_replaced_manifest_is_unmapped(dataset):
+    base_dirs, manifest_path = dataset
+    old = gml_tile_index.get_path_manifest(base_dirs, manifest_path)
+    new = gml_tile_index.reload_path_manifest(base_dirs, manifest_path)
+    assert new is not old
+    assert old._buf.closed and not new._buf.closed
+    assert new.get("c.gml") == os.path.join(base_dirs[1], "c.gml")
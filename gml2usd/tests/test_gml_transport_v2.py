@@ -0,0 +1,60 @@
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from gml_transport_v2 import XML_NAMESPACE, write_pretty_element
+
+
+def _write(elem, uri_prefixes, compact=False):
+    """Serialize `elem` inside a root that declares `uri_prefixes`, as CityGMLWriter does."""
+    out = io.StringIO()
+    write_pretty_element(out, elem, uri_prefixes, level=1, compact=compact)
+    declarations = "".join(f' xmlns:{prefix}="{uri}"' for uri, prefix in uri_prefixes.items())
+    return f"<root{declarations}>{out.getvalue()}</root>"
+
+
+def _same_tree(a, b):
+    assert a.tag == b.tag
+    assert a.attrib == b.attrib
+    assert (a.text or "").strip() == (b.text or "").strip()
+    assert len(a) == len(b)
+    for x, y in zip(a, b):
+        _same_tree(x, y)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_xml_namespace_attribute(compact):
+    elem = ET.Element("{urn:G}name", {f"{{{XML_NAMESPACE}}}lang": "zh-TW"})
+    elem.text = "台北 & <新竹>"
+    text = _write(elem, {"urn:G": "gml"}, compact)
+
+    assert 'xml:lang="zh-TW"' in text
+    assert XML_NAMESPACE not in text
+    # expat rejects any prefix other than xml bound to the XML namespace
+    parsed = ET.fromstring(text)[0]
+    _same_tree(parsed, elem)
+
+
+def test_generated_prefix_does_not_shadow_outer_binding():
+    uri_prefixes = {"urn:A": "ns2", "urn:G": "gml"}
+    elem = ET.Element("{urn:G}member")
+    unknown = ET.SubElement(elem, "{urn:X}wrapper", {"{urn:Y}id": "1"})
+    inner = ET.SubElement(unknown, "{urn:A}inner")
+    inner.text = "value"
+    ET.SubElement(inner, "{urn:X}leaf")
+    text = _write(elem, uri_prefixes)
+
+    assert 'xmlns:ns2="urn:X"' not in text and 'xmlns:ns2="urn:Y"' not in text
+    parsed = ET.fromstring(text)[0]
+    _same_tree(parsed, elem)
+    assert parsed.find("{urn:X}wrapper/{urn:A}inner/{urn:X}leaf") is not None
+
+
+def test_known_prefixes_are_not_redeclared():
+    elem = ET.Element("{urn:G}member")
+    ET.SubElement(elem, "{urn:A}child", {"{urn:A}attr": "x", "plain": "y"})
+    text = _write(elem, {"urn:A": "bldg", "urn:G": "gml"})
+    assert text.count("xmlns:") == 2
+    assert '<bldg:child bldg:attr="x" plain="y"/>' in text
+    _same_tree(ET.fromstring(text)[0], elem)
@@ -0,0 +1,110 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from gml_zip_stream import ZipStream, iter_zip, member_compression, write_zip
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    """Bundle members of each compression kind, as (arcname, filepath) pairs."""
+    contents = {
+        "scene.gltf": b'{"asset": {"version": "2.0"}}' * 2000,
+        "scene.bin": os.urandom(3000) + bytes(50000),
+        "tile.glb": b"glTF" + os.urandom(4000),
+        "crate.usd": b"PXR-USDC" + os.urandom(1000),
+        "layer.usd": b"#usda 1.0\n" + b"def Xform \"World\" {}\n" * 500,
+        "empty.txt": b"",
+    }
+    files = []
+    for name, data in contents.items():
+        path = tmp_path / "src" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(data)
+        files.append((f"bundle/{name}", str(path)))
+    return files, contents
+
+
+def _check_archive(data, files, contents):
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == [arcname for arcname, _ in files]
+        for arcname, filepath in files:
+            name = os.path.basename(filepath)
+            assert zf.read(arcname) == contents[name]
+            assert zf.getinfo(arcname).compress_type == member_compression(filepath)
+
+
+def test_member_compression(bundle):
+    files, _ = bundle
+    kinds = {os.path.basename(path): member_compression(path) for _, path in files}
+    assert kinds["tile.glb"] == zipfile.ZIP_STORED
+    assert kinds["crate.usd"] == zipfile.ZIP_STORED
+    assert kinds["layer.usd"] == zipfile.ZIP_DEFLATED
+    assert kinds["scene.gltf"] == zipfile.ZIP_DEFLATED
+    assert kinds["scene.bin"] == zipfile.ZIP_DEFLATED
+
+
+def test_iter_zip_round_trip(bundle):
+    files, contents = bundle
+    # a small chunk size makes members span several yielded pieces
+    pieces = list(iter_zip(files, chunk_size=1024))
+    assert len(pieces) > len(files)
+    _check_archive(b"".join(pieces), files, contents)
+
+
+def test_write_zip_matches_stream(bundle, tmp_path):
+    files, contents = bundle
+    path = write_zip(str(tmp_path / "out" / "bundle.zip"), files)
+    data = open(path, "rb").read()
+    _check_archive(data, files, contents)
+    assert len(data) == len(b"".join(iter_zip(files)))
+
+
+def test_zip_stream_tee_and_complete(bundle, tmp_path):
+    files, contents = bundle
+    stream = ZipStream(files)
+    tee_path = stream.tee(str(tmp_path / "tee" / "bundle.zip"))
+    completed = []
+    stream.on_complete(completed.append)
+    stream.on_complete(lambda path: 1 / 0)  # a failing callback is only logged
+    stream.on_complete(lambda path: completed.append(open(path, "rb").read()))
+
+    data = b"".join(stream)
+    _check_archive(data, files, contents)
+    assert completed == [tee_path, data]
+
+    stream.close()
+    assert not os.path.exists(tee_path)
+
+
+def test_zip_stream_abandoned_skips_callbacks(bundle, tmp_path):
+    files, _ = bundle
+    stream = ZipStream(files)
+    tee_path = stream.tee(str(tmp_path / "bundle.zip"))
+    completed = []
+    stream.on_complete(completed.append)
+
+    iterator = iter(stream)
+    next(iterator)
+    iterator.close()
+    assert completed == []
+    stream.close()
+    assert not os.path.exists(tee_path)
+
+
+def test_zip_stream_close_removes_cleanup_paths(bundle, tmp_path):
+    files, contents = bundle
+    work_dir = tmp_path / "work"
+    (work_dir / "nested").mkdir(parents=True)
+    (work_dir / "nested" / "file").write_bytes(b"x")
+    loose = tmp_path / "loose.usd"
+    loose.write_bytes(b"x")
+    stream = ZipStream(files, cleanup=[str(work_dir), str(loose), str(tmp_path / "missing")])
+
+    _check_archive(b"".join(stream), files, contents)
+    assert work_dir.exists() and loose.exists()
+    stream.close()
+    assert not work_dir.exists() and not loose.exists()
@@ -0,0 +1,34 @@
+import numpy as np
+
+from material_defaults import default_material_map, default_material_tags
+
+
+def _row_loop(surface_tags):
+    """The masked assignment per table row that aodt_usd and utils used before."""
+    mapped = np.array(surface_tags, dtype=np.int32)
+    for st_id, st_name, default_material in default_material_map:
+        mapped[mapped == st_id] = default_material
+    return mapped
+
+
+def test_matches_row_loop_on_every_known_id():
+    ids = np.arange(len(default_material_map), dtype=np.int32)
+    assert np.array_equal(default_material_tags(ids), _row_loop(ids))
+
+
+def test_matches_row_loop_with_unknown_and_negative_ids():
+    tags = np.random.default_rng(0).integers(-5, 60, size=10000)
+    result = default_material_tags(tags)
+    assert result.dtype == np.int32
+    assert np.array_equal(result, _row_loop(tags))
+
+
+def test_empty_and_list_input():
+    assert default_material_tags([]).shape == (0,)
+    assert default_material_tags([6, 30, 99]).tolist() == _row_loop([6, 30, 99]).tolist()
+
+
+def test_input_is_not_modified():
+    tags = np.array([28, 30, -1], dtype=np.int32)
+    default_material_tags(tags)
+    assert tags.tolist() == [28, 30, -1]
@@ -0,0 +1,141 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from tileset_writer import TilesetWriter, box_mesh, cluster_simplify, enu_to_ecef
+
+
+def _loop_cluster(vertices, indices, cell):
+    """Vertex clustering written out per vertex and per triangle."""
+    clusters = {}
+    members = []
+    for v in vertices:
+        key = tuple(int(c) for c in np.floor(v / cell))
+        members.append(clusters.setdefault(key, len(clusters)))
+    sums = np.zeros((len(clusters), 3))
+    counts = np.zeros(len(clusters))
+    for v, c in zip(vertices, members):
+        sums[c] += v
+        counts[c] += 1
+    triangles = []
+    seen = set()
+    for a, b, c in np.asarray(indices).reshape(-1, 3):
+        t = (members[a], members[b], members[c])
+        if len(set(t)) < 3 or tuple(sorted(t)) in seen:
+            continue
+        seen.add(tuple(sorted(t)))
+        triangles.append(t)
+    return sums / counts[:, None], triangles
+
+
+def _sphere(n=24, radius=10.0):
+    """A closed UV sphere with consistent outward winding."""
+    theta, phi = np.meshgrid(np.linspace(0, np.pi, n), np.linspace(0, 2 * np.pi, n, endpoint=False), indexing="ij")
+    vertices = radius * np.stack(
+        [np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)], axis=-1
+    ).reshape(-1, 3)
+    grid = np.arange(n * n).reshape(n, n)
+    a, b = grid[:-1], np.roll(grid, -1, axis=1)[:-1]
+    c, d = grid[1:], np.roll(grid, -1, axis=1)[1:]
+    indices = np.stack([a, c, b, b, c, d], axis=-1).reshape(-1)
+    return vertices, indices
+
+
+@pytest.mark.parametrize("cell", [0.5, 2.0, 5.0])
+def test_cluster_simplify_matches_loop(cell):
+    vertices, indices = _sphere()
+    result_vertices, result_indices = cluster_simplify(vertices, indices, cell)
+    loop_vertices, loop_triangles = _loop_cluster(vertices, indices, cell)
+
+    result = {tuple(np.round(result_vertices[t], 9).ravel()) for t in result_indices.reshape(-1, 3)}
+    expected = {tuple(np.round(loop_vertices[list(t)], 9).ravel()) for t in loop_triangles}
+    assert result == expected
+    assert len(result_indices) == 3 * len(loop_triangles)
+
+
+def test_cluster_simplify_drops_degenerate_and_duplicate_triangles():
+    vertices, indices = _sphere()
+    result_vertices, result_indices = cluster_simplify(vertices, indices, 3.0)
+    triangles = result_indices.reshape(-1, 3)
+
+    assert result_indices.dtype == np.uint32
+    assert 0 < len(triangles) < len(indices) // 3
+    assert len(result_vertices) < len(vertices)
+    assert np.all((triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & (triangles[:, 0] != triangles[:, 2]))
+    assert len(np.unique(np.sort(triangles, axis=1), axis=0)) == len(triangles)
+    # every remaining vertex is used
+    assert set(np.unique(result_indices)) == set(range(len(result_vertices)))
+
+
+def test_cluster_simplify_fine_cell_keeps_mesh():
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]], dtype=np.float64)
+    indices = np.array([0, 1, 2, 1, 3, 2], dtype=np.uint32)
+    result_vertices, result_indices = cluster_simplify(vertices, indices, 0.01)
+    assert np.allclose(result_vertices[result_indices], vertices[indices])
+
+
+def test_cluster_simplify_empty_input():
+    result_vertices, result_indices = cluster_simplify(np.zeros((0, 3)), [], 1.0)
+    assert result_vertices.shape == (0, 3)
+    assert result_indices.shape == (0,) and result_indices.dtype == np.uint32
+
+
+def test_box_mesh_is_closed_and_faces_outward():
+    lowers = [[0, 0, 0], [10, 5, 0]]
+    uppers = [[2, 3, 4], [11, 9, 20]]
+    vertices, indices = box_mesh(lowers, uppers)
+    assert vertices.shape == (16, 3) and indices.shape == (72,)
+
+    for k, (lower, upper) in enumerate(zip(lowers, uppers)):
+        box = indices[36 * k:36 * (k + 1)].reshape(-1, 3)
+        assert np.all((box >= 8 * k) & (box < 8 * (k + 1)))
+        corners = vertices[8 * k:8 * (k + 1)]
+        assert np.allclose(corners.min(axis=0), lower) and np.allclose(corners.max(axis=0), upper)
+
+        triangles = vertices[box]
+        normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        outward = triangles.mean(axis=1) - (np.asarray(lower) + np.asarray(upper)) / 2
+        assert np.all(np.einsum("ij,ij->i", normals, outward) > 0)
+        # closed: every edge is used once in each direction
+        edges = {(a, b) for t in box for a, b in ((t[0], t[1]), (t[1], t[2]), (t[2], t[0]))}
+        assert len(edges) == 36 and all((b, a) in edges for a, b in edges)
+
+
+def test_enu_to_ecef_is_orthonormal():
+    matrix = np.array(enu_to_ecef(139.7, 35.7, 40.0)).reshape(4, 4).T
+    rotation = matrix[:3, :3]
+    assert np.allclose(rotation.T @ rotation, np.eye(3))
+    assert np.isclose(np.linalg.det(rotation), 1.0)
+    # up points away from the earth's centre
+    assert np.dot(rotation[:, 2], matrix[:3, 3]) > 0
+
+    equator = np.array(enu_to_ecef(0.0, 0.0)).reshape(4, 4).T
+    assert np.allclose(equator[:3, 3], [6378137.0, 0, 0])
+
+
+def test_tileset_writer(tmp_path):
+    writer = TilesetWriter(str(tmp_path / "tiles"), tile_size=100.0, lod_cell=3.0, origin=(139.7, 35.7, 0.0))
+    vertices, indices = _sphere()
+    for name, offset in (("a", [20, 20, 10]), ("b", [60, 40, 10]), ("c", [-150, 30, 10])):
+        writer.add_building(name, vertices + offset, indices, vertices.min(axis=0) + offset, vertices.max(axis=0) + offset)
+    writer.add_building("skipped", vertices, indices[:2], [0, 0, 0], [1, 1, 1])
+
+    written = writer.write()
+    assert all(os.path.exists(path) for path in written)
+    assert sorted(os.path.basename(p) for p in written[1:]) == sorted(
+        f"tile_{t}{suffix}.glb" for t in ("0_0", "m2_0") for suffix in ("", "_box", "_lod1")
+    )
+
+    with open(written[0], encoding="utf-8") as f:
+        tileset = json.load(f)
+    root = tileset["root"]
+    assert len(root["transform"]) == 16 and root["refine"] == "REPLACE"
+    assert len(root["children"]) == 2
+    box = root["children"][0]
+    lod1 = box["children"][0]
+    full = lod1["children"][0]
+    assert box["geometricError"] >= lod1["geometricError"] == 3.0 > full["geometricError"] == 0
+    assert full["content"]["uri"] == "tile_m2_0.glb"
+    assert tileset["geometricError"] >= root["geometricError"]
@@ -10,6 +10,8 @@ Notes:
 - GLB is a single binary file, convenient for HTTP response.
 - glTF (.gltf) is usually multiple files (.gltf + .bin + textures). For API usage,
   we package the whole output folder into a .zip.
+- `compression` ("none" / "quantize" / "meshopt", see gltf_compress.py) shrinks the
+  mesh buffers after usd2gltf has written them.
 """
 
 from __future__ import annotations
@@ -19,14 +21,15 @@ import os
 import zipfile
 from pathlib import Path
 import json
-import shutil
 import time
 import base64
 import mimetypes
 
-from pxr import Usd
+from pxr import Sdf, Usd
 from usd2gltf import converter
 
+from gltf_compress import compress_glb_file, compress_gltf_file
+
 logger = logging.getLogger(__name__)
 
 
@@ -75,45 +78,39 @@ def _normalize_gltf_bin_names(output_dir: Path, *, base_name: str) -> None:
     gltf_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
-def _remove_prims(stage: Usd.Stage, remove_paths: list[str]) -> None:
-    for prim_path in remove_paths:
-        prim = stage.GetPrimAtPath(prim_path)
-        if prim and prim.IsValid():
-            stage.RemovePrim(prim_path)
+def _exclusion_session_layer(remove_paths: list[str]) -> Sdf.Layer:
+    """Anonymous session layer holding `over <path> (active = false)` for each path.
+
+    Passed to Usd.Stage.Open, so the excluded subtrees are never composed; a path
+    missing from the stage only leaves an undefined over, which Traverse skips.
+    """
+    session = Sdf.Layer.CreateAnonymous("gltf_export_session")
+    with Sdf.ChangeBlock():
+        for prim_path in remove_paths:
+            Sdf.CreatePrimInLayer(session, prim_path).active = False
+    return session
 
 
 def _open_stage_for_conversion(
     input_usd: Path,
     *,
     remove_prim_paths: list[str] | None,
-) -> tuple[Usd.Stage, Path | None]:
+) -> Usd.Stage:
     """Open a stage for conversion.
 
-    If we need to remove prims, operate on a temporary copy to avoid mutating
-    the original USD on disk.
-
-    Returns (stage, temp_path_to_cleanup).
+    Prims to drop are deactivated in an in-memory session layer instead of
+    being removed from a temporary copy, so the USD (usda, usdc, or a root
+    layer with per-tile sublayers/payloads) is read in place and never
+    copied or re-saved.
     """
     remove_paths = list(remove_prim_paths) if remove_prim_paths is not None else list(DEFAULT_REMOVE_PRIM_PATHS)
-    if not remove_paths:
-        stage = Usd.Stage.Open(str(input_usd))
-        if stage is None:
-            raise RuntimeError(f"Failed to open USD stage: {input_usd}")
-        return stage, None
-
-    temp_path = input_usd.with_name(f"{input_usd.stem}.tmp_{int(time.time() * 1000)}{input_usd.suffix}")
-    shutil.copy2(str(input_usd), str(temp_path))
-
-    stage = Usd.Stage.Open(str(temp_path))
+    root_layer = Sdf.Layer.FindOrOpen(str(input_usd))
+    if root_layer is None:
+        raise RuntimeError(f"Failed to open USD stage: {input_usd}")
+    stage = Usd.Stage.Open(root_layer, _exclusion_session_layer(remove_paths))
     if stage is None:
-        try:
-            temp_path.unlink(missing_ok=True)
-        finally:
-            raise RuntimeError(f"Failed to open USD stage: {temp_path}")
-
-    _remove_prims(stage, remove_paths)
-    stage.GetRootLayer().Save()
-    return stage, temp_path
+        raise RuntimeError(f"Failed to open USD stage: {input_usd}")
+    return stage
 
 
 def usd_to_glb(
@@ -121,6 +118,7 @@ def usd_to_glb(
     output_glb: str,
     *,
     remove_prim_paths: list[str] | None = None,
+    compression: str = "none",
 ) -> str:
     """Convert a USD file to a single .glb file.
 
@@ -130,7 +128,7 @@ def usd_to_glb(
     output_path = Path(output_glb)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    stage, temp_path = _open_stage_for_conversion(input_path, remove_prim_paths=remove_prim_paths)
+    stage = _open_stage_for_conversion(input_path, remove_prim_paths=remove_prim_paths)
 
     factory = converter.Converter()
     factory.interpolation = "LINEAR"
@@ -138,12 +136,7 @@ def usd_to_glb(
 
     logger.info(f"usd2gltf: converting USD -> GLB: {input_path} -> {output_path}")
     factory.process(stage, str(output_path))
-
-    if temp_path is not None:
-        try:
-            temp_path.unlink(missing_ok=True)
-        except Exception:
-            pass
+    compress_glb_file(str(output_path), compression)
     return str(output_path)
 
 
@@ -153,6 +146,7 @@ def usd_to_gltf_dir(
     *,
     base_name: str | None = None,
     remove_prim_paths: list[str] | None = None,
+    compression: str = "none",
 ) -> list[str]:
     """Convert USD -> glTF in a directory.
 
@@ -165,7 +159,7 @@ def usd_to_gltf_dir(
     name = base_name or input_path.stem
     gltf_path = out_dir / f"{name}.gltf"
 
-    stage, temp_path = _open_stage_for_conversion(input_path, remove_prim_paths=remove_prim_paths)
+    stage = _open_stage_for_conversion(input_path, remove_prim_paths=remove_prim_paths)
 
     factory = converter.Converter()
     factory.interpolation = "LINEAR"
@@ -174,14 +168,9 @@ def usd_to_gltf_dir(
     logger.info(f"usd2gltf: converting USD -> glTF: {input_path} -> {gltf_path}")
     factory.process(stage, str(gltf_path))
 
-    if temp_path is not None:
-        try:
-            temp_path.unlink(missing_ok=True)
-        except Exception:
-            pass
-
     # Make the .bin name stable (<name>.bin) and update the .gltf to match.
     _normalize_gltf_bin_names(out_dir, base_name=name)
+    compress_gltf_file(str(gltf_path), compression)
 
     generated = [str(p) for p in out_dir.iterdir() if p.is_file()]
     return generated
@@ -193,6 +182,7 @@ def usd_to_gltf_zip(
     *,
     base_name: str | None = None,
     remove_prim_paths: list[str] | None = None,
+    compression: str = "none",
 ) -> str:
     """Convert USD -> glTF (.gltf + assets) and zip the outputs.
 
@@ -212,6 +202,7 @@ def usd_to_gltf_zip(
         str(out_dir),
         base_name=(base_name or input_path.stem),
         remove_prim_paths=remove_prim_paths,
+        compression=compression,
     )
 
     logger.info(f"Packing glTF outputs into zip: {output_zip_path}")
@@ -251,6 +242,7 @@ def usd_to_gltf_single_file(
     *,
     base_name: str | None = None,
     remove_prim_paths: list[str] | None = None,
+    compression: str = "none",
 ) -> str:
     """Convert USD -> a single-file .gltf by embedding external assets as data URIs.
 
@@ -272,6 +264,7 @@ def usd_to_gltf_single_file(
             str(tmp_dir),
             base_name=name,
             remove_prim_paths=remove_prim_paths,
+            compression=compression,
         )
 
         gltf_path = tmp_dir / f"{name}.gltf"